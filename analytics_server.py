@@ -0,0 +1,194 @@
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+import pandas as pd
+from colorama import init, Fore
+from portfolio_simulator import simulate_trading
+from volatility_calculator import align_returns, calculate_returns, compute_average_volatilities, get_spans_from_args, get_symbols_from_args
+from utils.alignment import align_series
+from utils.data_reader import filter_time_range
+from utils.frame_store import FrameStore
+
+# Initialize colorama
+init(autoreset=True)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Serve volatility and backtest queries over local HTTP from data kept in memory')
+    parser.add_argument('--data_folder', type=str, default='data', help='Folder containing CSV files')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on (default: 127.0.0.1, local connections only)')
+    parser.add_argument('--port', type=int, default=8050, help='Port to listen on (default: 8050)')
+    parser.add_argument('--cache_dir', type=str, default=None, help='Folder for the parsed data cache (default: <data_folder>/.cache)')
+    parser.add_argument('--no_cache', action='store_true', help='Always parse the CSV files instead of using the data cache')
+    parser.add_argument('--preload', type=str, default=None, help='Comma-separated list of assets to load before serving the first request')
+    args = parser.parse_args()
+    return args
+
+def require_param(params, name):
+    if name not in params:
+        raise ValueError(f"Missing parameter '{name}'.")
+    return params[name]
+
+def handle_volatility(store, params):
+    # Same averages as volatility_calculator.py over the trailing observation window that ends
+    # at the earliest of the assets' latest timestamps
+    symbols = list(dict.fromkeys(get_symbols_from_args(require_param(params, 'assets'))))
+    spans = get_spans_from_args(params.get('span', '20'))
+    observation_window = pd.Timedelta(minutes=int(params.get('observation_window_minutes', 525600)))
+    timestamp_granularity = params.get('timestamp_granularity', '1min')
+
+    frames = {symbol: store.get(symbol) for symbol in symbols}
+    frames = {symbol: data for symbol, data in frames.items() if not data.empty}
+    if not frames:
+        raise ValueError("No data available.")
+    end_time = min(data.index[-1] for data in frames.values())
+    start_time = end_time - observation_window
+
+    all_returns = {}
+    for symbol, data in frames.items():
+        data = filter_time_range(data, start_time, end_time)
+        if data.empty:
+            continue
+        # Resampling returns a new frame, so the resident one is left untouched
+        data = calculate_returns(data[['close']].resample(timestamp_granularity).last())
+        all_returns[symbol] = data['returns']
+    if not all_returns:
+        raise ValueError("No data within the observation window.")
+
+    returns_df, within_range = align_returns(all_returns)
+    returns_df, asset_volatilities, portfolio_volatilities = compute_average_volatilities(returns_df, within_range, spans)
+    if returns_df.empty:
+        raise ValueError("No overlapping timestamps across assets.")
+    volatilities = {}
+    for span_position, span in enumerate(spans):
+        span_volatilities = dict(zip(all_returns, asset_volatilities[span_position]))
+        span_volatilities['Portfolio'] = portfolio_volatilities[span_position]
+        volatilities[str(span)] = span_volatilities
+    return {
+        'start': str(start_time),
+        'end': str(end_time),
+        'assets': list(all_returns),
+        'volatilities': volatilities
+    }
+
+def run_simulation(store, params):
+    # One run of portfolio_simulator.simulate_trading; without rebalance_period the portfolio
+    # is bought once and held. Returns the portfolio history and a summary of the run.
+    symbols = list(dict.fromkeys(get_symbols_from_args(require_param(params, 'assets'))))
+    start_date = pd.to_datetime(require_param(params, 'start_date'))
+    end_date = pd.to_datetime(require_param(params, 'end_date'))
+    rebalance_period = params.get('rebalance_period')
+    trading_fee = float(params.get('trading_fee', 0.001))
+    initial_capital = float(params.get('initial_capital', 100000))
+    timestamp_granularity = params.get('timestamp_granularity', '1min')
+    engine = params.get('engine', 'vectorized')
+
+    price_data = {}
+    for symbol in symbols:
+        data = store.get(symbol)
+        if data.empty or data.index[0] > start_date or data.index[-1] < end_date:
+            raise ValueError(f"Data for {symbol} does not fully cover the simulation period.")
+        data = filter_time_range(data, start_date, end_date)
+        price_data[symbol] = data['close'].resample(timestamp_granularity).last().ffill()
+    price_df = align_series(price_data, how='inner')
+    if price_df.empty:
+        raise ValueError("No overlapping timestamps across assets.")
+
+    portfolio_df, initial_val, final_val, total_ret, trade_counts, total_fees = simulate_trading(
+        price_df=price_df,
+        symbols=symbols,
+        rebalance_period=rebalance_period,
+        trading_fee=trading_fee,
+        initial_capital=initial_capital,
+        rebalance=rebalance_period is not None,
+        verbose=False,
+        engine=engine
+    )
+    return portfolio_df, {
+        'Simulation Type': f"Rebalance {rebalance_period}" if rebalance_period is not None else "No Rebalancing",
+        'Initial Value': initial_val,
+        'Final Value': final_val,
+        'Total Return (%)': total_ret,
+        'Total Trades': sum([sum(tc.values()) for tc in trade_counts.values()]),
+        'Trade Counts': trade_counts,
+        'Total Fees Paid': total_fees
+    }
+
+def handle_simulate(store, params):
+    _, summary = run_simulation(store, params)
+    return summary
+
+def handle_symbols(store, params):
+    return {'symbols': store.describe(), 'loads': store.loads}
+
+ROUTES = {
+    '/volatility': handle_volatility,
+    '/simulate': handle_simulate,
+    '/symbols': handle_symbols
+}
+
+class AnalyticsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        handler = ROUTES.get(url.path)
+        if handler is None:
+            self.send_json(404, {'error': f"Unknown endpoint '{url.path}'. Use one of: {', '.join(ROUTES)}"})
+            return
+        # Repeated query parameters keep their last value
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        started = time.perf_counter()
+        try:
+            result = handler(self.server.store, params)
+        except FileNotFoundError as e:
+            self.send_json(404, {'error': f"No data file: {e.filename}"})
+            return
+        except (KeyError, ValueError, TypeError) as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            self.send_json(500, {'error': f"{type(e).__name__}: {e}"})
+            return
+        result['elapsed_ms'] = (time.perf_counter() - started) * 1000
+        self.send_json(200, result)
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+class AnalyticsServer(ThreadingMixIn, HTTPServer):
+    # One thread per request; the frames are shared through the store
+    daemon_threads = True
+
+    def __init__(self, address, store):
+        super().__init__(address, AnalyticsRequestHandler)
+        self.store = store
+
+def main():
+    args = parse_arguments()
+    # Only the close prices are needed by the volatility and simulation handlers
+    store = FrameStore(args.data_folder, cache_dir=args.cache_dir, use_cache=not args.no_cache, columns=['close'])
+    if args.preload:
+        for symbol in get_symbols_from_args(args.preload):
+            try:
+                store.get(symbol)
+                print(Fore.GREEN + f"Loaded {symbol}.")
+            except Exception as e:
+                print(Fore.RED + f"Could not load {symbol}: {e}")
+
+    server = AnalyticsServer((args.host, args.port), store)
+    print(Fore.CYAN + f"Serving on http://{args.host}:{server.server_port} (endpoints: {', '.join(ROUTES)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down.")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.pool import ThreadPool
+import pandas as pd
+from colorama import init, Fore
+from analytics_server import handle_volatility, require_param, run_simulation
+from volatility_calculator import get_symbols_from_args
+from utils.chunked_reader import read_time_bounds
+from utils.data_reader import read_historical_data
+from utils.downsampling import downsample_series
+
+try:
+    import yaml
+except ImportError:
+    # PyYAML is optional; only YAML manifests need it
+    yaml = None
+
+# Initialize colorama
+init(autoreset=True)
+
+JOB_TYPES = ('volatility', 'simulate')
+# Fields whose lists are part of a single job rather than one job per value
+LIST_FIELDS = {'assets', 'span'}
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Run a manifest of volatility and backtest jobs, loading each symbol once')
+    parser.add_argument('--manifest', type=str, required=True, help='JSON or YAML file listing the jobs')
+    parser.add_argument('--output', type=str, required=True, help='JSON file for the results of every job')
+    parser.add_argument('--data_folder', type=str, default=None, help="Folder containing CSV files (default: the manifest's data_folder, else data)")
+    parser.add_argument('--cache_dir', type=str, default=None, help='Folder for the parsed data cache (default: <data_folder>/.cache)')
+    parser.add_argument('--no_cache', action='store_true', help='Always parse the CSV files instead of using the data cache')
+    parser.add_argument('--workers', type=int, default=None, help='Number of parallel jobs (default: number of CPUs)')
+    parser.add_argument('--executor', type=str, default='process', choices=['thread', 'process'], help='Pool used to run the jobs (default: process)')
+    args = parser.parse_args()
+    return args
+
+def read_manifest(manifest_path):
+    with open(manifest_path, 'r') as f:
+        if manifest_path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ImportError("PyYAML is required for YAML manifests. Install it or use a JSON manifest.")
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('jobs'), list):
+        raise ValueError("The manifest must be a mapping with a 'jobs' list.")
+    return manifest
+
+def expand_jobs(manifest):
+    # One task per job and per combination of its list-valued fields. Defaults of the manifest
+    # apply to every job; assets and spans may be given as lists or comma-separated strings.
+    tasks = []
+    for position, job in enumerate(manifest['jobs']):
+        job = dict(manifest.get('defaults', {}), **job)
+        job_type = job.pop('type', None)
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Job {position} has unknown type '{job_type}'. Use one of: {', '.join(JOB_TYPES)}")
+        name = job.pop('name', f"{job_type}_{position}")
+        for field in LIST_FIELDS:
+            if isinstance(job.get(field), list):
+                job[field] = ','.join(str(value) for value in job[field])
+        swept = [field for field, value in job.items() if isinstance(value, list)]
+        for values in itertools.product(*(job[field] for field in swept)):
+            params = dict(job, **dict(zip(swept, values)))
+            tasks.append({'job': name, 'type': job_type, 'params': params})
+    return tasks
+
+def get_task_range(task, time_bounds):
+    # Time range each asset of a task needs; time_bounds(symbol) gives (first, last) timestamps
+    params = task['params']
+    symbols = list(dict.fromkeys(get_symbols_from_args(require_param(params, 'assets'))))
+    if task['type'] == 'simulate':
+        start = pd.to_datetime(require_param(params, 'start_date'))
+        end = pd.to_datetime(require_param(params, 'end_date'))
+    else:
+        # The observation window ends at the earliest of the assets' latest timestamps
+        latest = [time_bounds(symbol)[1] for symbol in symbols]
+        latest = [timestamp for timestamp in latest if timestamp is not None]
+        if not latest:
+            raise ValueError("No data available.")
+        end = min(latest)
+        start = end - pd.Timedelta(minutes=int(params.get('observation_window_minutes', 525600)))
+    return {symbol: (start, end) for symbol in symbols}
+
+def plan_loads(tasks, data_folder):
+    # Merge the ranges of every task into one (start, end) load per symbol. Tasks whose
+    # parameters are invalid get an 'error' and are left out of the plan.
+    bounds = {}
+
+    def time_bounds(symbol):
+        if symbol not in bounds:
+            try:
+                bounds[symbol] = read_time_bounds(symbol, data_folder)
+            except Exception:
+                # The load reports the missing or unreadable file
+                bounds[symbol] = (None, None)
+        return bounds[symbol]
+
+    plan = {}
+    for task in tasks:
+        try:
+            task_ranges = get_task_range(task, time_bounds)
+        except Exception as e:
+            task['error'] = str(e)
+            continue
+        for symbol, (start, end) in task_ranges.items():
+            if symbol in plan:
+                start = min(start, plan[symbol][0])
+                end = max(end, plan[symbol][1])
+            plan[symbol] = (start, end)
+    return plan
+
+def load_planned_data(plan, data_folder, use_cache=True, cache_dir=None, workers=None):
+    # Read every planned symbol once, concurrently; failed reads map to None
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            symbol: pool.submit(
+                read_historical_data, symbol, data_folder, start=start, end=end,
+                use_cache=use_cache, cache_dir=cache_dir, columns=['close']
+            )
+            for symbol, (start, end) in plan.items()
+        }
+        return {symbol: future.result() for symbol, future in futures.items()}
+
+class LoadedFrames:
+    # The store interface of the analytics server handlers over frames loaded up front
+    def __init__(self, frames):
+        self.frames = frames
+
+    def get(self, symbol):
+        data = self.frames.get(symbol)
+        if data is None:
+            raise ValueError(f"Could not read data for {symbol}.")
+        return data
+
+def save_portfolio_plot(portfolio_df, title, output_path):
+    # Matplotlib is only imported by the jobs that ask for a plot
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(14, 7))
+    values = downsample_series(portfolio_df['total_value'])
+    ax.plot(values.index, values)
+    ax.set_title(title)
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Value ($)')
+    ax.grid(True)
+    fig.tight_layout()
+    fig.savefig(output_path)
+    plt.close(fig)
+
+# Frames shared by the tasks of a worker, installed once per worker
+batch_frames = None
+
+def init_batch_worker(frames):
+    global batch_frames
+    batch_frames = LoadedFrames(frames)
+
+def run_batch_task(task):
+    started = time.perf_counter()
+    record = dict(task)
+    try:
+        if task['type'] == 'volatility':
+            record['result'] = handle_volatility(batch_frames, task['params'])
+        else:
+            portfolio_df, record['result'] = run_simulation(batch_frames, task['params'])
+            if task['params'].get('plot'):
+                save_portfolio_plot(portfolio_df, f"{task['job']}: {record['result']['Simulation Type']}", task['params']['plot'])
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+    record['elapsed_ms'] = (time.perf_counter() - started) * 1000
+    return record
+
+def run_batch(tasks, frames, workers=None, executor='process'):
+    # Run the tasks in a pool whose workers share the loaded frames; with processes, the
+    # frames are inherited or sent once per worker rather than once per task
+    if executor == 'thread':
+        pool_class = ThreadPool
+    elif executor == 'process':
+        pool_class = multiprocessing.Pool
+    else:
+        raise ValueError(f"Unknown executor '{executor}'. Use 'thread' or 'process'.")
+    if workers == 1 or len(tasks) <= 1:
+        init_batch_worker(frames)
+        return [run_batch_task(task) for task in tasks]
+    with pool_class(processes=workers, initializer=init_batch_worker, initargs=(frames,)) as pool:
+        chunksize = max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))
+        return pool.map(run_batch_task, tasks, chunksize=chunksize)
+
+def main():
+    args = parse_arguments()
+    try:
+        manifest = read_manifest(args.manifest)
+        tasks = expand_jobs(manifest)
+    except Exception as e:
+        print(Fore.RED + f"Could not read the manifest {args.manifest}: {e}")
+        exit()
+    data_folder = args.data_folder or manifest.get('data_folder', 'data')
+    started = time.perf_counter()
+
+    plan = plan_loads(tasks, data_folder)
+    print(Fore.CYAN + f"{len(tasks)} tasks from {len(manifest['jobs'])} jobs need {len(plan)} symbol loads.")
+    frames = load_planned_data(plan, data_folder, use_cache=not args.no_cache, cache_dir=args.cache_dir, workers=args.workers)
+    loaded_seconds = time.perf_counter() - started
+
+    runnable = [task for task in tasks if 'error' not in task]
+    results = iter(run_batch(runnable, frames, workers=args.workers, executor=args.executor))
+    # Keep the manifest order, with planning errors in place
+    records = [task if 'error' in task else next(results) for task in tasks]
+    failed = sum('error' in record for record in records)
+
+    output = {
+        'manifest': os.path.abspath(args.manifest),
+        'data_folder': data_folder,
+        'loads': {symbol: [str(start), str(end)] for symbol, (start, end) in plan.items()},
+        'load_seconds': loaded_seconds,
+        'total_seconds': time.perf_counter() - started,
+        'results': records
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    color = Fore.YELLOW if failed else Fore.GREEN
+    print(color + f"Ran {len(tasks)} tasks ({failed} failed) in {output['total_seconds']:.2f} s; results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
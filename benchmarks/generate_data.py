@@ -0,0 +1,73 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+MINUTES_PER_YEAR = 525600
+URL_HEADER = 'https://www.CryptoDataDownload.com'
+
+def get_symbol_names(n_symbols):
+    # File names (without .csv) of the generated symbols, in the CryptoDataDownload style
+    return [f"Binance_SYN{position:02d}USDT_minute" for position in range(n_symbols)]
+
+def generate_minute_bars(position, years, gap_rate, seed, start):
+    # Random-walk OHLCV minute bars for one symbol. The generator is seeded from (seed, position)
+    # so each symbol is reproducible on its own, whatever the number of symbols.
+    rng = np.random.default_rng([seed, position])
+    n_minutes = int(round(years * MINUTES_PER_YEAR))
+    timestamps = pd.date_range(start, periods=n_minutes, freq='1min')
+    # Drop a random fraction of the bars to mimic exchange outages
+    timestamps = timestamps[rng.random(n_minutes) >= gap_rate]
+    n_rows = len(timestamps)
+    close = 100.0 * (position + 1) * np.exp(np.cumsum(rng.normal(0.0, 0.001, n_rows)))
+    open_ = np.concatenate([close[:1], close[:-1]])
+    high = np.maximum(open_, close) * (1.0 + rng.random(n_rows) * 0.002)
+    low = np.minimum(open_, close) * (1.0 - rng.random(n_rows) * 0.002)
+    volume = rng.random(n_rows) * 10.0
+    symbol = f"SYN{position:02d}/USDT"
+    return pd.DataFrame({
+        'Unix': np.asarray((timestamps - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1), dtype=np.int64),
+        'Date': timestamps.strftime('%Y-%m-%d %H:%M:%S'),
+        'Symbol': symbol,
+        'Open': open_.round(2),
+        'High': high.round(2),
+        'Low': low.round(2),
+        'Close': close.round(2),
+        'Volume BTC': volume.round(5),
+        'Volume USDT': (volume * close).round(4),
+        'tradecount': rng.integers(1, 2000, n_rows)
+    })
+
+def write_cryptodatadownload_csv(data, file_path):
+    # Same layout as the CryptoDataDownload files: a URL line, then the newest row first
+    with open(file_path, 'w') as f:
+        f.write(URL_HEADER + '\n')
+        data.iloc[::-1].to_csv(f, index=False)
+
+def generate_dataset(data_folder, n_symbols=3, years=1.0, gap_rate=0.001, seed=0, start='2020-01-01'):
+    # Write one CSV per symbol and return the symbol names; existing files are overwritten
+    os.makedirs(data_folder, exist_ok=True)
+    symbols = get_symbol_names(n_symbols)
+    for position, symbol in enumerate(symbols):
+        data = generate_minute_bars(position, years, gap_rate, seed, start)
+        write_cryptodatadownload_csv(data, os.path.join(data_folder, f"{symbol}.csv"))
+    return symbols
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Generate synthetic CryptoDataDownload-style minute data')
+    parser.add_argument('--data_folder', type=str, required=True, help='Folder to write the CSV files to')
+    parser.add_argument('--symbols', type=int, default=3, help='Number of symbols (default: 3)')
+    parser.add_argument('--years', type=float, default=1.0, help='Years of 1-minute bars per symbol (default: 1)')
+    parser.add_argument('--gap_rate', type=float, default=0.001, help='Fraction of missing bars (default: 0.001)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--start', type=str, default='2020-01-01', help='First timestamp (default: 2020-01-01)')
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = parse_arguments()
+    symbols = generate_dataset(args.data_folder, args.symbols, args.years, args.gap_rate, args.seed, args.start)
+    print(f"Wrote {len(symbols)} files to {args.data_folder}: {', '.join(symbols)}")
+
+if __name__ == "__main__":
+    main()
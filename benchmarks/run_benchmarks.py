@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from benchmarks.generate_data import generate_dataset
+from find_candles import calculate_differences, find_red_candles, get_top_candles
+from portfolio_simulator import simulate_trading
+from utils.data_reader import read_historical_data
+from volatility_calculator import calculate_exponentially_weighted_volatility, calculate_returns
+
+RESULTS_VERSION = 1
+# A benchmark whose median time grows by more than this factor is reported as a regression
+DEFAULT_REGRESSION_THRESHOLD = 1.10
+
+def time_call(function, repeat):
+    # Wall-clock seconds of repeat calls; the first call's result is returned for later stages
+    times = []
+    result = None
+    for iteration in range(repeat):
+        started = time.perf_counter()
+        output = function()
+        times.append(time.perf_counter() - started)
+        if iteration == 0:
+            result = output
+    return times, result
+
+def summarize_times(name, times, **details):
+    return dict({
+        'name': name,
+        'repeat': len(times),
+        'times': times,
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times)
+    }, **details)
+
+def get_revision():
+    # Git commit of the benchmarked tree, or None outside a git checkout
+    try:
+        output = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.decode('utf-8').strip()
+
+def get_environment():
+    return {
+        'revision': get_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__
+    }
+
+def run_benchmarks(data_folder, symbols, repeat=5, span=20, timestamp_granularity='1min', rebalance_period='1D', top_n=100, loop_rows=20000):
+    results = []
+    cache_dir = tempfile.mkdtemp(prefix='benchmark-cache-')
+    try:
+        times, frames = time_call(lambda: [read_historical_data(symbol, data_folder, use_cache=False) for symbol in symbols], repeat)
+        results.append(summarize_times('read_historical_data_csv', times, rows=sum(len(data) for data in frames)))
+
+        # Populate the cache once, then time warm loads only
+        for symbol in symbols:
+            read_historical_data(symbol, data_folder, cache_dir=cache_dir)
+        times, _ = time_call(lambda: [read_historical_data(symbol, data_folder, cache_dir=cache_dir) for symbol in symbols], repeat)
+        results.append(summarize_times('read_historical_data_cached', times))
+
+        times, resampled = time_call(lambda: [data.resample(timestamp_granularity).last() for data in frames], repeat)
+        results.append(summarize_times('resample', times, rows=sum(len(data) for data in resampled)))
+
+        returns = [calculate_returns(data.copy())['returns'] for data in resampled]
+        times, _ = time_call(lambda: [calculate_exponentially_weighted_volatility(series, span) for series in returns], repeat)
+        results.append(summarize_times('calculate_exponentially_weighted_volatility', times, span=span))
+
+        price_df = pd.DataFrame({symbol: data['close'] for symbol, data in zip(symbols, resampled)}).ffill().dropna()
+        times, _ = time_call(lambda: simulate_trading(
+            price_df, symbols, rebalance_period, 0.001, 100000, rebalance=True, verbose=False, engine='vectorized'
+        ), repeat)
+        results.append(summarize_times('simulate_trading_vectorized', times, rows=len(price_df)))
+
+        # The loop engine is timed on the first rows only to keep the suite short
+        loop_price_df = price_df.iloc[:loop_rows]
+        times, _ = time_call(lambda: simulate_trading(
+            loop_price_df, symbols, rebalance_period, 0.001, 100000, rebalance=True, verbose=False, engine='loop'
+        ), repeat)
+        results.append(summarize_times('simulate_trading_loop', times, rows=len(loop_price_df)))
+
+        def find_top_candles():
+            for data in frames:
+                red_candles = calculate_differences(find_red_candles(data))
+                get_top_candles(red_candles, top_n)
+        times, _ = time_call(find_top_candles, repeat)
+        results.append(summarize_times('find_red_candles_top_n', times, top_n=top_n))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
+
+def compare_results(results, baseline, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    # Ratio of the current to the baseline median time for every benchmark both runs contain
+    baseline_medians = {result['name']: result['median'] for result in baseline['results']}
+    comparison = []
+    for result in results:
+        if result['name'] not in baseline_medians:
+            continue
+        ratio = result['median'] / baseline_medians[result['name']]
+        comparison.append({'name': result['name'], 'ratio': ratio, 'regression': ratio > threshold})
+    return comparison
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Time the data loading and analysis functions on synthetic minute data')
+    parser.add_argument('--data_folder', type=str, default=None, help='Folder with previously generated data (default: generate into a temporary folder)')
+    parser.add_argument('--symbols', type=int, default=3, help='Number of generated symbols (default: 3)')
+    parser.add_argument('--years', type=float, default=1.0, help='Years of 1-minute bars per generated symbol (default: 1)')
+    parser.add_argument('--gap_rate', type=float, default=0.001, help='Fraction of missing bars in the generated data (default: 0.001)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the data generator (default: 0)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per benchmark (default: 5)')
+    parser.add_argument('--span', type=int, default=20, help='EWM span (default: 20)')
+    parser.add_argument('--loop_rows', type=int, default=20000, help='Rows used for the loop simulation engine (default: 20000)')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='JSON results file (default: benchmark_results.json)')
+    parser.add_argument('--compare', type=str, default=None, help='Earlier JSON results file to compare the median times against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD, help='Slowdown ratio reported as a regression (default: 1.10)')
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = parse_arguments()
+    config = {'symbols': args.symbols, 'years': args.years, 'gap_rate': args.gap_rate, 'seed': args.seed, 'repeat': args.repeat, 'span': args.span, 'loop_rows': args.loop_rows}
+    data_folder = args.data_folder
+    generated_folder = None
+    if data_folder is None:
+        generated_folder = tempfile.mkdtemp(prefix='benchmark-data-')
+        data_folder = generated_folder
+        print(f"Generating {args.symbols} symbols x {args.years} years of minute data...")
+        generate_dataset(data_folder, args.symbols, args.years, args.gap_rate, args.seed)
+    symbols = sorted(os.path.splitext(name)[0] for name in os.listdir(data_folder) if name.endswith('.csv'))[:args.symbols]
+    try:
+        results = run_benchmarks(data_folder, symbols, repeat=args.repeat, span=args.span, loop_rows=args.loop_rows)
+    finally:
+        if generated_folder is not None:
+            shutil.rmtree(generated_folder, ignore_errors=True)
+
+    report = {'version': RESULTS_VERSION, 'environment': get_environment(), 'config': config, 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for result in results:
+        print(f"{result['name']:<45} median {result['median'] * 1000:10.2f} ms   min {result['min'] * 1000:10.2f} ms")
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare} (revision {baseline['environment'].get('revision')}):")
+        for comparison in compare_results(results, baseline, args.threshold):
+            flag = '  REGRESSION' if comparison['regression'] else ''
+            print(f"{comparison['name']:<45} x{comparison['ratio']:.2f}{flag}")
+
+if __name__ == "__main__":
+    main()
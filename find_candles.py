@@ -1,11 +1,18 @@
 #!/usr/bin/env python3
 
 import pandas as pd
+import numpy as np
 import argparse
+import heapq
 import sys
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from utils.chunked_reader import iter_historical_data
+from utils.candle_index import OHLC_COLUMNS, compute_candle_features, compute_red_candle_features, load_candle_index, query_candle_index, select_candle_features, update_candle_index
 from utils.data_reader import read_historical_data
-import mplfinance as mpf
+from utils.downsampling import DEFAULT_PLOT_POINTS
+from utils.profiling import create_profiler
 
 def find_red_candles(data):
     # Filter red candles (close < open)
@@ -32,7 +39,112 @@ def get_top_candles(red_candles, top_n):
     top_high_low_diff = red_candles.nlargest(top_n, 'high_low_diff')
     return top_close_low_diff, top_high_low_diff
 
-def plot_candles(top_candles, diff_type, symbol):
+# Ranking keys of the two top lists, as absolute differences or percentages
+RANK_KEYS = {
+    'diff': ('close_low_diff', 'high_low_diff'),
+    'pct': ('close_low_pct', 'high_low_pct')
+}
+
+def push_top_candles(heaps, symbol, features, top_n, rank_keys):
+    # Push the red candles of one chunk, given as the features of compute_red_candle_features,
+    # into bounded min-heaps of (value, -timestamp, symbol, o, h, l, c). Only the chunk's own
+    # top_n candidates per key are considered, so each chunk costs O(rows + top_n log top_n)
+    # and nothing larger than the heaps is kept between chunks.
+    if not len(features['timestamps']):
+        return
+    # Nanosecond timestamps, whatever the resolution of the index
+    timestamps = features['timestamps'].astype('datetime64[ns]').view(np.int64)
+    for key in rank_keys:
+        ranked = features[key]
+        candidates = np.flatnonzero(~np.isnan(ranked))
+        if len(candidates) > top_n:
+            values = ranked[candidates]
+            threshold = np.partition(values, -top_n)[-top_n]
+            above = candidates[values > threshold]
+            # Candles tied at the threshold are kept earliest first, as the heap orders them, so
+            # the result does not depend on how the rows are split into chunks
+            ties = candidates[values == threshold]
+            ties = ties[np.argsort(timestamps[ties], kind='stable')[:top_n - len(above)]]
+            candidates = np.concatenate([above, ties])
+        heap = heaps[key]
+        for position in candidates:
+            position = int(position)
+            # Equal values rank the earliest candle first, like DataFrame.nlargest on one symbol
+            entry = (float(ranked[position]), -int(timestamps[position]), symbol) + tuple(
+                float(features[column][position]) for column in OHLC_COLUMNS
+            )
+            if len(heap) < top_n:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heappushpop(heap, entry)
+
+def scan_symbol_top_candles(symbol, data_folder, top_n, rank_keys, chunksize=None, use_cache=True, cache_dir=None, start=None, end=None, thresholds=None, use_index=False):
+    # Top red candles of one symbol with start <= timestamp <= end whose features are at least
+    # the {feature: minimum} thresholds, as {key: heap}. With chunksize the file is streamed, so
+    # memory stays bounded by the chunk size and top_n whatever the file size. With use_index
+    # the candles come from the persisted red-candle index, which is built or updated first.
+    heaps = {key: [] for key in rank_keys}
+    try:
+        if use_index:
+            index_dir, _ = update_candle_index(symbol, data_folder, cache_dir=cache_dir, use_cache=use_cache)
+            features = select_candle_features(load_candle_index(index_dir, start=start, end=end), thresholds)
+            push_top_candles(heaps, symbol, features, top_n, rank_keys)
+        elif chunksize:
+            for chunk in iter_historical_data(symbol, data_folder, chunksize=chunksize, start=start, end=end):
+                features = select_candle_features(compute_red_candle_features(chunk), thresholds)
+                push_top_candles(heaps, symbol, features, top_n, rank_keys)
+        else:
+            data = read_historical_data(symbol, data_folder, start=start, end=end, use_cache=use_cache, cache_dir=cache_dir, columns=OHLC_COLUMNS)
+            if data is not None:
+                features = select_candle_features(compute_red_candle_features(data), thresholds)
+                push_top_candles(heaps, symbol, features, top_n, rank_keys)
+    except Exception as e:
+        print(f"Error scanning {symbol}: {e}")
+    return heaps
+
+def merge_top_candles(symbol_heaps, top_n, rank_keys):
+    # Merge the per-symbol heaps into one DataFrame per key, largest first
+    top_candles = {}
+    for key in rank_keys:
+        entries = heapq.nlargest(top_n, (entry for heaps in symbol_heaps for entry in heaps[key]))
+        rows = pd.DataFrame(entries, columns=['value', 'timestamp', 'symbol'] + OHLC_COLUMNS)
+        rows['timestamp'] = pd.to_datetime((-rows['timestamp'].to_numpy(dtype=np.int64)).view('datetime64[ns]'))
+        metrics = compute_candle_features(*(rows[column].to_numpy(dtype=np.float64) for column in OHLC_COLUMNS))
+        for name, metric in metrics.items():
+            rows[name] = metric
+        top_candles[key] = rows.drop(columns='value').set_index('timestamp')
+    return top_candles
+
+def get_data_folder_symbols(data_folder):
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(data_folder) if name.endswith('.csv'))
+
+def scan_top_candles(symbols, data_folder, top_n, rank_keys, workers=None, executor='process', **kwargs):
+    # Scan many symbols in parallel; every worker returns at most top_n candles per key
+    scan = partial(scan_symbol_top_candles, data_folder=data_folder, top_n=top_n, rank_keys=rank_keys, **kwargs)
+    if workers == 1 or len(symbols) <= 1:
+        symbol_heaps = [scan(symbol) for symbol in symbols]
+    else:
+        if executor == 'thread':
+            pool_class = ThreadPoolExecutor
+        elif executor == 'process':
+            pool_class = ProcessPoolExecutor
+        else:
+            raise ValueError(f"Unknown executor '{executor}'. Use 'thread' or 'process'.")
+        with pool_class(max_workers=workers) as pool:
+            symbol_heaps = list(pool.map(scan, symbols))
+    return merge_top_candles(symbol_heaps, top_n, rank_keys)
+
+def plot_candles(top_candles, diff_type, symbol, max_candles=DEFAULT_PLOT_POINTS, output_path=None):
+    # Imported here so the analysis functions can be used without the plotting dependency
+    import matplotlib
+    if output_path:
+        # Render to the file without a display
+        matplotlib.use('Agg')
+    import mplfinance as mpf
+    # Long lists are cut to their largest candles; every drawn candle is a real one
+    if len(top_candles) > max_candles:
+        print(f"Plotting the {max_candles} largest of {len(top_candles)} candles for {diff_type}.")
+        top_candles = top_candles.nlargest(max_candles, diff_type)
     # Prepare data for mplfinance
     top_candles = top_candles.copy()
     top_candles = top_candles[['open', 'high', 'low', 'close']]
@@ -46,21 +158,26 @@ def plot_candles(top_candles, diff_type, symbol):
         title = f"Top Candles with Largest (High - Low) Difference for {symbol}"
 
     # Plot using mplfinance without the mav parameter
-    mpf.plot(top_candles, type='candle', style='charles', title=title, volume=False)
-
-def main():
-    parser = argparse.ArgumentParser(description='Find and plot candlesticks with largest differences among red candles.')
-    parser.add_argument('--data_folder', type=str, default='data', help='Path to the data folder containing CSV files.')
-    parser.add_argument('--symbol', type=str, required=True, help='Symbol to analyze (e.g., BTCUSDT).')
-    parser.add_argument('--top_n', type=int, default=100, help='Number of top candles to find (default: 100).')
-    args = parser.parse_args()
+    if output_path:
+        mpf.plot(top_candles, type='candle', style='charles', title=title, volume=False, savefig=output_path)
+        print(f"Plot written to {output_path}")
+    else:
+        mpf.plot(top_candles, type='candle', style='charles', title=title, volume=False)
 
-    data_folder = args.data_folder
-    symbol = args.symbol
-    top_n = args.top_n
+def get_plot_path(plot_output, diff_type):
+    # One image per difference type: plot.png gives plot_close_low_diff.png and plot_high_low_diff.png
+    if plot_output is None:
+        return None
+    root, extension = os.path.splitext(plot_output)
+    return f"{root}_{diff_type}{extension or '.png'}"
 
+def load_red_candles(symbol, data_folder, args, profiler):
+    # Red candles with their differences, computed from the data of one symbol
     # Read the data
-    data = read_historical_data(symbol, data_folder)
+    with profiler.stage('load', symbol):
+        data = read_historical_data(
+            symbol, data_folder, start=args.start, end=args.end, use_cache=not args.no_cache, cache_dir=args.cache_dir
+        )
     if data is None or data.empty:
         print(f"No data available for symbol '{symbol}'.")
         sys.exit(1)
@@ -73,23 +190,88 @@ def main():
             sys.exit(1)
 
     # Convert columns to numeric
-    data[required_columns] = data[required_columns].apply(pd.to_numeric, errors='coerce')
-    data = data.dropna(subset=required_columns)
+    with profiler.stage('to_numeric', symbol):
+        data[required_columns] = data[required_columns].apply(pd.to_numeric, errors='coerce')
+        data = data.dropna(subset=required_columns)
     if data.empty:
         print(f"No valid OHLC data available for symbol '{symbol}'.")
         sys.exit(1)
 
     # Find red candles
-    red_candles = find_red_candles(data)
+    with profiler.stage('find_red_candles', symbol):
+        red_candles = find_red_candles(data)
+
+    # Calculate differences
+    with profiler.stage('calculate_differences', symbol):
+        red_candles = calculate_differences(red_candles)
+    return red_candles
+
+def main():
+    parser = argparse.ArgumentParser(description='Find and plot candlesticks with largest differences among red candles.')
+    parser.add_argument('--data_folder', type=str, default='data', help='Path to the data folder containing CSV files.')
+    parser.add_argument('--symbol', type=str, default=None, help='Symbol to analyze (e.g., BTCUSDT).')
+    parser.add_argument('--symbols', type=str, default=None, help='Comma-separated symbols to scan together for the largest red candles across all of them.')
+    parser.add_argument('--all_symbols', action='store_true', help='Scan every CSV file in the data folder for the largest red candles across all of them.')
+    parser.add_argument('--rank_by', type=str, default='diff', choices=['diff', 'pct'], help='Multi-symbol mode: rank by price differences or by percentages (default: diff).')
+    parser.add_argument('--workers', type=int, default=None, help='Multi-symbol mode: number of parallel scanners (default: chosen by the executor).')
+    parser.add_argument('--executor', type=str, default='process', choices=['thread', 'process'], help='Multi-symbol mode: pool used for the parallel scan (default: process).')
+    parser.add_argument('--chunksize', type=int, default=None, help='Multi-symbol mode: stream each CSV file in chunks of this many rows instead of loading it whole.')
+    parser.add_argument('--output', type=str, default=None, help='Multi-symbol mode: optional CSV file prefix for the two top lists.')
+    parser.add_argument('--index', action='store_true', help='Answer from the persisted red-candle index of each symbol, building or updating it first.')
+    parser.add_argument('--start', type=str, default=None, help='Only consider candles at or after this date (e.g., 2024-03-01).')
+    parser.add_argument('--end', type=str, default=None, help='Only consider candles at or before this date.')
+    parser.add_argument('--min_close_low_pct', type=float, default=None, help='Only consider red candles whose (Close - Low) percentage is at least this value.')
+    parser.add_argument('--min_high_low_pct', type=float, default=None, help='Only consider red candles whose (High - Low) percentage is at least this value.')
+    parser.add_argument('--top_n', type=int, default=100, help='Number of top candles to find (default: 100).')
+    parser.add_argument('--plot_points', type=int, default=DEFAULT_PLOT_POINTS, help=f'Maximum number of candles drawn per plot; only the largest ones are drawn beyond it (default: {DEFAULT_PLOT_POINTS}).')
+    parser.add_argument('--plot_output', type=str, default=None, help='Save the two plots to image files named after this path (e.g., plot.png gives plot_close_low_diff.png) instead of showing them.')
+    parser.add_argument('--cache_dir', type=str, default=None, help='Folder for the parsed data cache (default: <data_folder>/.cache).')
+    parser.add_argument('--no_cache', action='store_true', help='Always parse the CSV files instead of using the data cache.')
+    parser.add_argument('--profile', type=str, nargs='?', const='-', default=None, help='Write a JSON report of the wall time, CPU time and peak memory of every stage to this file (stdout without a value).')
+    parser.add_argument('--profile_memory', action='store_true', help='With --profile, also trace the peak memory allocated within each stage (slower).')
+    args = parser.parse_args()
+    if sum([args.symbol is not None, args.symbols is not None, args.all_symbols]) != 1:
+        parser.error('Pass exactly one of --symbol, --symbols or --all_symbols.')
+    if args.index and args.chunksize:
+        parser.error('--index answers from the persisted index and cannot be combined with --chunksize.')
+
+    data_folder = args.data_folder
+    symbol = args.symbol
+    top_n = args.top_n
+    profiler = create_profiler(args.profile, trace_memory=args.profile_memory)
+
+    thresholds = {}
+    if args.min_close_low_pct is not None:
+        thresholds['close_low_pct'] = args.min_close_low_pct
+    if args.min_high_low_pct is not None:
+        thresholds['high_low_pct'] = args.min_high_low_pct
+
+    if symbol is None:
+        run_multi_symbol_scan(args, thresholds, profiler)
+        return
+
+    if args.index:
+        # The index already holds the differences of every red candle
+        with profiler.stage('query_index', symbol):
+            try:
+                red_candles = query_candle_index(
+                    symbol, data_folder, start=args.start, end=args.end, thresholds=thresholds,
+                    cache_dir=args.cache_dir, use_cache=not args.no_cache
+                )
+            except Exception as e:
+                print(f"Error querying the candle index of '{symbol}': {e}")
+                sys.exit(1)
+    else:
+        red_candles = load_red_candles(symbol, data_folder, args, profiler)
+        for column, minimum in thresholds.items():
+            red_candles = red_candles[red_candles[column] >= minimum]
     if red_candles.empty:
         print("No red candles found in data.")
         sys.exit(1)
 
-    # Calculate differences
-    red_candles = calculate_differences(red_candles)
-
     # Get top candles
-    top_close_low_diff, top_high_low_diff = get_top_candles(red_candles, top_n)
+    with profiler.stage('get_top_candles', symbol):
+        top_close_low_diff, top_high_low_diff = get_top_candles(red_candles, top_n)
 
     # Print the results
     pd.set_option('display.float_format', '{:.2f}'.format)  # Format float numbers
@@ -100,8 +282,39 @@ def main():
     print(top_high_low_diff[['open', 'high', 'low', 'close', 'high_low_diff', 'high_low_pct']])
 
     # Plotting
-    plot_candles(top_close_low_diff, 'close_low_diff', symbol)
-    plot_candles(top_high_low_diff, 'high_low_diff', symbol)
+    with profiler.stage('plot', symbol):
+        plot_candles(top_close_low_diff, 'close_low_diff', symbol, args.plot_points, get_plot_path(args.plot_output, 'close_low_diff'))
+        plot_candles(top_high_low_diff, 'high_low_diff', symbol, args.plot_points, get_plot_path(args.plot_output, 'high_low_diff'))
+
+def run_multi_symbol_scan(args, thresholds, profiler):
+    if args.all_symbols:
+        symbols = get_data_folder_symbols(args.data_folder)
+    else:
+        symbols = list(dict.fromkeys(symbol.strip() for symbol in args.symbols.split(',')))
+    if not symbols:
+        print(f"No CSV files found in '{args.data_folder}'.")
+        sys.exit(1)
+    rank_keys = RANK_KEYS[args.rank_by]
+    with profiler.stage('scan', symbols=len(symbols)):
+        top_candles = scan_top_candles(
+            symbols, args.data_folder, args.top_n, rank_keys, workers=args.workers, executor=args.executor,
+            chunksize=args.chunksize, use_cache=not args.no_cache, cache_dir=args.cache_dir,
+            start=args.start, end=args.end, thresholds=thresholds, use_index=args.index
+        )
+    close_low_key, high_low_key = rank_keys
+    if top_candles[close_low_key].empty:
+        print("No red candles found in data.")
+        sys.exit(1)
+
+    pd.set_option('display.float_format', '{:.2f}'.format)  # Format float numbers
+    print(f"Top {args.top_n} red candles across {len(symbols)} symbols with largest (Close - Low) {args.rank_by}:")
+    print(top_candles[close_low_key][['symbol'] + OHLC_COLUMNS + ['close_low_diff', 'close_low_pct']])
+    print(f"\nTop {args.top_n} red candles across {len(symbols)} symbols with largest (High - Low) {args.rank_by}:")
+    print(top_candles[high_low_key][['symbol'] + OHLC_COLUMNS + ['high_low_diff', 'high_low_pct']])
+    if args.output:
+        for key in rank_keys:
+            top_candles[key].to_csv(f"{args.output}_{key}.csv")
+        print(f"Top lists written to {args.output}_{close_low_key}.csv and {args.output}_{high_low_key}.csv")
 
 if __name__ == "__main__":
     main()
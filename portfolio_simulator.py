@@ -2,8 +2,18 @@ import pandas as pd
 import numpy as np
 import os
 import argparse
+import io
+import multiprocessing
+from contextlib import redirect_stdout
 from colorama import init, Fore, Style
+from utils.alignment import align_series, write_gap_report
+from utils.chunked_reader import iter_aligned_chunks, iter_historical_data, read_time_bounds, resample_chunks
+from utils.data_cache import get_cache_dir
 from utils.data_reader import read_historical_data
+from utils.downsampling import DEFAULT_PLOT_POINTS, downsample_series
+from utils.profiling import create_profiler
+from utils.result_cache import DEFAULT_RESULT_CACHE_MB, get_result_cache_dir, memoize_result
+from utils.shared_frame import share_frame, attach_frame, release_frame
 
 # Initialize colorama
 init(autoreset=True)
@@ -18,10 +28,39 @@ def parse_arguments():
     parser.add_argument('--trading_fee', type=float, default=0.001, help='Trading fee per transaction (e.g., 0.001 for 0.1%)')
     parser.add_argument('--initial_capital', type=float, default=100000, help='Initial capital for the simulation')
     parser.add_argument('--timestamp_granularity', type=str, default='1min', help='Timestamp granularity (default: 1min)')
+    parser.add_argument('--cache_dir', type=str, default=None, help='Folder for the parsed data cache (default: <data_folder>/.cache)')
+    parser.add_argument('--no_cache', action='store_true', help='Always parse the CSV files instead of using the data cache')
+    parser.add_argument('--precision', type=str, default='float64', choices=['float32', 'float64'], help='Storage precision of the loaded prices; the simulation always computes in float64 (default: float64)')
+    parser.add_argument('--no_result_cache', action='store_true', help='Always rerun the simulations instead of using the result cache')
+    parser.add_argument('--result_cache_mb', type=float, default=DEFAULT_RESULT_CACHE_MB, help=f'Size limit of the result cache in MB; least recently used results are evicted (default: {DEFAULT_RESULT_CACHE_MB})')
+    parser.add_argument('--engine', type=str, default='vectorized', choices=['loop', 'vectorized'], help='Simulation engine (default: vectorized)')
+    parser.add_argument('--sweep', action='store_true', help='Run every combination of rebalancing period, trading fee and initial capital in parallel')
+    parser.add_argument('--trading_fees', type=str, default=None, help='Sweep mode: comma-separated fees or an inclusive start:stop:step range (default: --trading_fee)')
+    parser.add_argument('--initial_capitals', type=str, default=None, help='Sweep mode: comma-separated capitals or an inclusive start:stop:step range (default: --initial_capital)')
+    parser.add_argument('--workers', type=int, default=None, help='Sweep mode: number of worker processes (default: number of CPUs)')
+    parser.add_argument('--profile', type=str, nargs='?', const='-', default=None, help='Write a JSON report of the wall time, CPU time and peak memory of every stage to this file (stdout without a value)')
+    parser.add_argument('--profile_memory', action='store_true', help='With --profile, also trace the peak memory allocated within each stage (slower)')
+    parser.add_argument('--plot_points', type=int, default=DEFAULT_PLOT_POINTS, help=f'Maximum number of points drawn per line of the plot (default: {DEFAULT_PLOT_POINTS})')
+    parser.add_argument('--plot_output', type=str, default=None, help='Save the plot to this image file (e.g., plot.png) instead of showing it')
+    parser.add_argument('--chunksize', type=int, default=None, help='Stream the CSV files in chunks of this many rows and run all simulations in one pass (bounded memory; no plot or sweep)')
+    parser.add_argument('--equity_output', type=str, default=None, help='With --chunksize, CSV file for the portfolio values of every simulation, written chunk by chunk')
+    parser.add_argument('--equity_frequency', type=str, default=None, help='With --chunksize, write the last portfolio value of every period of this length (e.g., 1h) instead of every bar')
+    parser.add_argument('--gap_report', type=str, default=None, help='Write the time ranges each asset has no price for, which the simulation drops, to this CSV file')
+    parser.add_argument('--sweep_output', type=str, default=None, help='Sweep mode: optional CSV file for the summary table')
     args = parser.parse_args()
     return args
 
-def simulate_trading(price_df, symbols, rebalance_period, trading_fee, initial_capital, rebalance=False, verbose=True):
+def simulate_trading(price_df, symbols, rebalance_period, trading_fee, initial_capital, rebalance=False, verbose=True, engine='loop'):
+    if engine == 'vectorized':
+        return simulate_trading_vectorized(
+            price_df, symbols, rebalance_period, trading_fee, initial_capital, rebalance=rebalance, verbose=verbose
+        )
+    if engine != 'loop':
+        raise ValueError(f"Unknown simulation engine '{engine}'. Use 'loop' or 'vectorized'.")
+    # Narrow price columns are widened once so the arithmetic is always done in float64
+    if (price_df.dtypes != np.float64).any():
+        price_df = price_df.astype(np.float64)
+
     if rebalance:
         # Generate rebalancing dates
         rebalancing_dates = pd.date_range(
@@ -125,6 +164,229 @@ def simulate_trading(price_df, symbols, rebalance_period, trading_fee, initial_c
 
     return portfolio_df, initial_total_value, final_total_value, total_return, trade_counts, total_fees_paid
 
+def simulate_trading_cached(result_cache, price_df, symbols, rebalance_period, trading_fee, initial_capital, rebalance=False, verbose=True, engine='loop'):
+    # simulate_trading memoized on its settings and on the data the prices come from.
+    # result_cache is None (always simulate) or a dict with the result 'dir', the 'params'
+    # that produced price_df, the source 'file_paths' and the size limit in 'max_bytes'.
+    # The allocations a verbose run prints are stored with the result and printed again on hits.
+    def compute():
+        output = io.StringIO()
+        with redirect_stdout(output):
+            result = simulate_trading(
+                price_df, symbols, rebalance_period, trading_fee, initial_capital,
+                rebalance=rebalance, verbose=True, engine=engine
+            )
+        return result, output.getvalue()
+
+    if result_cache is None:
+        return simulate_trading(
+            price_df, symbols, rebalance_period, trading_fee, initial_capital,
+            rebalance=rebalance, verbose=verbose, engine=engine
+        )
+    params = dict(
+        result_cache['params'], symbols=symbols, rebalance_period=rebalance_period if rebalance else None,
+        trading_fee=trading_fee, initial_capital=initial_capital, engine=engine
+    )
+    (result, printed), _ = memoize_result(result_cache['dir'], 'simulation', params, result_cache['file_paths'], compute, result_cache['max_bytes'])
+    if verbose:
+        for line in printed.splitlines():
+            print(line)
+    return result
+
+def get_rebalance_positions(index, rebalance_period, rebalance):
+    # Row positions of the rebalancing dates, always including the initial allocation
+    positions = np.array([0])
+    if rebalance:
+        rebalancing_dates = pd.date_range(start=index.min(), end=index.max(), freq=rebalance_period)
+        rebalancing_dates = rebalancing_dates.intersection(index)
+        positions = np.union1d(positions, index.get_indexer(rebalancing_dates))
+    return positions
+
+def sum_portfolio_values(cash, holdings, prices):
+    # Accumulate asset values column by column so the floating-point summation order
+    # matches the per-bar sum() of the loop engine exactly
+    asset_values = holdings[..., 0] * prices[..., 0]
+    for position in range(1, prices.shape[-1]):
+        asset_values = asset_values + holdings[..., position] * prices[..., position]
+    return cash + asset_values
+
+def rebalance_equal_weight(cash, holdings, current_prices, trading_fee, total_fees_paid, symbols, date, verbose=True):
+    # Trade every asset with a valid price to an equal share of the portfolio value. Returns
+    # the new cash and holdings, the buy and sell masks and the updated total of fees paid.
+    total_portfolio_value = sum_portfolio_values(cash, holdings, current_prices)
+    desired_value_per_asset = total_portfolio_value / len(symbols)
+
+    invalid = np.isnan(current_prices) | (current_prices == 0)
+    if verbose:
+        for symbol in np.asarray(symbols)[invalid]:
+            print(Fore.YELLOW + f"Invalid price for {symbol} on {date}, skipping.")
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta_value = desired_value_per_asset - holdings * current_prices
+        delta_shares = delta_value / current_prices
+        transaction_amount = delta_shares * current_prices
+    fees = np.abs(transaction_amount) * trading_fee
+    # Trivial adjustments below one cent are ignored
+    traded = ~invalid & ~(np.abs(delta_value) < 0.01)
+    buys = traded & (delta_shares > 0)
+    sells = traded & ~(delta_shares > 0)
+
+    # Cash and fees are accumulated in asset order to stay bit-identical to the loop engine
+    for cost, fee in zip(transaction_amount[traded] + fees[traded], fees[traded]):
+        cash -= cost
+        total_fees_paid += fee
+    holdings = np.where(traded, holdings + delta_shares, holdings)
+    return cash, holdings, buys, sells, total_fees_paid
+
+def simulate_trading_vectorized(price_df, symbols, rebalance_period, trading_fee, initial_capital, rebalance=False, verbose=True):
+    # Holdings and cash only change on rebalancing dates, so the state is evolved once per
+    # rebalance and the portfolio value of every bar is computed with whole-array operations
+    prices = price_df[symbols].to_numpy(dtype=np.float64)
+    dates = price_df.index
+    positions = get_rebalance_positions(dates, rebalance_period, rebalance)
+
+    holdings = np.zeros(len(symbols))
+    cash = initial_capital
+    holdings_by_rebalance = np.empty((len(positions), len(symbols)))
+    cash_by_rebalance = np.empty(len(positions))
+    buy_counts = np.zeros(len(symbols), dtype=np.int64)
+    sell_counts = np.zeros(len(symbols), dtype=np.int64)
+    total_fees_paid = 0.0
+
+    for rebalance_number, row in enumerate(positions):
+        current_prices = prices[row]
+        cash, holdings, buys, sells, total_fees_paid = rebalance_equal_weight(
+            cash, holdings, current_prices, trading_fee, total_fees_paid, symbols, dates[row], verbose
+        )
+        buy_counts += buys
+        sell_counts += sells
+
+        holdings_by_rebalance[rebalance_number] = holdings
+        cash_by_rebalance[rebalance_number] = cash
+
+        # Record initial allocation
+        if row == 0 and verbose:
+            total_value = sum_portfolio_values(cash, holdings, current_prices)
+            print(Fore.BLUE + f"Initial Allocation on {dates[row].date()}:")
+            for symbol, percent in zip(symbols, holdings * current_prices / total_value * 100):
+                print(f"{symbol}: {percent:.2f}%")
+
+    # Holdings are piecewise constant between rebalances
+    segment = np.searchsorted(positions, np.arange(len(prices)), side='right') - 1
+    total_values = sum_portfolio_values(cash_by_rebalance[segment], holdings_by_rebalance[segment], prices)
+
+    # Record final allocation
+    final_prices = prices[-1]
+    final_alloc_percent = holdings * final_prices / total_values[-1] * 100
+    if verbose:
+        print(Fore.BLUE + f"Final Allocation on {dates[-1].date()}:")
+        for symbol, percent in zip(symbols, final_alloc_percent):
+            print(f"{symbol}: {percent:.2f}%")
+
+    portfolio_df = pd.DataFrame({'total_value': total_values}, index=pd.Index(dates.to_numpy(), name='date'))
+    trade_counts = {
+        symbol: {'buy': int(buy_count), 'sell': int(sell_count)}
+        for symbol, buy_count, sell_count in zip(symbols, buy_counts, sell_counts)
+    }
+
+    # Calculate performance metrics
+    initial_total_value = portfolio_df['total_value'].iloc[0]
+    final_total_value = portfolio_df['total_value'].iloc[-1]
+    total_return = (final_total_value / initial_total_value - 1) * 100
+
+    return portfolio_df, initial_total_value, final_total_value, total_return, trade_counts, total_fees_paid
+
+class StreamingPortfolio:
+    # Equal-weight portfolio simulated chunk by chunk with the arithmetic of the vectorized
+    # engine. Cash, holdings, fees, trade counts and the next rebalancing date are carried
+    # across chunks, so only the current chunk of prices is ever held in memory.
+    def __init__(self, symbols, rebalance_period, trading_fee, initial_capital, rebalance=False, verbose=True):
+        self.symbols = symbols
+        self.rebalance_period = rebalance_period
+        self.trading_fee = trading_fee
+        self.rebalance = rebalance
+        self.verbose = verbose
+        self.cash = initial_capital
+        self.holdings = np.zeros(len(symbols))
+        self.buy_counts = np.zeros(len(symbols), dtype=np.int64)
+        self.sell_counts = np.zeros(len(symbols), dtype=np.int64)
+        self.total_fees_paid = 0.0
+        # First date of the rebalancing schedule that has not been reached yet
+        self.next_rebalance = None
+        self.initial_date = None
+        self.initial_allocation = None
+        self.initial_total_value = None
+        self.final_date = None
+        self.final_prices = None
+        self.final_total_value = None
+
+    def get_rebalance_positions(self, dates):
+        # Positions in this chunk of the dates pd.date_range(first date, last date,
+        # freq=rebalance_period) would give over the whole simulation
+        positions = np.array([], dtype=np.int64)
+        if self.initial_date is None:
+            # The initial allocation is made on the first bar
+            self.initial_date = dates[0]
+            self.next_rebalance = dates[0]
+            positions = np.array([0])
+        if self.rebalance:
+            schedule = pd.date_range(start=self.next_rebalance, end=dates[-1], freq=self.rebalance_period)
+            if len(schedule):
+                self.next_rebalance = pd.date_range(start=schedule[-1], periods=2, freq=self.rebalance_period)[1]
+                positions = np.union1d(positions, dates.get_indexer(schedule.intersection(dates)))
+        return positions
+
+    def update(self, dates, prices):
+        # Simulate the bars of one chunk (a DatetimeIndex and a float64 array with a column per
+        # symbol) and return the portfolio value of every bar
+        positions = self.get_rebalance_positions(dates)
+        # Row 0 holds the state carried over from the previous chunks
+        holdings_by_rebalance = np.empty((len(positions) + 1, len(self.symbols)))
+        cash_by_rebalance = np.empty(len(positions) + 1)
+        holdings_by_rebalance[0] = self.holdings
+        cash_by_rebalance[0] = self.cash
+
+        for rebalance_number, row in enumerate(positions, start=1):
+            current_prices = prices[row]
+            self.cash, self.holdings, buys, sells, self.total_fees_paid = rebalance_equal_weight(
+                self.cash, self.holdings, current_prices, self.trading_fee, self.total_fees_paid,
+                self.symbols, dates[row], self.verbose
+            )
+            self.buy_counts += buys
+            self.sell_counts += sells
+            holdings_by_rebalance[rebalance_number] = self.holdings
+            cash_by_rebalance[rebalance_number] = self.cash
+            if self.initial_allocation is None:
+                total_value = sum_portfolio_values(self.cash, self.holdings, current_prices)
+                self.initial_allocation = self.holdings * current_prices / total_value * 100
+
+        segment = np.searchsorted(positions, np.arange(len(prices)), side='right')
+        total_values = sum_portfolio_values(cash_by_rebalance[segment], holdings_by_rebalance[segment], prices)
+        if self.initial_total_value is None:
+            self.initial_total_value = total_values[0]
+        self.final_date = dates[-1]
+        self.final_prices = prices[-1]
+        self.final_total_value = total_values[-1]
+        return total_values
+
+    def get_results(self):
+        # The return values of simulate_trading, without the portfolio history
+        total_return = (self.final_total_value / self.initial_total_value - 1) * 100
+        trade_counts = {
+            symbol: {'buy': int(buy_count), 'sell': int(sell_count)}
+            for symbol, buy_count, sell_count in zip(self.symbols, self.buy_counts, self.sell_counts)
+        }
+        return self.initial_total_value, self.final_total_value, total_return, trade_counts, self.total_fees_paid
+
+    def print_allocations(self):
+        # The allocations a verbose simulate_trading run prints
+        print(Fore.BLUE + f"Initial Allocation on {self.initial_date.date()}:")
+        for symbol, percent in zip(self.symbols, self.initial_allocation):
+            print(f"{symbol}: {percent:.2f}%")
+        print(Fore.BLUE + f"Final Allocation on {self.final_date.date()}:")
+        for symbol, percent in zip(self.symbols, self.holdings * self.final_prices / self.final_total_value * 100):
+            print(f"{symbol}: {percent:.2f}%")
+
 def calculate_individual_asset_performance(price_df, initial_capital, trading_fee):
     performance_results = []
     initial_prices = price_df.iloc[0]
@@ -155,6 +417,239 @@ def calculate_individual_asset_performance(price_df, initial_capital, trading_fe
     performance_df = pd.DataFrame(performance_results)
     return performance_df
 
+def report_simulation(simulation_type, title, initial_val, final_val, total_ret, trade_counts, total_fees):
+    # Print the results of one simulation and return its row of the summary table
+    total_trades = sum([sum(tc.values()) for tc in trade_counts.values()])
+    print(Fore.GREEN + title)
+    print(f"Initial Portfolio Value: ${initial_val:,.2f}")
+    print(f"Final Portfolio Value:   ${final_val:,.2f}")
+    print(f"Total Return:            {total_ret:.2f}%")
+    print(f"Total Trades Executed:   {total_trades}")
+    print(f"Total Fees Paid:         ${total_fees:,.2f}\n")
+    return {
+        'Simulation Type': simulation_type,
+        'Initial Value': initial_val,
+        'Final Value': final_val,
+        'Total Return (%)': total_ret,
+        'Total Trades': total_trades,
+        'Total Fees Paid': total_fees
+    }
+
+def print_summary(results, price_df, initial_capital, trading_fee):
+    # Add the buy-and-hold performance of every asset to the results and print the summary
+    # table. Only the first and last rows of price_df are used.
+    print(Fore.MAGENTA + "\n=== Individual Asset Performance ===")
+    individual_performance_df = calculate_individual_asset_performance(price_df, initial_capital, trading_fee)
+    # Merge individual asset performance into results
+    for index, row in individual_performance_df.iterrows():
+        total_fees_asset = initial_capital * trading_fee + row['Final Value'] * trading_fee
+        results.append({
+            'Simulation Type': f"Asset {row['Asset']}",
+            'Initial Value': initial_capital,
+            'Final Value': row['Final Value'],
+            'Total Return (%)': row['Total Return (%)'],
+            'Total Trades': 2,  # One buy and one sell
+            'Total Fees Paid': total_fees_asset
+        })
+    # Display individual performance
+    print(individual_performance_df[['Asset', 'Initial Price', 'Final Price', 'Total Return (%)', 'Final Value']].to_string(index=False))
+
+    # Create a summary DataFrame
+    summary_df = pd.DataFrame(results)
+    summary_df = summary_df.sort_values(by='Total Return (%)', ascending=False)
+    print(Fore.MAGENTA + "\n=== Simulation Summary ===")
+    print(summary_df[['Simulation Type', 'Initial Value', 'Final Value', 'Total Return (%)', 'Total Trades', 'Total Fees Paid']].to_string(index=False))
+
+
+def plot_simulations(portfolio_dfs, price_df, symbols, initial_capital, trading_fee, max_points=DEFAULT_PLOT_POINTS, output_path=None):
+    # Plot the portfolio values of the simulations ({simulation type: portfolio_df}) and of
+    # every asset bought and held. Each line is downsampled with LTTB to max_points points.
+    # With output_path the figure is saved to that file without a display.
+    import matplotlib
+    if output_path:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=(14, 7))
+    # Plot portfolio simulations
+    for simulation_type, portfolio_df in portfolio_dfs.items():
+        values = downsample_series(portfolio_df['total_value'], max_points)
+        plt.plot(values.index, values, label=simulation_type)
+    # Plot individual asset performances
+    for symbol in symbols:
+        asset_values = (price_df[symbol] / price_df[symbol].iloc[0]) * initial_capital
+        # Subtract trading fees (assumed on buy and sell)
+        total_fees = initial_capital * trading_fee + asset_values * trading_fee
+        asset_values = downsample_series(asset_values - total_fees, max_points)
+        plt.plot(asset_values.index, asset_values, label=f"Asset {symbol}")
+    plt.title('Portfolio and Individual Asset Values Over Time')
+    plt.xlabel('Date')
+    plt.ylabel('Value ($)')
+    plt.legend(title='Simulation Type', loc='upper left')
+    plt.grid(True)
+    plt.tight_layout()
+    if output_path:
+        fig.savefig(output_path)
+        plt.close(fig)
+        print(Fore.GREEN + f"Plot written to {output_path}")
+    else:
+        plt.show()
+
+def parse_sweep_values(values_arg):
+    # Accept either a comma-separated list or an inclusive start:stop:step range
+    if ':' in values_arg:
+        start, stop, step = [float(value) for value in values_arg.split(':')]
+        if step <= 0:
+            raise ValueError(f"Sweep range step must be positive: {values_arg}")
+        count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        return [round(start + step * position, 12) for position in range(count)]
+    return [float(value.strip()) for value in values_arg.split(',')]
+
+# Price matrix attached once per sweep worker process
+sweep_price_df = None
+
+def init_sweep_worker(handle):
+    global sweep_price_df
+    sweep_price_df = attach_frame(handle)
+
+def run_sweep_task(task):
+    rebalance_period, trading_fee, initial_capital, engine = task
+    _, initial_val, final_val, total_ret, trade_counts, total_fees = simulate_trading(
+        price_df=sweep_price_df,
+        symbols=list(sweep_price_df.columns),
+        rebalance_period=rebalance_period,
+        trading_fee=trading_fee,
+        initial_capital=initial_capital,
+        rebalance=rebalance_period is not None,
+        verbose=False,
+        engine=engine
+    )
+    return {
+        'Simulation Type': f"Rebalance {rebalance_period}" if rebalance_period is not None else "No Rebalancing",
+        'Trading Fee': trading_fee,
+        'Initial Capital': initial_capital,
+        'Initial Value': initial_val,
+        'Final Value': final_val,
+        'Total Return (%)': total_ret,
+        'Total Trades': sum([sum(tc.values()) for tc in trade_counts.values()]),
+        'Total Fees Paid': total_fees
+    }
+
+def run_parameter_sweep(price_df, rebalance_periods, trading_fees, initial_capitals, workers=None, engine='vectorized'):
+    # Every (period, fee, capital) combination, plus the no-rebalancing baseline per (fee, capital)
+    tasks = [
+        (rebalance_period, trading_fee, initial_capital, engine)
+        for rebalance_period in list(rebalance_periods) + [None]
+        for trading_fee in trading_fees
+        for initial_capital in initial_capitals
+    ]
+    # The price matrix is written to shared memory once; workers attach to it on start-up
+    handle = share_frame(price_df)
+    try:
+        with multiprocessing.Pool(processes=workers, initializer=init_sweep_worker, initargs=(handle,)) as pool:
+            chunksize = max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))
+            results = pool.map(run_sweep_task, tasks, chunksize=chunksize)
+    finally:
+        release_frame(handle)
+    summary_df = pd.DataFrame(results)
+    summary_df = summary_df.sort_values(by='Total Return (%)', ascending=False)
+    return summary_df
+
+def iter_price_chunks(symbol, data_folder, start_date, end_date, args):
+    # Forward-filled close prices of one asset, chunk by chunk; the last price of a chunk fills
+    # the missing prices at the start of the next one
+    last_price = np.nan
+    for data in iter_historical_data(
+        symbol, data_folder, chunksize=args.chunksize, start=start_date, end=end_date,
+        timestamp_granularity=args.timestamp_granularity
+    ):
+        close = data['close'].astype(args.precision).ffill().fillna(last_price)
+        if not np.isnan(close.iloc[-1]):
+            last_price = close.iloc[-1]
+        yield close
+
+def write_equity_chunks(equity_chunks, output_path):
+    # Append the portfolio values to a CSV file as the chunks arrive; without a file they are
+    # only consumed
+    if output_path is None:
+        for _ in equity_chunks:
+            pass
+        return
+    with open(output_path, 'w', newline='') as f:
+        for position, equity_df in enumerate(equity_chunks):
+            equity_df.to_csv(f, header=position == 0)
+
+def run_streaming_simulations(symbols, start_date, end_date, rebalance_periods, args, profiler):
+    # Run every simulation in a single pass over aligned chunks of prices, so memory depends on
+    # the chunk size rather than on the length of the simulation period. The portfolio values
+    # are written to --equity_output instead of being kept.
+    for symbol in symbols:
+        try:
+            file_start, file_end = read_time_bounds(symbol, args.data_folder)
+        except Exception as e:
+            print(Fore.RED + f"Error reading data for {symbol}: {e}. Exiting simulation.")
+            return
+        if file_start is None:
+            print(Fore.RED + f"No data for {symbol}. Exiting simulation.")
+            return
+        if file_start > start_date or file_end < end_date:
+            print(Fore.RED + f"Data for {symbol} does not fully cover the simulation period.")
+            print(Fore.YELLOW + f"Data starts on {file_start.date()} and ends on {file_end.date()}.")
+            return
+        print(Fore.GREEN + f"Loaded {symbol} data from {start_date.date()} to {end_date.date()}.")
+
+    simulations = {
+        f"Rebalance {rebalance_period}": StreamingPortfolio(
+            symbols, rebalance_period, args.trading_fee, args.initial_capital, rebalance=True
+        )
+        for rebalance_period in rebalance_periods
+    }
+    simulations['No Rebalancing'] = StreamingPortfolio(symbols, None, args.trading_fee, args.initial_capital)
+    streams = {
+        symbol: iter_price_chunks(symbol, args.data_folder, start_date, end_date, args)
+        for symbol in dict.fromkeys(symbols)
+    }
+    # Only the first and last prices are needed for the buy-and-hold comparison
+    edge_prices = {}
+
+    def iter_equity_chunks():
+        for price_df in iter_aligned_chunks(streams, how='inner'):
+            if price_df.empty:
+                continue
+            with profiler.stage('simulate_chunk', rows=len(price_df)):
+                prices = price_df[symbols].to_numpy(dtype=np.float64)
+                values = {name: simulation.update(price_df.index, prices) for name, simulation in simulations.items()}
+            edge_prices.setdefault('first', price_df.iloc[[0]])
+            edge_prices['last'] = price_df.iloc[[-1]]
+            yield pd.DataFrame(values, index=pd.Index(price_df.index, name='date'))
+
+    equity_chunks = iter_equity_chunks()
+    if args.equity_frequency:
+        # The last portfolio value of every period
+        equity_chunks = (chunk.dropna(how='all') for chunk in resample_chunks(equity_chunks, args.equity_frequency))
+    try:
+        with profiler.stage('stream'):
+            write_equity_chunks(equity_chunks, args.equity_output)
+    except Exception as e:
+        print(Fore.RED + f"Error processing data: {e}")
+        return
+    if not edge_prices:
+        print(Fore.RED + "No overlapping timestamps across assets. Exiting simulation.")
+        return
+
+    results = []
+    for name, simulation in simulations.items():
+        if simulation.rebalance:
+            print(Fore.CYAN + f"\nSimulating Rebalancing Period: {simulation.rebalance_period}")
+            title = f"Rebalance Period: {simulation.rebalance_period}"
+        else:
+            print(Fore.CYAN + "\nSimulating No Rebalancing Scenario")
+            title = "No Rebalancing Simulation"
+        simulation.print_allocations()
+        results.append(report_simulation(name, title, *simulation.get_results()))
+    print_summary(results, pd.concat([edge_prices['first'], edge_prices['last']]), args.initial_capital, args.trading_fee)
+    if args.equity_output:
+        print(Fore.GREEN + f"\nPortfolio values written to {args.equity_output}")
+
 def main():
     args = parse_arguments()
     data_folder = args.data_folder
@@ -165,165 +660,140 @@ def main():
     trading_fee = args.trading_fee
     initial_capital = args.initial_capital
     timestamp_granularity = args.timestamp_granularity
+    profiler = create_profiler(args.profile, trace_memory=args.profile_memory)
+
+    if args.chunksize:
+        if args.sweep or args.gap_report:
+            print(Fore.YELLOW + "--chunksize runs the listed rebalancing periods only; run without it for sweeps and gap reports.")
+            return
+        run_streaming_simulations(symbols, start_date, end_date, rebalance_periods, args, profiler)
+        return
+    if args.equity_output:
+        print(Fore.YELLOW + "--equity_output is only written with --chunksize.")
 
     price_data = {}
     # Load data for each asset
     for symbol in symbols:
-        data = read_historical_data(symbol, data_folder)
-        if data is None or data.empty:
+        # Only load the close prices of the simulation period, already resampled to the
+        # desired timestamp granularity (from the OHLCV pyramid when the cache is used)
+        with profiler.stage('load', symbol):
+            data = read_historical_data(
+                symbol, data_folder, start=start_date, end=end_date,
+                use_cache=not args.no_cache, cache_dir=args.cache_dir,
+                columns=['close'], precision=args.precision,
+                timestamp_granularity=timestamp_granularity
+            )
+        if data is None:
             print(Fore.RED + f"No data for {symbol}. Exiting simulation.")
             return
-        # Filter data within the simulation period
-        data = data[(data.index >= start_date) & (data.index <= end_date)]
-        if data.empty:
+        if data['close'].isna().all():
             print(Fore.RED + f"No data for {symbol} within the simulation period ({start_date.date()} to {end_date.date()}). Exiting simulation.")
             return
-        # Check if data covers the entire simulation period
-        data_start = data.index.min()
-        data_end = data.index.max()
-        if data_start > start_date or data_end < end_date:
+        # Check if data covers the entire simulation period; resampled bars are labelled
+        # with the start of their bin, so the bounds come from the source rows
+        file_start, file_end = read_time_bounds(symbol, data_folder)
+        data_start = max(file_start, start_date)
+        data_end = min(file_end, end_date)
+        if file_start > start_date or file_end < end_date:
             print(Fore.RED + f"Data for {symbol} does not fully cover the simulation period.")
-            print(Fore.YELLOW + f"Data starts on {data_start.date()} and ends on {data_end.date()}.")
+            print(Fore.YELLOW + f"Data starts on {file_start.date()} and ends on {file_end.date()}.")
             return
-        # Resample data to the desired timestamp granularity
-        data = data.resample(timestamp_granularity).last().ffill()
-        price_data[symbol] = data['close']
+        price_data[symbol] = data['close'].ffill()
         print(Fore.GREEN + f"Loaded {symbol} data from {data_start.date()} to {data_end.date()}.")
 
     # Align all dataframes on the same timestamps
-    price_df = pd.DataFrame(price_data)
-    price_df.dropna(inplace=True)
+    if args.gap_report:
+        with profiler.stage('gap_report'):
+            write_gap_report(price_data, args.gap_report)
+    with profiler.stage('align'):
+        price_df = align_series(price_data, how='inner')
     if price_df.empty:
         print(Fore.RED + "No overlapping timestamps across assets. Exiting simulation.")
         return
 
-    # Prepare to store results for each rebalancing period
+    if args.sweep:
+        trading_fees = parse_sweep_values(args.trading_fees) if args.trading_fees else [trading_fee]
+        initial_capitals = parse_sweep_values(args.initial_capitals) if args.initial_capitals else [initial_capital]
+        print(Fore.CYAN + f"\nSweeping {len(rebalance_periods) + 1} rebalancing settings x {len(trading_fees)} fees x {len(initial_capitals)} capitals")
+        with profiler.stage('sweep', tasks=(len(rebalance_periods) + 1) * len(trading_fees) * len(initial_capitals)):
+            summary_df = run_parameter_sweep(
+                price_df[symbols], rebalance_periods, trading_fees, initial_capitals,
+                workers=args.workers, engine=args.engine
+            )
+        print(Fore.MAGENTA + "\n=== Sweep Summary ===")
+        print(summary_df.to_string(index=False))
+        if args.sweep_output:
+            summary_df.to_csv(args.sweep_output, index=False)
+            print(Fore.GREEN + f"Sweep summary written to {args.sweep_output}")
+        return
+
+    # Simulation results are reused while the settings and the data files are unchanged
+    result_cache = None
+    if not args.no_result_cache:
+        result_cache = {
+            'dir': get_result_cache_dir(get_cache_dir(data_folder, args.cache_dir)),
+            'params': {
+                'start_date': str(start_date),
+                'end_date': str(end_date),
+                'timestamp_granularity': timestamp_granularity,
+                'precision': args.precision
+            },
+            'file_paths': [os.path.join(data_folder, f"{symbol}.csv") for symbol in dict.fromkeys(symbols)],
+            'max_bytes': args.result_cache_mb * 2**20
+        }
+
+    # Prepare to store results and portfolio values for each simulation
     results = []
+    portfolio_dfs = {}
 
     # Simulations with rebalancing
     for rebalance_period in rebalance_periods:
         print(Fore.CYAN + f"\nSimulating Rebalancing Period: {rebalance_period}")
-        portfolio_df, initial_val, final_val, total_ret, trade_counts, total_fees = simulate_trading(
+        with profiler.stage('simulate', rebalance_period=rebalance_period, engine=args.engine):
+            portfolio_df, initial_val, final_val, total_ret, trade_counts, total_fees = simulate_trading_cached(
+                result_cache,
+                price_df=price_df,
+                symbols=symbols,
+                rebalance_period=rebalance_period,
+                trading_fee=trading_fee,
+                initial_capital=initial_capital,
+                rebalance=True,
+                engine=args.engine
+            )
+        results.append(report_simulation(
+            f"Rebalance {rebalance_period}", f"Rebalance Period: {rebalance_period}",
+            initial_val, final_val, total_ret, trade_counts, total_fees
+        ))
+        portfolio_dfs[f"Rebalance {rebalance_period}"] = portfolio_df
+
+    # Simulation with no rebalancing
+    print(Fore.CYAN + "\nSimulating No Rebalancing Scenario")
+    with profiler.stage('simulate', rebalance_period=None, engine=args.engine):
+        portfolio_df_no_rebalance, initial_val_nr, final_val_nr, total_ret_nr, trade_counts_nr, total_fees_nr = simulate_trading_cached(
+            result_cache,
             price_df=price_df,
             symbols=symbols,
-            rebalance_period=rebalance_period,
+            rebalance_period=None,  # Not used in simulate_trading when rebalance=False
             trading_fee=trading_fee,
             initial_capital=initial_capital,
-            rebalance=True
+            rebalance=False,
+            engine=args.engine
         )
-        total_trades = sum([sum(tc.values()) for tc in trade_counts.values()])
-        results.append({
-            'Simulation Type': f"Rebalance {rebalance_period}",
-            'Initial Value': initial_val,
-            'Final Value': final_val,
-            'Total Return (%)': total_ret,
-            'Total Trades': total_trades,
-            'Total Fees Paid': total_fees
-        })
-        print(Fore.GREEN + f"Rebalance Period: {rebalance_period}")
-        print(f"Initial Portfolio Value: ${initial_val:,.2f}")
-        print(f"Final Portfolio Value:   ${final_val:,.2f}")
-        print(f"Total Return:            {total_ret:.2f}%")
-        print(f"Total Trades Executed:   {total_trades}")
-        print(f"Total Fees Paid:         ${total_fees:,.2f}\n")
-
-    # Simulation with no rebalancing
-    print(Fore.CYAN + "\nSimulating No Rebalancing Scenario")
-    portfolio_df_no_rebalance, initial_val_nr, final_val_nr, total_ret_nr, trade_counts_nr, total_fees_nr = simulate_trading(
-        price_df=price_df,
-        symbols=symbols,
-        rebalance_period=None,  # Not used in simulate_trading when rebalance=False
-        trading_fee=trading_fee,
-        initial_capital=initial_capital,
-        rebalance=False
-    )
-    total_trades_nr = sum([sum(tc.values()) for tc in trade_counts_nr.values()])
-    results.append({
-        'Simulation Type': "No Rebalancing",
-        'Initial Value': initial_val_nr,
-        'Final Value': final_val_nr,
-        'Total Return (%)': total_ret_nr,
-        'Total Trades': total_trades_nr,
-        'Total Fees Paid': total_fees_nr
-    })
-    print(Fore.GREEN + "No Rebalancing Simulation")
-    print(f"Initial Portfolio Value: ${initial_val_nr:,.2f}")
-    print(f"Final Portfolio Value:   ${final_val_nr:,.2f}")
-    print(f"Total Return:            {total_ret_nr:.2f}%")
-    print(f"Total Trades Executed:   {total_trades_nr}")
-    print(f"Total Fees Paid:         ${total_fees_nr:,.2f}\n")
-
-    # Calculate individual asset performance
-    print(Fore.MAGENTA + "\n=== Individual Asset Performance ===")
-    # Pass trading_fee to the function
-    individual_performance_df = calculate_individual_asset_performance(price_df, initial_capital, trading_fee)
-    # Merge individual asset performance into results
-    for index, row in individual_performance_df.iterrows():
-        total_fees_asset = initial_capital * trading_fee + row['Final Value'] * trading_fee
-        results.append({
-            'Simulation Type': f"Asset {row['Asset']}",
-            'Initial Value': initial_capital,
-            'Final Value': row['Final Value'],
-            'Total Return (%)': row['Total Return (%)'],
-            'Total Trades': 2,  # One buy and one sell
-            'Total Fees Paid': total_fees_asset
-        })
-    # Display individual performance
-    print(individual_performance_df[['Asset', 'Initial Price', 'Final Price', 'Total Return (%)', 'Final Value']].to_string(index=False))
+    results.append(report_simulation(
+        "No Rebalancing", "No Rebalancing Simulation",
+        initial_val_nr, final_val_nr, total_ret_nr, trade_counts_nr, total_fees_nr
+    ))
+    portfolio_dfs["No Rebalancing"] = portfolio_df_no_rebalance
 
-    # Create a summary DataFrame
-    summary_df = pd.DataFrame(results)
-    summary_df = summary_df.sort_values(by='Total Return (%)', ascending=False)
-    print(Fore.MAGENTA + "\n=== Simulation Summary ===")
-    print(summary_df[['Simulation Type', 'Initial Value', 'Final Value', 'Total Return (%)', 'Total Trades', 'Total Fees Paid']].to_string(index=False))
+    with profiler.stage('individual_assets'):
+        print_summary(results, price_df, initial_capital, trading_fee)
 
     # Optionally, plot the portfolio values for each simulation
-    try:
-        import matplotlib.pyplot as plt
-        plt.figure(figsize=(14, 7))
-        # Plot portfolio simulations
-        for result in results:
-            simulation_type = result['Simulation Type']
-            if simulation_type.startswith("Rebalance") or simulation_type == "No Rebalancing":
-                # Re-simulate to get portfolio history for plotting
-                if simulation_type.startswith("Rebalance"):
-                    rebalance_period = simulation_type.split("Rebalance ")[1]
-                    portfolio_df_plot, _, _, _, _, _ = simulate_trading(
-                        price_df=price_df,
-                        symbols=symbols,
-                        rebalance_period=rebalance_period,
-                        trading_fee=trading_fee,
-                        initial_capital=initial_capital,
-                        rebalance=True,
-                        verbose=False  # Suppress output during plotting
-                    )
-                elif simulation_type == "No Rebalancing":
-                    portfolio_df_plot, _, _, _, _, _ = simulate_trading(
-                        price_df=price_df,
-                        symbols=symbols,
-                        rebalance_period=None,
-                        trading_fee=trading_fee,
-                        initial_capital=initial_capital,
-                        rebalance=False,
-                        verbose=False  # Suppress output during plotting
-                    )
-                plt.plot(portfolio_df_plot.index, portfolio_df_plot['total_value'], label=simulation_type)
-        # Plot individual asset performances
-        for symbol in symbols:
-            asset_values = (price_df[symbol] / price_df[symbol].iloc[0]) * initial_capital
-            # Subtract trading fees (assumed on buy and sell)
-            total_fees = initial_capital * trading_fee + asset_values * trading_fee
-            asset_values -= total_fees
-            plt.plot(price_df.index, asset_values, label=f"Asset {symbol}")
-        plt.title('Portfolio and Individual Asset Values Over Time')
-        plt.xlabel('Date')
-        plt.ylabel('Value ($)')
-        plt.legend(title='Simulation Type', loc='upper left')
-        plt.grid(True)
-        plt.tight_layout()
-        plt.show()
-    except ImportError:
-        print(Fore.YELLOW + "Matplotlib not installed. Install it to see the portfolio value plots.")
+    with profiler.stage('plot'):
+        try:
+            plot_simulations(portfolio_dfs, price_df, symbols, initial_capital, trading_fee, args.plot_points, args.plot_output)
+        except ImportError:
+            print(Fore.YELLOW + "Matplotlib not installed. Install it to see the portfolio value plots.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+from utils.bootstrap import average_block_paths, get_ewm_reference
+from utils.ewm import ewm_warmup_length
+
+SPAN = 10
+
+def test_block_paths_match_the_concatenated_paths():
+    rng = np.random.default_rng(11)
+    returns = rng.normal(0, 0.01, (1000, 2)) * np.array([1.0, 3.0])
+    block_length = ewm_warmup_length(SPAN) + 20
+    n_blocks = -(-len(returns) // block_length)
+    # The last block of each path is cut short
+    starts = rng.integers(0, len(returns) - block_length + 1, (4, n_blocks))
+    averages = average_block_paths(returns, get_ewm_reference(returns, SPAN), starts, block_length)
+    for path, path_starts in enumerate(starts):
+        blocks = [returns[start:start + block_length] for start in path_starts]
+        path_returns = np.concatenate(blocks)[:len(returns)]
+        expected = pd.DataFrame(path_returns).ewm(span=SPAN, adjust=False).std().mean().to_numpy()
+        np.testing.assert_allclose(averages[path], expected, rtol=1e-14)
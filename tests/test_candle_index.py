@@ -0,0 +1,56 @@
+import os
+from utils import candle_index
+from utils.candle_index import query_candle_index
+
+HEADER = 'unix,date,symbol,open,high,low,close,Volume BTC\n'
+START_MS = 1640995200000
+
+def format_row(position, high=101.0, low=99.36):
+    # A red candle: it closes below its open
+    unix = START_MS + position * 60000
+    return f"{unix},2022-01-01,BTC/USDT,100.50,{high:.2f},{low:.2f},100.00,1.0\n"
+
+def write_rows(path, rows, mtime_offset=0):
+    with open(path, 'w') as f:
+        f.write(HEADER + ''.join(rows))
+    mtime_ns = 1700000000 * 10 ** 9 + mtime_offset * 10 ** 9
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_appended_rows_are_indexed(tmp_path, monkeypatch):
+    rows = [format_row(position) for position in range(500)]
+    write_rows(tmp_path / 'BTC.csv', rows)
+    assert len(query_candle_index('BTC', str(tmp_path))) == 500
+    # Only the rows from the last indexed candle on are read again
+    starts = []
+    read_historical_data = candle_index.read_historical_data
+
+    def read_from(symbol, data_folder, start=None, **kwargs):
+        starts.append(start)
+        return read_historical_data(symbol, data_folder, start=start, **kwargs)
+
+    monkeypatch.setattr(candle_index, 'read_historical_data', read_from)
+    write_rows(tmp_path / 'BTC.csv', rows + [format_row(500, high=110.0)], mtime_offset=1)
+    candles = query_candle_index('BTC', str(tmp_path))
+    assert len(candles) == 501
+    assert candles['high_low_diff'].max() == 110.0 - 99.36
+    assert None not in starts
+
+def test_edited_old_row_rebuilds_the_index(tmp_path):
+    rows = [format_row(position) for position in range(500)]
+    write_rows(tmp_path / 'BTC.csv', rows)
+    assert round(query_candle_index('BTC', str(tmp_path))['high_low_diff'].max(), 2) == 1.64
+    # The edited row is kept, and a newer row is added after it
+    rows[10] = format_row(10, high=339.36)
+    write_rows(tmp_path / 'BTC.csv', rows + [format_row(500)], mtime_offset=1)
+    candles = query_candle_index('BTC', str(tmp_path))
+    assert len(candles) == 501
+    assert round(candles['high_low_diff'].max(), 2) == 240.0
+
+def test_edited_old_row_rebuilds_the_index_without_cache(tmp_path):
+    rows = [format_row(position) for position in range(500)]
+    write_rows(tmp_path / 'BTC.csv', rows)
+    query_candle_index('BTC', str(tmp_path), use_cache=False)
+    rows[10] = format_row(10, high=339.36)
+    write_rows(tmp_path / 'BTC.csv', rows + [format_row(500)], mtime_offset=1)
+    candles = query_candle_index('BTC', str(tmp_path), use_cache=False)
+    assert round(candles['high_low_diff'].max(), 2) == 240.0
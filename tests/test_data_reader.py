@@ -0,0 +1,96 @@
+import os
+import numpy as np
+import pandas as pd
+from utils import data_reader
+from utils.data_reader import read_historical_data
+from utils.ohlcv_pyramid import aggregate_ohlcv
+
+HEADER = 'unix,date,symbol,open,high,low,close,Volume BTC\n'
+START_MS = 1640995200000
+
+def format_row(position, close):
+    unix = START_MS + position * 60000
+    return f"{unix},2022-01-01,BTC/USDT,{close:.2f},{close + 1:.2f},{close - 1:.2f},{close:.2f},1.0\n"
+
+def write_rows(path, rows, mtime_offset=0):
+    with open(path, 'w') as f:
+        f.write(HEADER + ''.join(rows))
+    # Distinct modification times, so every rewrite is seen as a change of the file
+    mtime_ns = 1700000000 * 10 ** 9 + mtime_offset * 10 ** 9
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def get_rows(n_rows, close=101.41):
+    return [format_row(position, close) for position in range(n_rows)]
+
+def read_closes(data_folder):
+    data = read_historical_data('BTC', str(data_folder), columns=['close'])
+    return data['close'].to_numpy()
+
+def test_appended_rows_are_ingested(tmp_path, monkeypatch):
+    rows = get_rows(500)
+    write_rows(tmp_path / 'BTC.csv', rows)
+    read_closes(tmp_path)
+    # Only the new rows are parsed
+    monkeypatch.setattr(data_reader, 'parse_historical_csv', None)
+    write_rows(tmp_path / 'BTC.csv', rows + [format_row(500, 105.0)], mtime_offset=1)
+    closes = read_closes(tmp_path)
+    assert len(closes) == 501
+    assert closes[-1] == 105.0
+
+def test_same_size_edit_rebuilds_the_cache(tmp_path):
+    rows = get_rows(500)
+    write_rows(tmp_path / 'BTC.csv', rows)
+    read_closes(tmp_path)
+    rows[10] = format_row(10, 101.42)
+    write_rows(tmp_path / 'BTC.csv', rows, mtime_offset=1)
+    closes = read_closes(tmp_path)
+    assert closes[10] == 101.42
+    assert np.all(np.delete(closes, 10) == 101.41)
+
+def test_edit_before_the_appended_rows_rebuilds_the_cache(tmp_path):
+    # The edited row is far from the end of the file, where the new rows are added
+    rows = get_rows(500)
+    write_rows(tmp_path / 'BTC.csv', rows)
+    read_closes(tmp_path)
+    rows[10] = format_row(10, 101.42)
+    write_rows(tmp_path / 'BTC.csv', rows + [format_row(500, 105.0)], mtime_offset=1)
+    closes = read_closes(tmp_path)
+    assert len(closes) == 501
+    assert closes[10] == 101.42
+    assert closes[-1] == 105.0
+
+def test_edit_of_a_newest_first_file_rebuilds_the_cache(tmp_path):
+    # CryptoDataDownload files list the newest row first and grow right after their header
+    rows = get_rows(500)
+    write_rows(tmp_path / 'BTC.csv', rows[::-1])
+    read_closes(tmp_path)
+    rows[10] = format_row(10, 101.42)
+    write_rows(tmp_path / 'BTC.csv', [format_row(500, 105.0)] + rows[::-1], mtime_offset=1)
+    closes = read_closes(tmp_path)
+    assert len(closes) == 501
+    assert closes[10] == 101.42
+    assert closes[-1] == 105.0
+
+def test_edit_next_to_the_appended_rows_of_a_large_file_rebuilds_the_cache(tmp_path):
+    # Only sampled windows of large files are checked, the last one ending at the old last row
+    rows = get_rows(5000)
+    write_rows(tmp_path / 'BTC.csv', rows)
+    read_closes(tmp_path)
+    rows[-1] = format_row(4999, 101.42)
+    write_rows(tmp_path / 'BTC.csv', rows + [format_row(5000, 105.0)], mtime_offset=1)
+    closes = read_closes(tmp_path)
+    assert len(closes) == 5001
+    assert closes[4999] == 101.42
+    assert closes[-1] == 105.0
+
+def test_pyramid_is_updated_after_appended_rows(tmp_path, monkeypatch):
+    # Two days of minutes, then the rest of the last hour and a new day
+    rows = [format_row(position, 100 + position % 37) for position in range(2 * 1440 + 30)]
+    write_rows(tmp_path / 'BTC.csv', rows[:2 * 1440 - 30])
+    read_historical_data('BTC', str(tmp_path), timestamp_granularity='1h')
+    write_rows(tmp_path / 'BTC.csv', rows, mtime_offset=1)
+    monkeypatch.setattr(data_reader, 'build_pyramid', None)
+    for granularity in ('15min', '1h', '1D'):
+        data = read_historical_data('BTC', str(tmp_path), timestamp_granularity=granularity)
+        raw = read_historical_data('BTC', str(tmp_path))
+        pd.testing.assert_frame_equal(data, aggregate_ohlcv(raw, granularity), check_freq=False)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from utils.ewm import ChunkedEWMVolatility, EWMVolatilityEstimator, average_portfolio_volatility
+
+SYMBOLS = ['BTC', 'ETH']
+SPAN = 30
+
+def get_prices(n_rows=500):
+    rng = np.random.default_rng(3)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (n_rows, len(SYMBOLS))), axis=0))
+    # Missing bars, alone and in a run, at different rows for each symbol
+    prices[[5, 120, 121, 122, 300], 0] = np.nan
+    prices[[0, 60, 61, 400], 1] = np.nan
+    return pd.DataFrame(prices, columns=SYMBOLS)
+
+def get_expected_volatility(prices):
+    returns = np.log(prices / prices.shift(1))
+    return returns.ewm(span=SPAN, adjust=False).std().to_numpy()
+
+def test_streaming_estimator_matches_pandas_and_resumes_from_a_snapshot(tmp_path):
+    prices = get_prices()
+    expected = get_expected_volatility(prices)
+    estimator = EWMVolatilityEstimator(SYMBOLS, SPAN)
+    halfway = len(prices) // 2
+    for row in range(halfway):
+        np.testing.assert_allclose(estimator.update(prices.iloc[row].to_numpy()), expected[row], rtol=1e-15)
+    estimator.save(tmp_path / 'estimator.npz')
+    resumed = EWMVolatilityEstimator.load(tmp_path / 'estimator.npz')
+    for row in range(halfway, len(prices)):
+        volatility = estimator.update(prices.iloc[row].to_numpy())
+        np.testing.assert_array_equal(resumed.update(prices.iloc[row].to_numpy()), volatility)
+        np.testing.assert_allclose(volatility, expected[row], rtol=1e-15)
+
+def get_returns(n_rows=2000, n_assets=3):
+    rng = np.random.default_rng(5)
+    return rng.normal(0, 0.01, (n_rows, n_assets)) * np.array([1.0, 2.0, 0.5])[:n_assets]
+
+def test_chunked_volatility_matches_the_whole_series():
+    returns = get_returns()[:, 0]
+    expected = pd.Series(returns).ewm(span=SPAN, adjust=False).std().to_numpy()
+    chunked = ChunkedEWMVolatility(SPAN)
+    volatility = np.concatenate([chunked.update(returns[first:first + 300]) for first in range(0, len(returns), 300)])
+    np.testing.assert_allclose(volatility, expected, rtol=1e-14)
+    np.testing.assert_allclose(chunked.average(), np.nanmean(expected), rtol=1e-14)
+
+def test_portfolio_volatility_matches_the_weighted_returns():
+    returns = get_returns()
+    weights = np.array([[1.0, 0.0, 0.0], [0.5, 0.3, 0.2], [0.2, -0.4, 1.2]])
+    expected = [
+        pd.Series(returns @ portfolio_weights).ewm(span=SPAN, adjust=False).std().mean()
+        for portfolio_weights in weights
+    ]
+    # Small chunks so the covariance recurrence is carried across many of them
+    averages = average_portfolio_volatility(returns, SPAN, weights, max_chunk_elements=900)
+    np.testing.assert_allclose(averages, expected, rtol=1e-14)
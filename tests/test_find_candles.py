@@ -0,0 +1,60 @@
+from find_candles import RANK_KEYS, calculate_differences, find_red_candles, scan_top_candles
+from utils.data_reader import read_historical_data
+
+HEADER = 'unix,date,symbol,open,high,low,close,Volume BTC\n'
+START_MS = 1640995200000
+
+def write_tied_candles(path, n_rows):
+    # Red candles whose close - low differences are 0.63 for most rows and larger for a few
+    with open(path, 'w') as f:
+        f.write(HEADER)
+        for position in range(n_rows):
+            low = 99.37 if position % 7 else 98.00
+            f.write(f"{START_MS + position * 60000},2022-01-01,BTC/USDT,100.50,101.00,{low:.2f},100.00,1.0\n")
+
+def test_chunked_scan_keeps_the_same_tied_candles(tmp_path):
+    write_tied_candles(tmp_path / 'BTC.csv', 300)
+    write_tied_candles(tmp_path / 'ETH.csv', 300)
+    scans = [
+        scan_top_candles(['BTC', 'ETH'], str(tmp_path), 100, RANK_KEYS['diff'], workers=1, chunksize=chunksize, use_cache=False)
+        for chunksize in (None, 17, 64)
+    ]
+    for scan in scans[1:]:
+        for key in RANK_KEYS['diff']:
+            assert scan[key].index.equals(scans[0][key].index)
+            assert scan[key]['symbol'].tolist() == scans[0][key]['symbol'].tolist()
+
+def write_candles(path, n_rows, seed):
+    # Red and green candles of varied sizes
+    with open(path, 'w') as f:
+        f.write(HEADER)
+        for position in range(n_rows):
+            size = (position * seed) % 97 / 100
+            close = 100.00 if (position + seed) % 3 else 101.00
+            f.write(f"{START_MS + position * 60000},2022-01-01,BTC/USDT,100.50,{101 + size:.2f},{99.5 - size:.2f},{close:.2f},1.0\n")
+
+def test_multi_symbol_scan_applies_the_date_range_and_thresholds(tmp_path):
+    write_candles(tmp_path / 'BTC.csv', 400, 5)
+    write_candles(tmp_path / 'ETH.csv', 400, 11)
+    start, end = '2022-01-01 01:00', '2022-01-01 05:00'
+    thresholds = {'close_low_pct': 0.8, 'high_low_pct': 3.0}
+    # The candles of every symbol that a single-symbol query selects
+    expected = []
+    for symbol in ('BTC', 'ETH'):
+        red_candles = calculate_differences(find_red_candles(read_historical_data(symbol, str(tmp_path), start=start, end=end, use_cache=False)))
+        for column, minimum in thresholds.items():
+            red_candles = red_candles[red_candles[column] >= minimum]
+        expected.extend((symbol, timestamp) for timestamp in red_candles.index)
+    options = [{'use_cache': False}, {'use_cache': False, 'chunksize': 50}, {'use_index': True}]
+    for scan_options in options:
+        scan = scan_top_candles(['BTC', 'ETH'], str(tmp_path), 1000, RANK_KEYS['diff'], workers=1, start=start, end=end, thresholds=thresholds, **scan_options)
+        for key in RANK_KEYS['diff']:
+            assert sorted(zip(scan[key]['symbol'], scan[key].index)) == sorted(expected)
+
+def test_scan_keeps_the_earliest_tied_candles_like_a_single_symbol(tmp_path):
+    write_tied_candles(tmp_path / 'BTC.csv', 300)
+    red_candles = calculate_differences(find_red_candles(read_historical_data('BTC', str(tmp_path), use_cache=False)))
+    for chunksize in (None, 17, 64):
+        scan = scan_top_candles(['BTC'], str(tmp_path), 100, RANK_KEYS['diff'], workers=1, chunksize=chunksize, use_cache=False)
+        for key in RANK_KEYS['diff']:
+            assert scan[key].index.equals(red_candles.nlargest(100, key).index)
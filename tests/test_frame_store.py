@@ -0,0 +1,13 @@
+import pytest
+from utils.frame_store import FrameStore
+
+def test_symbols_cannot_leave_the_data_folder(tmp_path):
+    data_folder = tmp_path / 'data'
+    data_folder.mkdir()
+    (tmp_path / 'secret.csv').write_text('unix,close\n1640995200000,1.0\n')
+    store = FrameStore(str(data_folder))
+    for symbol in ('../secret', '..', '/tmp/secret', 'a/../../secret', '.hidden', ''):
+        with pytest.raises(ValueError):
+            store.get(symbol)
+    with pytest.raises(FileNotFoundError):
+        store.get('Binance_BTCUSDT_minute')
@@ -0,0 +1,53 @@
+import io
+from contextlib import redirect_stdout
+import numpy as np
+import pandas as pd
+from portfolio_simulator import StreamingPortfolio, simulate_trading
+
+SYMBOLS = ['BTC', 'ETH', 'SOL']
+
+def get_prices():
+    # Three weeks of hourly random-walk prices with the defects of real aligned data
+    dates = pd.date_range('2022-01-01', periods=21 * 24, freq='1h')
+    rng = np.random.default_rng(7)
+    prices = pd.DataFrame(
+        100 * np.exp(np.cumsum(rng.normal(0, 0.01, (len(dates), len(SYMBOLS))), axis=0)),
+        index=dates, columns=SYMBOLS
+    )
+    # Invalid prices on daily and weekly rebalancing dates and a bar missing for one asset. A
+    # missing price on a rebalancing date makes every later portfolio value NaN, so it comes last.
+    prices.loc['2022-01-04 00:00', 'ETH'] = 0.0
+    prices.loc['2022-01-09 00:00', 'SOL'] = 0.0
+    prices.loc['2022-01-05 13:00', 'ETH'] = np.nan
+    prices.loc['2022-01-16 00:00', 'BTC'] = np.nan
+    # A rebalancing date without any bar
+    return prices.drop(pd.Timestamp('2022-01-06 00:00'))
+
+def run_simulation(prices, rebalance_period, engine):
+    output = io.StringIO()
+    with redirect_stdout(output):
+        result = simulate_trading(prices, SYMBOLS, rebalance_period, 0.001, 10000, rebalance=True, engine=engine)
+    return result, output.getvalue()
+
+def test_vectorized_engine_matches_the_loop():
+    prices = get_prices()
+    for rebalance_period in ('1D', 'W'):
+        (loop_df, *loop_results), loop_output = run_simulation(prices, rebalance_period, 'loop')
+        (vectorized_df, *vectorized_results), vectorized_output = run_simulation(prices, rebalance_period, 'vectorized')
+        assert loop_df.loc[:'2022-01-15', 'total_value'].notna().sum() == len(loop_df.loc[:'2022-01-15']) - 1
+        pd.testing.assert_frame_equal(vectorized_df, loop_df, check_exact=True)
+        np.testing.assert_equal(vectorized_results, loop_results)
+        assert vectorized_output == loop_output
+
+def test_streaming_portfolio_matches_the_vectorized_engine():
+    prices = get_prices()
+    for rebalance_period in ('1D', 'W'):
+        (portfolio_df, *results), _ = run_simulation(prices, rebalance_period, 'vectorized')
+        portfolio = StreamingPortfolio(SYMBOLS, rebalance_period, 0.001, 10000, rebalance=True, verbose=False)
+        # Chunks that do not line up with the rebalancing dates
+        total_values = np.concatenate([
+            portfolio.update(prices.index[first:first + 50], prices.iloc[first:first + 50].to_numpy())
+            for first in range(0, len(prices), 50)
+        ])
+        np.testing.assert_array_equal(total_values, portfolio_df['total_value'].to_numpy())
+        np.testing.assert_equal(list(portfolio.get_results()), results)
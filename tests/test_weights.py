@@ -0,0 +1,15 @@
+import itertools
+import numpy as np
+import pytest
+from utils.weights import simplex_grid
+
+def test_simplex_grid_lists_every_portfolio_once():
+    grid = simplex_grid(4, 0.1)
+    expected = [
+        vector for vector in itertools.product(range(11), repeat=4) if sum(vector) == 10
+    ]
+    np.testing.assert_array_equal(grid, np.array(expected) / 10)
+
+def test_simplex_grid_refuses_oversized_grids():
+    with pytest.raises(ValueError, match='coarser step'):
+        simplex_grid(10, 0.01)
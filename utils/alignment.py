@@ -0,0 +1,124 @@
+from functools import reduce
+import numpy as np
+import pandas as pd
+
+def get_common_dtype(series):
+    # Finest timestamp unit of the series and the value dtype they all fit in
+    index_dtype = np.result_type(*(values.index.dtype for values in series.values()))
+    value_dtype = np.result_type(*(values.dtype for values in series.values()))
+    return index_dtype, value_dtype
+
+def get_timestamps(values, index_dtype, valid_only=True):
+    # Sorted int64 timestamps of a series, optionally only where it has a value
+    timestamps = values.index.values.astype(index_dtype).view(np.int64)
+    if valid_only:
+        timestamps = timestamps[~np.isnan(values.to_numpy(dtype=np.float64))]
+    return timestamps
+
+def contains_timestamps(timestamps, candidates):
+    # Mask of the candidates found in the sorted timestamps
+    positions = np.searchsorted(timestamps, candidates)
+    found = positions < len(timestamps)
+    found[found] = timestamps[positions[found]] == candidates[found]
+    return found
+
+def intersect_timestamps(timestamp_arrays):
+    # Timestamps present in every sorted, duplicate-free array, by binary search of each
+    # array in the next rather than sorting their concatenation
+    return reduce(lambda left, right: left[contains_timestamps(right, left)], timestamp_arrays)
+
+def union_timestamps(timestamp_arrays):
+    # Sorted timestamps present in any of the sorted arrays. A stable sort merges the already
+    # sorted runs of the concatenation, then repeats are dropped.
+    timestamps = np.sort(np.concatenate(timestamp_arrays), kind='stable')
+    if not len(timestamps):
+        return timestamps
+    keep = np.empty(len(timestamps), dtype=bool)
+    keep[0] = True
+    np.not_equal(timestamps[1:], timestamps[:-1], out=keep[1:])
+    return timestamps[keep]
+
+def gather_values(timestamps, values, series_timestamps, out):
+    # Copy the values of one series into out (a column of the aligned matrix) at the rows of
+    # the sorted target timestamps they match; the other rows are left untouched
+    positions = np.searchsorted(timestamps, series_timestamps)
+    matched = positions < len(timestamps)
+    matched[matched] = timestamps[positions[matched]] == series_timestamps[matched]
+    out[positions[matched]] = values[matched]
+
+def align_series(series, how='outer'):
+    # Align {name: Series} on sorted timestamps into one DataFrame, gathering the values into a
+    # single preallocated matrix. 'outer' keeps every timestamp of any series, with NaN where a
+    # series has none, like pd.concat(axis=1). 'inner' keeps the timestamps where every series
+    # has a value, like pd.concat(axis=1).dropna().
+    if how not in ('inner', 'outer'):
+        raise ValueError(f"Unknown alignment '{how}'. Use 'inner' or 'outer'.")
+    names = list(series)
+    index_dtype, value_dtype = get_common_dtype(series)
+    if how == 'outer' and not np.issubdtype(value_dtype, np.floating):
+        value_dtype = np.float64
+    series_timestamps = [get_timestamps(series[name], index_dtype, valid_only=how == 'inner') for name in names]
+    if how == 'inner':
+        timestamps = intersect_timestamps(series_timestamps)
+    else:
+        timestamps = union_timestamps(series_timestamps)
+    # Column-major, so every column is contiguous and becomes the frame's block without a copy
+    matrix = np.full((len(timestamps), len(names)), np.nan, dtype=value_dtype, order='F')
+    for position, name in enumerate(names):
+        values = series[name].to_numpy()
+        if how == 'inner':
+            # Every common timestamp is one of the series' own, so its values are taken directly
+            values = values[~np.isnan(values.astype(np.float64))]
+            matrix[:, position] = values[np.searchsorted(series_timestamps[position], timestamps)]
+        else:
+            gather_values(timestamps, values, series_timestamps[position], matrix[:, position])
+    index = pd.DatetimeIndex(timestamps.view(index_dtype), name=series[names[0]].index.name)
+    return pd.DataFrame(matrix, index=index, columns=names, copy=False)
+
+def get_gap_report(series):
+    # For every series, the ranges of the combined timeline where it has no value. These are the
+    # timestamps an inner alignment drops for every other series too, which is why the overlap
+    # shrinks. Returns one row per (symbol, range) with the first and last missing timestamp
+    # and the number of missing timestamps.
+    index_dtype, _ = get_common_dtype(series)
+    series_timestamps = {name: get_timestamps(values, index_dtype) for name, values in series.items()}
+    timeline = union_timestamps(list(series_timestamps.values()))
+    rows = []
+    for name, timestamps in series_timestamps.items():
+        present = np.zeros(len(timeline), dtype=bool)
+        present[np.searchsorted(timeline, timestamps)] = True
+        missing = np.flatnonzero(~present)
+        if not len(missing):
+            continue
+        # Consecutive positions on the timeline form one range
+        breaks = np.flatnonzero(np.diff(missing) != 1) + 1
+        starts = missing[np.concatenate([[0], breaks])]
+        ends = missing[np.concatenate([breaks - 1, [len(missing) - 1]])]
+        for start, end in zip(starts, ends):
+            rows.append({
+                'symbol': name,
+                'start': timeline[start].view(index_dtype),
+                'end': timeline[end].view(index_dtype),
+                'missing_timestamps': int(end - start + 1)
+            })
+    return pd.DataFrame(rows, columns=['symbol', 'start', 'end', 'missing_timestamps'])
+
+def write_gap_report(series, output_path):
+    # Write the gap report of the series to a CSV file and print a summary line per symbol
+    report = get_gap_report(series)
+    report.to_csv(output_path, index=False)
+    index_dtype, _ = get_common_dtype(series)
+    kept_rows = len(intersect_timestamps([get_timestamps(values, index_dtype) for values in series.values()]))
+    print(f"\nGap report ({len(report)} missing ranges) written to {output_path}")
+    print(f"Timestamps where every symbol has a value: {kept_rows}")
+    for name in series:
+        gaps = report[report['symbol'] == name]
+        if gaps.empty:
+            print(f"{name}: no gaps")
+            continue
+        largest = gaps.loc[gaps['missing_timestamps'].idxmax()]
+        print(
+            f"{name}: {len(gaps)} gaps, {gaps['missing_timestamps'].sum()} timestamps missing; "
+            f"largest from {largest['start']} to {largest['end']} ({largest['missing_timestamps']})"
+        )
+    return report
@@ -0,0 +1,155 @@
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+from utils.ewm import ewm_warmup_length, init_ewm_state, span_to_alpha, update_ewm_state
+from utils.shared_frame import attach_frame, release_frame, share_frame
+
+DEFAULT_BOOTSTRAP_SEED = 0
+# Resampled paths per task; fixed so the results for a seed do not depend on the number of workers
+BOOTSTRAP_TASK_PATHS = 50
+
+def get_block_length(n_rows, spans, block_length=None):
+    # Length of the resampled blocks. It is at least the EWM warmup of the largest span, past
+    # which the volatility inside a block no longer depends on the rows before the block.
+    warmup = ewm_warmup_length(max(spans))
+    if block_length is None:
+        block_length = warmup
+    if block_length < warmup:
+        raise ValueError(f"Bootstrap blocks must be at least {warmup} rows long for span {max(spans)}.")
+    if block_length > n_rows:
+        raise ValueError(f"Bootstrap blocks of {block_length} rows are longer than the {n_rows} aligned returns.")
+    return block_length
+
+def get_ewm_reference(returns, span):
+    # EWM state and volatility of the original returns (rows x columns, without NaN) at every
+    # row, plus the running sum of the volatility for the sums over the rest of each block
+    ewm = pd.DataFrame(returns, copy=False).ewm(span=span, adjust=False)
+    mean = ewm.mean().to_numpy()
+    volatility = ewm.std().to_numpy()
+    alpha = span_to_alpha(span)
+    # Once the weights have converged, the bias correction of adjust=False is 1 / (1 - sum_wt2)
+    sum_wt2 = alpha / (2.0 - alpha)
+    cumulative = np.zeros((len(returns) + 1, returns.shape[1]))
+    np.cumsum(np.nan_to_num(volatility), axis=0, out=cumulative[1:])
+    return {
+        'alpha': alpha,
+        'warmup': ewm_warmup_length(span),
+        'sum_wt2': sum_wt2,
+        'mean': mean,
+        'var': volatility * volatility * (1.0 - sum_wt2),
+        'cumulative': cumulative
+    }
+
+def average_block_paths(returns, reference, starts, block_length):
+    # Average EWM volatility of every column for a batch of resampled paths, each made of the
+    # blocks returns[start:start + block_length] for its row of starts (paths x blocks), cut
+    # to the length of the original series. Past the warmup rows of a block the volatility of
+    # the path is that of the original series, so only the warmup rows are computed, for all
+    # paths and blocks at once, and the rest is read from the running sums.
+    n_rows, n_columns = returns.shape
+    n_paths, n_blocks = starts.shape
+    lengths = np.full(n_blocks, block_length)
+    lengths[-1] = n_rows - (n_blocks - 1) * block_length
+    warmup = min(reference['warmup'], block_length)
+    alpha = reference['alpha']
+    totals = np.zeros((n_paths, n_columns))
+    counts = np.zeros((n_paths, n_columns))
+
+    # The first block starts from an empty state, as the original series does
+    state = init_ewm_state((n_paths, n_columns))
+    for offset in range(min(warmup, lengths[0])):
+        volatility = update_ewm_state(state, returns[starts[:, 0] + offset], alpha)
+        observed = ~np.isnan(volatility)
+        totals += np.where(observed, volatility, 0.0)
+        counts += observed
+
+    # Later blocks start from the state at the end of the block before them, which is the
+    # state of the original series at that row. Without missing values the recurrence of
+    # update_ewm_state reduces to a few in-place operations.
+    if n_blocks > 1:
+        previous_ends = starts[:, :-1] + block_length - 1
+        mean = reference['mean'][previous_ends]
+        var = reference['var'][previous_ends]
+        deviation = np.empty_like(var)
+        volatility = np.empty_like(var)
+        block_totals = np.zeros_like(var)
+        rows = starts[:, 1:].copy()
+        for offset in range(warmup):
+            np.take(returns, rows, axis=0, out=deviation)
+            rows += 1
+            deviation -= mean
+            mean += alpha * deviation
+            deviation *= deviation
+            deviation *= alpha
+            var += deviation
+            var *= 1.0 - alpha
+            np.sqrt(var, out=volatility)
+            # A shorter last block stops early
+            if offset >= lengths[-1]:
+                volatility[:, -1] = 0.0
+            block_totals += volatility
+        counts += (n_blocks - 2) * warmup + min(warmup, lengths[-1])
+        totals += block_totals.sum(axis=1) * np.sqrt(1.0 / (1.0 - reference['sum_wt2']))
+
+    # Rows past the warmup of every block
+    cumulative = reference['cumulative']
+    ends = starts + lengths
+    rest_starts = starts + np.minimum(warmup, lengths)
+    totals += (cumulative[ends] - cumulative[rest_starts]).sum(axis=1)
+    counts += np.maximum(lengths - warmup, 0).sum()
+    return totals / counts
+
+# Returns and EWM references of a bootstrap worker, installed once per worker
+bootstrap_returns = None
+bootstrap_references = None
+
+def load_bootstrap_data(returns, spans):
+    global bootstrap_returns, bootstrap_references
+    bootstrap_returns = returns
+    bootstrap_references = [get_ewm_reference(returns, span) for span in spans]
+
+def init_bootstrap_worker(handle, spans):
+    load_bootstrap_data(np.asarray(attach_frame(handle).to_numpy(), dtype=np.float64), spans)
+
+def run_bootstrap_task(task):
+    # (spans x paths x columns) averages of one batch of resampled paths
+    seed, n_paths, block_length = task
+    n_rows = len(bootstrap_returns)
+    n_blocks = -(-n_rows // block_length)
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, n_rows - block_length + 1, size=(n_paths, n_blocks))
+    return np.stack([
+        average_block_paths(bootstrap_returns, reference, starts, block_length)
+        for reference in bootstrap_references
+    ])
+
+def bootstrap_average_volatilities(returns_df, spans, n_resamples, block_length=None, seed=DEFAULT_BOOTSTRAP_SEED, workers=None):
+    # Moving-block bootstrap of the average EWM volatility of every column of an aligned
+    # returns frame without NaN. Returns the (spans x resamples x columns) averages and the
+    # block length used. Every batch of paths has its own stream spawned from the seed, so
+    # the results are reproducible whatever the number of workers.
+    block_length = get_block_length(len(returns_df), spans, block_length)
+    batch_sizes = [BOOTSTRAP_TASK_PATHS] * (n_resamples // BOOTSTRAP_TASK_PATHS)
+    if n_resamples % BOOTSTRAP_TASK_PATHS:
+        batch_sizes.append(n_resamples % BOOTSTRAP_TASK_PATHS)
+    seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+    tasks = [(task_seed, n_paths, block_length) for task_seed, n_paths in zip(seeds, batch_sizes)]
+    if workers == 1 or len(tasks) <= 1:
+        load_bootstrap_data(returns_df.to_numpy(dtype=np.float64), spans)
+        results = [run_bootstrap_task(task) for task in tasks]
+        return np.concatenate(results, axis=1), block_length
+    # The returns are written to shared memory once; workers attach to them on start-up
+    handle = share_frame(returns_df)
+    try:
+        with multiprocessing.Pool(processes=workers, initializer=init_bootstrap_worker, initargs=(handle, spans)) as pool:
+            chunksize = max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))
+            results = pool.map(run_bootstrap_task, tasks, chunksize=chunksize)
+    finally:
+        release_frame(handle)
+    return np.concatenate(results, axis=1), block_length
+
+def get_confidence_intervals(averages, confidence=0.95):
+    # Percentile intervals, as (spans x columns) lower and upper bounds
+    tail = (1.0 - confidence) / 2.0 * 100
+    return np.percentile(averages, tail, axis=1), np.percentile(averages, 100 - tail, axis=1)
@@ -0,0 +1,163 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from utils.data_cache import get_cache_dir, get_entry_dir, read_cache_build, source_fingerprint, to_index_bound
+from utils.data_reader import read_historical_data
+
+# Bump whenever the on-disk layout or the features change so stale indexes are rebuilt
+CANDLE_INDEX_VERSION = 2
+CANDLE_INDEX_DIRNAME = 'candles'
+META_FILENAME = 'meta.json'
+TIMESTAMPS_FILENAME = 'timestamps.npy'
+OHLC_COLUMNS = ['open', 'high', 'low', 'close']
+FEATURE_COLUMNS = ['close_low_diff', 'close_low_pct', 'high_low_diff', 'high_low_pct']
+
+def get_candle_index_dir(file_path, cache_dir):
+    # Red-candle indexes live next to the data cache entries, one directory per source file
+    return get_entry_dir(file_path, os.path.join(cache_dir, CANDLE_INDEX_DIRNAME))
+
+def read_candle_index_meta(index_dir):
+    try:
+        with open(os.path.join(index_dir, META_FILENAME), 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != CANDLE_INDEX_VERSION:
+        return None
+    return meta
+
+def compute_candle_features(open_, high, low, close):
+    # Same differences and percentages as find_candles.calculate_differences, on NumPy arrays
+    close_low_diff = close - low
+    high_low_diff = high - low
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'close_low_diff': close_low_diff,
+            'close_low_pct': close_low_diff / close * 100,
+            'high_low_diff': high_low_diff,
+            'high_low_pct': high_low_diff / low * 100
+        }
+
+def compute_red_candle_features(data):
+    # Timestamps, OHLC and the find_candles differences and percentages of the red candles
+    # (close < open) of a frame, as a dict of NumPy arrays sorted by time
+    values = {column: pd.to_numeric(data[column], errors='coerce').to_numpy(dtype=np.float64) for column in OHLC_COLUMNS}
+    red = values['close'] < values['open']
+    red &= ~(np.isnan(values['high']) | np.isnan(values['low']))
+    features = {column: values[column][red] for column in OHLC_COLUMNS}
+    features.update(compute_candle_features(*(features[column] for column in OHLC_COLUMNS)))
+    features['timestamps'] = data.index.values[red]
+    return features
+
+def store_candle_index(index_dir, features, meta):
+    # Write into a temporary directory first so readers never see a partial index
+    tmp_dir = f"{index_dir}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    try:
+        np.save(os.path.join(tmp_dir, TIMESTAMPS_FILENAME), features['timestamps'])
+        for column in OHLC_COLUMNS + FEATURE_COLUMNS:
+            np.save(os.path.join(tmp_dir, f"{column}.npy"), features[column])
+        with open(os.path.join(tmp_dir, META_FILENAME), 'w') as f:
+            json.dump(meta, f)
+        if os.path.exists(index_dir):
+            shutil.rmtree(index_dir)
+        os.rename(tmp_dir, index_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+def load_candle_index(index_dir, start=None, end=None, columns=None):
+    # Memory-map the sorted timestamps and copy out only the rows with start <= timestamp <= end
+    timestamps = np.load(os.path.join(index_dir, TIMESTAMPS_FILENAME), mmap_mode='r')
+    first_row = 0
+    last_row = len(timestamps)
+    if start is not None:
+        first_row = int(np.searchsorted(timestamps, to_index_bound(start, timestamps), side='left'))
+    if end is not None:
+        last_row = int(np.searchsorted(timestamps, to_index_bound(end, timestamps), side='right'))
+    rows = slice(first_row, max(first_row, last_row))
+    features = {'timestamps': np.array(timestamps[rows])}
+    for column in columns or OHLC_COLUMNS + FEATURE_COLUMNS:
+        features[column] = np.array(np.load(os.path.join(index_dir, f"{column}.npy"), mmap_mode='r')[rows])
+    return features
+
+def update_candle_index(symbol, data_folder, cache_dir=None, use_cache=True):
+    # Build the red-candle index of a symbol, or bring it up to date. When the source file
+    # has only gained newer rows, the features of those rows alone are computed and appended;
+    # any other change rebuilds the index. Whether the indexed rows are unchanged is decided by
+    # the data cache, which checks them before it appends rows to its entry, so without the
+    # cache every change rebuilds the index. Returns (index_dir, meta).
+    file_path = os.path.join(data_folder, f"{symbol}.csv")
+    cache_dir = get_cache_dir(data_folder, cache_dir)
+    index_dir = get_candle_index_dir(file_path, cache_dir)
+    fingerprint = source_fingerprint(file_path)
+    meta = read_candle_index_meta(index_dir)
+    if meta is not None and meta['source'] == fingerprint:
+        return index_dir, meta
+
+    start = None
+    if meta is not None and meta['last_timestamp'] is not None:
+        start = pd.Timestamp(meta['last_timestamp'])
+    data = read_historical_data(symbol, data_folder, start=start, use_cache=use_cache, cache_dir=cache_dir, columns=OHLC_COLUMNS)
+    if data is None:
+        raise ValueError(f"Could not read data for {symbol}.")
+    # Read after the data, so a cache entry rebuilt meanwhile is not mistaken for the indexed one
+    cache_build = read_cache_build(file_path, cache_dir) if use_cache else None
+    appended = (
+        start is not None
+        and cache_build is not None
+        and cache_build == meta['cache_build']
+        and not data.empty
+        and data.index[0] == start
+        and str(data.index.dtype) == meta['index_dtype']
+    )
+    if start is not None and not appended:
+        # The file was rewritten rather than extended: rebuild from the whole history
+        data = read_historical_data(symbol, data_folder, use_cache=use_cache, cache_dir=cache_dir, columns=OHLC_COLUMNS)
+        if data is None:
+            raise ValueError(f"Could not read data for {symbol}.")
+        cache_build = read_cache_build(file_path, cache_dir) if use_cache else None
+    if appended:
+        # The first row is the last indexed candle, which is already in the index
+        new_features = compute_red_candle_features(data.iloc[1:])
+        features = load_candle_index(index_dir)
+        features = {name: np.concatenate([features[name], new_features[name]]) for name in features}
+        first_timestamp = meta['first_timestamp']
+    else:
+        features = compute_red_candle_features(data)
+        first_timestamp = str(data.index[0]) if not data.empty else None
+    meta = {
+        'version': CANDLE_INDEX_VERSION,
+        'source': fingerprint,
+        'cache_build': cache_build,
+        'index_dtype': str(data.index.dtype),
+        'first_timestamp': first_timestamp,
+        'last_timestamp': str(data.index[-1]) if not data.empty else None,
+        'red_candles': len(features['timestamps'])
+    }
+    store_candle_index(index_dir, features, meta)
+    return index_dir, meta
+
+def select_candle_features(features, thresholds=None):
+    # Red candles of a features dict whose features are at least the given {feature: minimum}
+    # thresholds; candles with an undefined feature are left out
+    if not thresholds:
+        return features
+    selected = np.ones(len(features['timestamps']), dtype=bool)
+    for column, minimum in thresholds.items():
+        if column not in FEATURE_COLUMNS:
+            raise KeyError(f"Unknown candle feature '{column}'. Use one of: {', '.join(FEATURE_COLUMNS)}")
+        selected &= features[column] >= minimum
+    return {name: values[selected] for name, values in features.items()}
+
+def query_candle_index(symbol, data_folder, start=None, end=None, thresholds=None, cache_dir=None, use_cache=True):
+    # Red candles of a symbol with start <= timestamp <= end whose features are at least the
+    # given {feature: minimum} thresholds, as a DataFrame with the columns of calculate_differences
+    index_dir, meta = update_candle_index(symbol, data_folder, cache_dir=cache_dir, use_cache=use_cache)
+    features = select_candle_features(load_candle_index(index_dir, start=start, end=end), thresholds)
+    index = pd.Index(features.pop('timestamps'), name='timestamp')
+    return pd.DataFrame(features, index=index, columns=OHLC_COLUMNS + FEATURE_COLUMNS)
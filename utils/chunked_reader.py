@@ -0,0 +1,139 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from utils.alignment import align_series
+from utils.csv_layout import get_unix_position, is_descending_file, iter_reversed_lines, locate_data_rows, read_unix_value
+from utils.data_reader import FLOAT_COLUMNS, standardize_columns, filter_time_range
+
+DEFAULT_CHUNKSIZE = 1000000
+
+def read_time_bounds(symbol, data_folder):
+    # First and last timestamps of a file from its first and last data rows only
+    file_path = os.path.join(data_folder, f"{symbol}.csv")
+    header, data_start = locate_data_rows(file_path)
+    unix_position = get_unix_position(header)
+    with open(file_path, 'rb') as f:
+        f.seek(data_start)
+        first_line = f.readline()
+        last_line = next(iter_reversed_lines(f, data_start), first_line)
+    if not first_line.strip():
+        return None, None
+    bounds = sorted([read_unix_value(first_line, unix_position), read_unix_value(last_line, unix_position)])
+    return pd.to_datetime(bounds[0], unit='ms'), pd.to_datetime(bounds[1], unit='ms')
+
+def iter_raw_chunks(file_path, chunksize):
+    # Yield parsed CSV chunks in ascending time order without loading the whole file
+    header, data_start = locate_data_rows(file_path)
+    if not is_descending_file(file_path, header, data_start):
+        skiprows = 1 if data_start > len(header) else 0
+        for chunk in pd.read_csv(file_path, skiprows=skiprows, chunksize=chunksize):
+            yield chunk
+        return
+    # Descending files are read backwards so the oldest rows come first
+    with open(file_path, 'rb') as f:
+        lines = []
+        for line in iter_reversed_lines(f, data_start):
+            lines.append(line)
+            if len(lines) == chunksize:
+                yield pd.read_csv(io.BytesIO(header + b'\n'.join(reversed(lines))))
+                lines = []
+        if lines:
+            yield pd.read_csv(io.BytesIO(header + b'\n'.join(reversed(lines))))
+
+def iter_sorted_chunks(file_path, chunksize=DEFAULT_CHUNKSIZE):
+    # Standardized, typed and sorted chunks of consecutive, non-overlapping time ranges
+    last_timestamp = None
+    for chunk in iter_raw_chunks(file_path, chunksize):
+        chunk = standardize_columns(chunk)
+        # Float columns are always floats so that every chunk has the same dtypes
+        for column in FLOAT_COLUMNS:
+            if column in chunk.columns:
+                chunk[column] = chunk[column].astype('float64')
+        chunk = chunk.sort_index()
+        if chunk.empty:
+            continue
+        if last_timestamp is not None and chunk.index[0] < last_timestamp:
+            raise ValueError(f"Rows of {file_path} are not in time order; chunked reading needs a sorted file.")
+        last_timestamp = chunk.index[-1]
+        yield chunk
+
+def get_resample_origin(first_timestamp, timestamp_granularity):
+    # Fixed-length bins start at the midnight of the first timestamp, as with resample's default
+    # origin='start_day' on the whole series; calendar bins (days, weeks...) need no origin
+    if isinstance(to_offset(timestamp_granularity), pd.offsets.Tick):
+        return first_timestamp.normalize()
+    return 'start_day'
+
+def resample_chunks(chunks, timestamp_granularity):
+    # Resample consecutive sorted chunks with .last(). The rows of the last bin of a chunk may
+    # continue in the next one, so they are carried over instead of being emitted early.
+    origin = None
+    carry = None
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        if carry is not None:
+            chunk = pd.concat([carry, chunk])
+        if origin is None:
+            origin = get_resample_origin(chunk.index[0], timestamp_granularity)
+        resampled = chunk.resample(timestamp_granularity, origin=origin).last()
+        # Position of the first row of every bin, whatever side the bins are closed and labelled on
+        first_positions = pd.Series(np.arange(len(chunk)), index=chunk.index).resample(
+            timestamp_granularity, origin=origin
+        ).first()
+        carry = chunk.iloc[int(first_positions.iloc[-1]):]
+        if len(resampled) > 1:
+            yield resampled.iloc[:-1]
+    if carry is not None:
+        yield carry.resample(timestamp_granularity, origin=origin).last()
+
+def iter_historical_data(symbol, data_folder, chunksize=DEFAULT_CHUNKSIZE, start=None, end=None, timestamp_granularity=None):
+    # Streaming counterpart of read_historical_data: yields sorted chunks of at most chunksize
+    # source rows, optionally limited to start <= timestamp <= end and resampled on the fly.
+    # Errors are raised to the caller while iterating.
+    file_path = os.path.join(data_folder, f"{symbol}.csv")
+
+    def iter_filtered_chunks():
+        for chunk in iter_sorted_chunks(file_path, chunksize):
+            if end is not None and chunk.index[0] > pd.Timestamp(end):
+                break
+            chunk = filter_time_range(chunk, start, end)
+            if not chunk.empty:
+                yield chunk
+
+    if timestamp_granularity is None:
+        return iter_filtered_chunks()
+    return resample_chunks(iter_filtered_chunks(), timestamp_granularity)
+
+def iter_aligned_chunks(streams, how='outer'):
+    # Merge several streams of sorted chunks ({name: iterator of Series}) into chunks of one
+    # frame with a column per stream, on the union of their timestamps or, with how='inner',
+    # on the timestamps where every stream has a value. Only timestamps that every unfinished
+    # stream has already reached are emitted, so each stream buffers at most about one chunk.
+    buffers = {name: None for name in streams}
+    finished = set()
+    while True:
+        for name, stream in streams.items():
+            if buffers[name] is None and name not in finished:
+                chunk = next(stream, None)
+                if chunk is None:
+                    finished.add(name)
+                else:
+                    buffers[name] = chunk
+        pending = [name for name in streams if buffers[name] is not None]
+        if not pending:
+            return
+        unfinished = [name for name in streams if name not in finished]
+        if unfinished:
+            cutoff = min(buffers[name].index[-1] for name in unfinished)
+        else:
+            cutoff = max(buffers[name].index[-1] for name in pending)
+        pieces = {}
+        for name in pending:
+            buffered = buffers[name]
+            pieces[name] = buffered[buffered.index <= cutoff]
+            rest = buffered[buffered.index > cutoff]
+            buffers[name] = rest if not rest.empty else None
+        yield align_series(pieces, how=how)
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import numpy as np
+
+READ_BLOCK_SIZE = 1 << 20
+
+def locate_data_rows(file_path):
+    # Return the CSV header line and the byte offset of the first data row
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        if b'CryptoDataDownload' in header:
+            header = f.readline()
+        return header, f.tell()
+
+def iter_reversed_lines(f, data_start, block_size=READ_BLOCK_SIZE):
+    # Yield the non-empty lines after data_start, last line first, reading fixed-size blocks backwards
+    f.seek(0, os.SEEK_END)
+    position = f.tell()
+    remainder = b''
+    while position > data_start:
+        read_size = min(block_size, position - data_start)
+        position -= read_size
+        f.seek(position)
+        lines = (f.read(read_size) + remainder).split(b'\n')
+        # The first piece may be the end of a line that starts in the previous block
+        remainder = lines[0]
+        for line in reversed(lines[1:]):
+            if line.strip():
+                yield line
+    if remainder.strip():
+        yield remainder
+
+def read_unix_value(line, unix_position):
+    return int(float(line.split(b',')[unix_position]))
+
+def get_unix_position(header):
+    columns = [column.strip().lower() for column in header.decode('utf-8').split(',')]
+    if 'unix' not in columns:
+        raise KeyError("'unix' column is missing from the header.")
+    return columns.index('unix')
+
+def is_descending_file(file_path, header, data_start):
+    # CryptoDataDownload files list the newest row first
+    unix_position = get_unix_position(header)
+    with open(file_path, 'rb') as f:
+        f.seek(data_start)
+        first_line = f.readline()
+        last_line = next(iter_reversed_lines(f, data_start), first_line)
+    if not first_line.strip():
+        return False
+    return read_unix_value(first_line, unix_position) > read_unix_value(last_line, unix_position)
+
+# Bytes hashed per window of a file's rows, and the number of windows spread over the rows.
+# The first and last windows cover both ends, where newest-first and newest-last files grow.
+WINDOW_BYTES = 4096
+SAMPLED_WINDOWS = 16
+
+def get_window_bounds(data_length):
+    # (offset, length) of the windows hashed in rows of data_length bytes, relative to the first
+    # row. Rows that fit in the windows are hashed whole.
+    if data_length <= SAMPLED_WINDOWS * WINDOW_BYTES:
+        return [(0, data_length)]
+    offsets = np.linspace(0, data_length - WINDOW_BYTES, SAMPLED_WINDOWS).astype(np.int64)
+    return [(int(offset), WINDOW_BYTES) for offset in offsets]
+
+def hash_windows(f, data_start, data_length):
+    # [offset, length, sha1] of every window of the rows that start at data_start
+    windows = []
+    for offset, length in get_window_bounds(data_length):
+        f.seek(data_start + offset)
+        windows.append([offset, length, hashlib.sha1(f.read(length)).hexdigest()])
+    return windows
+
+def get_file_layout(f, header, data_start, size, descending):
+    # Describe a file of size bytes: its header, where its rows start, which end grows and the
+    # hashes of a fixed number of windows of its rows, including both ends, so that checking
+    # them costs the same whatever the size of the file
+    return {
+        'header': header.decode('utf-8'),
+        'data_start': data_start,
+        'size': size,
+        'descending': descending,
+        'windows': hash_windows(f, data_start, size - data_start)
+    }
+
+def read_file_layout(file_path):
+    # Layout of a file as it is now; recorded before the file is parsed so rows appended
+    # during the parse are read again, rather than skipped, by the next read_appended_rows
+    header, data_start = locate_data_rows(file_path)
+    descending = is_descending_file(file_path, header, data_start)
+    with open(file_path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        return get_file_layout(f, header, data_start, size, descending)
+
+def read_appended_rows(file_path, layout):
+    # Rows added to a file since layout was recorded, as (header line, row bytes, new layout).
+    # Newest-last files grow at their end; newest-first files (CryptoDataDownload) grow right
+    # after their header. The recorded windows of the old rows must be unchanged; only they
+    # and the new rows are read, so the cost follows the number of new rows. Returns None when
+    # the file changed in any other way that the windows reveal. Edits of old rows outside the
+    # windows of a large file are not detected. A partially written last line of a newest-last
+    # file is left for the next call.
+    if not layout.get('windows'):
+        return None
+    header, data_start = locate_data_rows(file_path)
+    if header.decode('utf-8') != layout['header']:
+        return None
+    with open(file_path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        old_data_length = layout['size'] - layout['data_start']
+        if layout['descending']:
+            # The old rows now end the file
+            old_data_start = size - old_data_length
+            if old_data_start < data_start:
+                return None
+            new_rows_start, new_rows_end = data_start, old_data_start
+        else:
+            old_data_start = data_start
+            if data_start != layout['data_start'] or size < layout['size']:
+                return None
+            new_rows_start, new_rows_end = layout['size'], size
+            if old_data_length > 0:
+                # Rows appended to a last line without a line break would be glued to it
+                f.seek(layout['size'] - 1)
+                if f.read(1) != b'\n':
+                    return None
+        if hash_windows(f, old_data_start, old_data_length) != layout['windows']:
+            return None
+        f.seek(new_rows_start)
+        rows = f.read(new_rows_end - new_rows_start)
+        if layout['descending']:
+            if rows and not rows.endswith(b'\n'):
+                return None
+        else:
+            # Only complete lines are taken
+            rows = rows[:rows.rfind(b'\n') + 1]
+            size = layout['size'] + len(rows)
+        new_layout = get_file_layout(f, header, data_start, size, layout['descending'])
+    return header, rows, new_layout
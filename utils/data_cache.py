@@ -0,0 +1,308 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+
+# Bump whenever the on-disk layout changes so stale caches are rebuilt
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIRNAME = '.cache'
+META_FILENAME = 'meta.json'
+INDEX_FILENAME = 'index.npy'
+# String columns with at most this many distinct values reuse their codes when rows are appended
+STRING_LOOKUP_LIMIT = 4096
+
+def get_cache_dir(data_folder, cache_dir=None):
+    # Default to a hidden folder next to the CSV files
+    if cache_dir is None:
+        cache_dir = os.path.join(data_folder, DEFAULT_CACHE_DIRNAME)
+    return cache_dir
+
+def source_fingerprint(file_path):
+    # Identify a source file by its path, size and modification time
+    stat = os.stat(file_path)
+    return {
+        'path': os.path.abspath(file_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns
+    }
+
+def get_entry_dir(file_path, cache_dir):
+    # One directory per source file, named after the file and a hash of its absolute path
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    path_hash = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{name}-{path_hash}")
+
+def read_cache_meta(entry_dir):
+    meta_path = os.path.join(entry_dir, META_FILENAME)
+    try:
+        with open(meta_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def is_cache_valid(meta, fingerprint):
+    return (
+        meta is not None
+        and meta.get('version') == CACHE_VERSION
+        and meta.get('source') == fingerprint
+    )
+
+def read_cache_build(file_path, cache_dir):
+    # Build id of the cache entry of a source file, or None when the entry is missing or stale.
+    # It changes whenever the entry is rebuilt, and stays the same while rows are only appended.
+    meta = read_cache_meta(get_entry_dir(file_path, cache_dir))
+    if not is_cache_valid(meta, source_fingerprint(file_path)):
+        return None
+    return meta.get('build_id')
+
+def column_filename(position, part='values'):
+    return f"col_{position}_{part}.npy"
+
+def store_cached_frame(file_path, cache_dir, data, layout=None, parent_build=None):
+    # layout optionally records how the source file was laid out when it was parsed
+    # (see utils.csv_layout) so that rows appended to it later can be ingested alone.
+    # parent_build optionally records the build id of the entry data was derived from.
+    fingerprint = source_fingerprint(file_path)
+    entry_dir = get_entry_dir(file_path, cache_dir)
+    # Write into a temporary directory first so readers never see a partial entry
+    tmp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    try:
+        columns = []
+        for position, column in enumerate(data.columns):
+            values = data[column].to_numpy()
+            kind = 'numeric'
+            if values.dtype == object or not np.issubdtype(values.dtype, np.number):
+                # Strings are dictionary-encoded; the distinct values are stored as
+                # fixed-width unicode so nothing needs to be unpickled on load
+                codes, uniques = pd.factorize(values)
+                np.save(os.path.join(tmp_dir, column_filename(position, 'codes')), codes.astype(np.int32))
+                values = np.asarray(uniques, dtype=str)
+                kind = 'string'
+            np.save(os.path.join(tmp_dir, column_filename(position)), values)
+            columns.append({'name': column, 'dtype': str(data[column].dtype), 'kind': kind})
+        # Store the sorted timestamp index as raw int64 so it can be memory-mapped
+        np.save(os.path.join(tmp_dir, INDEX_FILENAME), data.index.asi8)
+        meta = {
+            'version': CACHE_VERSION,
+            'source': fingerprint,
+            # Kept by appends, so indexes derived from the entry can tell whether its rows were replaced
+            'build_id': uuid.uuid4().hex,
+            'index_name': data.index.name,
+            'index_dtype': str(data.index.dtype),
+            'rows': len(data),
+            'last_timestamp': str(data.index[-1]) if len(data) else None,
+            'layout': layout,
+            'parent_build': parent_build,
+            'columns': columns
+        }
+        with open(os.path.join(tmp_dir, META_FILENAME), 'w') as f:
+            json.dump(meta, f)
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir)
+        os.rename(tmp_dir, entry_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+def read_npy_header(f):
+    # Shape and dtype of an open .npy file, leaving f at the start of its data
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    if fortran_order or len(shape) != 1:
+        raise ValueError(f"{f.name} is not a one-dimensional array.")
+    return version, shape[0], dtype
+
+def read_npy_info(path):
+    with open(path, 'rb') as f:
+        _, length, dtype = read_npy_header(f)
+    return length, dtype
+
+def append_npy(path, values):
+    # Append values to a one-dimensional .npy file in place. The data is written before the
+    # header so that readers see the old length until the append is complete. np.save leaves
+    # room in the header for the length to grow, so the header keeps its size.
+    with open(path, 'r+b') as f:
+        version, length, dtype = read_npy_header(f)
+        data_start = f.tell()
+        if values.dtype != dtype:
+            raise ValueError(f"Cannot append {values.dtype} values to {path} ({dtype}).")
+        header = io.BytesIO()
+        header_data = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (length + len(values),)}
+        if version == (1, 0):
+            np.lib.format.write_array_header_1_0(header, header_data)
+        else:
+            np.lib.format.write_array_header_2_0(header, header_data)
+        if header.tell() != data_start:
+            raise ValueError(f"The header of {path} cannot grow in place.")
+        f.seek(data_start + length * dtype.itemsize)
+        f.write(np.ascontiguousarray(values).tobytes())
+        f.flush()
+        f.seek(0)
+        f.write(header.getvalue())
+
+def encode_appended_strings(values, uniques):
+    # Codes of appended string values and the distinct values to add to the stored ones. The
+    # stored values are only searched when there are few of them (a symbol column); those of
+    # high-cardinality columns (dates) only grow, so their new values are appended as they come.
+    codes, new_values = pd.factorize(values)
+    new_values = np.asarray(new_values, dtype=object)
+    if len(uniques) <= STRING_LOOKUP_LIMIT:
+        existing = pd.Index(np.asarray(uniques).astype(object)).get_indexer(new_values)
+        found = existing >= 0
+        mapping = np.where(found, existing, len(uniques) + np.cumsum(~found) - 1)
+        new_values = new_values[~found]
+    else:
+        mapping = len(uniques) + np.arange(len(new_values))
+    codes = np.where(codes >= 0, mapping[np.maximum(codes, 0)], -1)
+    return codes.astype(np.int32), np.asarray(new_values, dtype=str)
+
+def write_cache_meta(entry_dir, meta):
+    # Replace the metadata atomically
+    meta_path = os.path.join(entry_dir, META_FILENAME)
+    tmp_path = f"{meta_path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+def append_cached_frame(file_path, cache_dir, data, fingerprint, layout):
+    # Append rows that are newer than every cached row to an entry in place, and mark the entry
+    # as matching fingerprint and layout. Every column file is extended before the index and
+    # the metadata, so readers keep seeing the old rows until the append is complete. Raises
+    # ValueError, before writing anything, when the rows do not fit the entry; it must then be
+    # rebuilt.
+    entry_dir = get_entry_dir(file_path, cache_dir)
+    meta = read_cache_meta(entry_dir)
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        raise ValueError(f"No cache entry to append to for {file_path}.")
+    index_path = os.path.join(entry_dir, INDEX_FILENAME)
+    appends = []
+    if len(data):
+        if list(data.columns) != [column['name'] for column in meta['columns']]:
+            raise ValueError("The appended rows have different columns.")
+        if str(data.index.dtype) != meta['index_dtype']:
+            raise ValueError("The appended rows have a different timestamp unit.")
+        # An interrupted append leaves files longer than the index
+        if read_npy_info(index_path)[0] != meta['rows']:
+            raise ValueError("The cache entry was not fully written.")
+        for position, column in enumerate(meta['columns']):
+            values = data[column['name']].to_numpy()
+            values_path = os.path.join(entry_dir, column_filename(position))
+            length, dtype = read_npy_info(values_path)
+            if column['kind'] == 'string':
+                codes_path = os.path.join(entry_dir, column_filename(position, 'codes'))
+                if read_npy_info(codes_path)[0] != meta['rows']:
+                    raise ValueError("The cache entry was not fully written.")
+                uniques = np.load(values_path, mmap_mode='r') if length else np.empty(0, dtype=dtype)
+                codes, new_uniques = encode_appended_strings(values, uniques)
+                if new_uniques.dtype.itemsize > dtype.itemsize:
+                    raise ValueError(f"Values of '{column['name']}' are longer than the stored ones.")
+                appends.append((codes_path, codes))
+                appends.append((values_path, new_uniques.astype(dtype)))
+                continue
+            if length != meta['rows']:
+                raise ValueError("The cache entry was not fully written.")
+            if values.dtype != dtype:
+                if not np.can_cast(values.dtype, dtype, casting='safe'):
+                    raise ValueError(f"Values of '{column['name']}' do not fit the stored {dtype} column.")
+                values = values.astype(dtype)
+            appends.append((values_path, values))
+    for path, values in appends:
+        append_npy(path, values)
+    if len(data):
+        append_npy(index_path, data.index.asi8)
+        meta['rows'] += len(data)
+        meta['last_timestamp'] = str(data.index[-1])
+    meta['source'] = fingerprint
+    meta['layout'] = layout
+    write_cache_meta(entry_dir, meta)
+
+def replace_cached_tail(file_path, cache_dir, data, fingerprint):
+    # Like append_cached_frame, but the first row of data may share the timestamp of the last
+    # cached row, which it then overwrites in place. Aggregated entries use it to update their
+    # last bin, which may have been partial. Only entries with numeric columns can be updated.
+    entry_dir = get_entry_dir(file_path, cache_dir)
+    meta = read_cache_meta(entry_dir)
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        raise ValueError(f"No cache entry to update for {file_path}.")
+    if len(data) and meta['rows']:
+        last_timestamp = pd.Timestamp(meta['last_timestamp'])
+        if data.index[0] < last_timestamp:
+            raise ValueError("The rows to store start before the last cached row.")
+        if data.index[0] == last_timestamp:
+            if list(data.columns) != [column['name'] for column in meta['columns']]:
+                raise ValueError("The replacing rows have different columns.")
+            replacements = []
+            for position, column in enumerate(meta['columns']):
+                values_path = os.path.join(entry_dir, column_filename(position))
+                length, dtype = read_npy_info(values_path)
+                if column['kind'] != 'numeric':
+                    raise ValueError(f"The last value of '{column['name']}' cannot be replaced.")
+                if length != meta['rows']:
+                    raise ValueError("The cache entry was not fully written.")
+                value = data[column['name']].to_numpy()[:1]
+                if not np.can_cast(value.dtype, dtype, casting='safe'):
+                    raise ValueError(f"Values of '{column['name']}' do not fit the stored {dtype} column.")
+                replacements.append((values_path, value.astype(dtype)))
+            for values_path, value in replacements:
+                with open(values_path, 'r+b') as f:
+                    _, length, dtype = read_npy_header(f)
+                    f.seek(f.tell() + (length - 1) * dtype.itemsize)
+                    f.write(value.tobytes())
+            data = data.iloc[1:]
+    append_cached_frame(file_path, cache_dir, data, fingerprint, meta['layout'])
+
+def to_index_bound(bound, index_values):
+    # Express a timestamp bound in the unit of the cached index
+    return np.datetime64(pd.Timestamp(bound)).astype(index_values.dtype)
+
+def decode_strings(uniques, codes, dtype):
+    if len(codes) < len(uniques):
+        # Small slices of high-cardinality columns only decode the values they use
+        values = np.asarray(uniques[np.maximum(codes, 0)]).astype(object)
+        values[codes < 0] = None
+        return pd.array(values, dtype=dtype)
+    uniques = pd.array(np.asarray(uniques).astype(object), dtype=dtype)
+    return uniques.take(codes, allow_fill=True)
+
+def load_cached_frame(file_path, cache_dir, start=None, end=None, columns=None, dtypes=None):
+    # columns optionally limits the loaded columns; dtypes maps column names to the dtype
+    # their selected rows are copied into
+    entry_dir = get_entry_dir(file_path, cache_dir)
+    meta = read_cache_meta(entry_dir)
+    if not is_cache_valid(meta, source_fingerprint(file_path)):
+        return None
+    # Memory-map the sorted index and locate the requested rows by binary search
+    index_values = np.load(os.path.join(entry_dir, INDEX_FILENAME), mmap_mode='r').view(meta['index_dtype'])
+    first_row = 0
+    last_row = len(index_values)
+    if start is not None:
+        first_row = int(np.searchsorted(index_values, to_index_bound(start, index_values), side='left'))
+    if end is not None:
+        last_row = int(np.searchsorted(index_values, to_index_bound(end, index_values), side='right'))
+    last_row = max(first_row, last_row)
+    rows = slice(first_row, last_row)
+    # Only the selected rows are copied out of the memory-mapped columns
+    index = pd.Index(np.array(index_values[rows]), name=meta['index_name'])
+    frame_columns = {}
+    for position, column in enumerate(meta['columns']):
+        if columns is not None and column['name'] not in columns:
+            continue
+        values = np.load(os.path.join(entry_dir, column_filename(position)), mmap_mode='r')
+        if column['kind'] == 'string':
+            codes = np.load(os.path.join(entry_dir, column_filename(position, 'codes')), mmap_mode='r')
+            frame_columns[column['name']] = decode_strings(values, np.array(codes[rows]), column['dtype'])
+        elif dtypes is not None and column['name'] in dtypes:
+            frame_columns[column['name']] = values[rows].astype(dtypes[column['name']])
+        else:
+            frame_columns[column['name']] = np.array(values[rows])
+    return pd.DataFrame(frame_columns, index=index, copy=False)
@@ -1,44 +1,212 @@
+import io
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 import pandas as pd
+from utils.csv_layout import read_appended_rows, read_file_layout
+from utils.data_cache import append_cached_frame, get_cache_dir, get_entry_dir, load_cached_frame, read_cache_meta, source_fingerprint, store_cached_frame
+from utils.ohlcv_pyramid import OHLCV_AGGREGATIONS, aggregate_ohlcv, build_pyramid, choose_pyramid_level, is_pyramid_valid, read_pyramid_data, update_pyramid
 
-def read_historical_data(symbol, data_folder):
+# Map the columns to standard names
+COLUMN_MAPPING = {
+    'unix': 'unix',
+    'date': 'date',
+    'symbol': 'symbol',
+    'open': 'open',
+    'high': 'high',
+    'low': 'low',
+    'close': 'close',
+    'volume': 'volume',
+    'volume btc': 'volume',
+    'volume usdt': 'volume_from',
+    'volume_from': 'volume_from',
+    'tradecount': 'tradecount'
+}
+
+# Price and volume columns, stored with the requested floating-point precision
+FLOAT_COLUMNS = ('open', 'high', 'low', 'close', 'volume', 'volume_from')
+PRECISIONS = ('float32', 'float64')
+
+def has_url_header(file_path):
+    # CryptoDataDownload files start with a line containing their URL
+    with open(file_path, 'r') as f:
+        first_line = f.readline()
+    return 'CryptoDataDownload' in first_line
+
+def standardize_columns(data):
+    # Standardize column names to lowercase
+    data.columns = data.columns.str.lower()
+    data = data.rename(columns=COLUMN_MAPPING)
+    # Check if 'unix' column exists
+    if 'unix' not in data.columns:
+        raise KeyError("'unix' column is missing after renaming.")
+    # Convert 'unix' column to datetime
+    data['timestamp'] = pd.to_datetime(data['unix'], unit='ms')
+    # Set 'timestamp' as the index
+    data.set_index('timestamp', inplace=True)
+    return data
+
+def get_standard_names(file_path, skiprows):
+    # Map each raw header name to its standardized column name
+    header = pd.read_csv(file_path, skiprows=skiprows, nrows=0).columns
+    return {raw: COLUMN_MAPPING.get(raw.lower(), raw.lower()) for raw in header}
+
+def parse_historical_csv(file_path, columns=None, precision=None):
+    # Read the CSV file, skipping the first line if it contains the URL
+    skiprows = 1 if has_url_header(file_path) else 0
+    read_options = {}
+    if columns is not None or precision is not None:
+        # Only parse the requested columns (and 'unix' for the index), straight into their final dtype
+        standard_names = get_standard_names(file_path, skiprows)
+        if columns is not None:
+            wanted = set(columns) | {'unix'}
+            standard_names = {raw: name for raw, name in standard_names.items() if name in wanted}
+            read_options['usecols'] = list(standard_names)
+        if precision is not None:
+            read_options['dtype'] = {raw: precision for raw, name in standard_names.items() if name in FLOAT_COLUMNS}
+    data = pd.read_csv(file_path, skiprows=skiprows, **read_options)
+    data = standardize_columns(data)
+    # Sort the data by index
+    data = data.sort_index()
+    return select_columns(data, columns, precision)
+
+def check_precision(precision):
+    if precision is not None and precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}'. Use one of: {', '.join(PRECISIONS)}.")
+
+def select_columns(data, columns=None, precision=None):
+    # Keep only the requested columns, in the requested order, and cast the float columns
+    check_precision(precision)
+    if columns is not None:
+        missing = [column for column in columns if column not in data.columns]
+        if missing:
+            raise KeyError(f"Columns not found: {', '.join(missing)}")
+        data = data[list(columns)]
+    if precision is not None:
+        casts = {column: precision for column in data.columns if column in FLOAT_COLUMNS and data[column].dtype != precision}
+        if casts:
+            data = data.astype(casts)
+    return data
+
+def filter_time_range(data, start=None, end=None):
+    # Keep rows with start <= timestamp <= end on an already sorted frame
+    if start is not None:
+        data = data[data.index >= pd.Timestamp(start)]
+    if end is not None:
+        data = data[data.index <= pd.Timestamp(end)]
+    return data
+
+def ingest_appended_rows(file_path, cache_dir):
+    # Bring a stale cache entry up to date when its source file has only gained rows since it
+    # was stored: sampled windows of the cached rows are checked against their hashes, only the
+    # new bytes are parsed, and the rows newer than the last cached timestamp are appended. Returns False
+    # when the entry has to be rebuilt from the whole file.
+    meta = read_cache_meta(get_entry_dir(file_path, cache_dir))
+    if meta is None or not meta.get('layout') or meta.get('last_timestamp') is None:
+        return False
+    try:
+        fingerprint = source_fingerprint(file_path)
+        # A file rewritten with the same size was edited, not extended
+        if fingerprint['size'] == meta['source']['size']:
+            return False
+        appended = read_appended_rows(file_path, meta['layout'])
+        if appended is None:
+            return False
+        header, rows, layout = appended
+        data = pd.DataFrame()
+        if rows.strip():
+            data = standardize_columns(pd.read_csv(io.BytesIO(header + rows))).sort_index()
+            # Rows that an earlier read parsed while they were being appended are already cached
+            data = data[data.index > pd.Timestamp(meta['last_timestamp'])]
+        append_cached_frame(file_path, cache_dir, data, fingerprint, layout)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Rebuilding the cache of {file_path}: {e}")
+        return False
+    return True
+
+def load_raw_data(file_path, cache_dir, start=None, end=None, use_cache=True, columns=None, precision=None):
+    # A missing source file is reported by the CSV parser below
+    if use_cache and os.path.exists(file_path):
+        try:
+            dtypes = {column: precision for column in FLOAT_COLUMNS} if precision is not None else None
+            data = load_cached_frame(file_path, cache_dir, start=start, end=end, columns=columns, dtypes=dtypes)
+            if data is None and ingest_appended_rows(file_path, cache_dir):
+                data = load_cached_frame(file_path, cache_dir, start=start, end=end, columns=columns, dtypes=dtypes)
+        except Exception as e:
+            print(f"Ignoring unreadable cache for {file_path}: {e}")
+            data = None
+        if data is not None:
+            return select_columns(data, columns, precision)
+    if not use_cache:
+        return filter_time_range(parse_historical_csv(file_path, columns, precision), start, end)
+    # The layout is read before parsing so that rows appended meanwhile are ingested next time
+    try:
+        layout = read_file_layout(file_path)
+    except Exception:
+        # Such files are always parsed in full when they change
+        layout = None
+    # The cache keeps every column, so the first read parses the whole file
+    data = parse_historical_csv(file_path)
+    # A read-only data folder should not prevent loading the data
+    try:
+        store_cached_frame(file_path, cache_dir, data, layout=layout)
+    except OSError as e:
+        print(f"Could not write cache for {file_path}: {e}")
+    return select_columns(filter_time_range(data, start, end), columns, precision)
+
+def load_resampled_data(file_path, cache_dir, timestamp_granularity, start=None, end=None, use_cache=True, columns=None, precision=None):
+    if columns is not None:
+        unknown = [column for column in columns if column not in OHLCV_AGGREGATIONS]
+        if unknown:
+            raise KeyError(f"Columns cannot be resampled: {', '.join(unknown)}")
+
+    def load_raw(range_start, range_end, raw_columns):
+        return load_raw_data(file_path, cache_dir, range_start, range_end, use_cache, raw_columns)
+
+    if not use_cache or choose_pyramid_level(timestamp_granularity) is None:
+        return select_columns(aggregate_ohlcv(load_raw(start, end, columns), timestamp_granularity), columns, precision)
+    if not is_pyramid_valid(file_path, cache_dir) and not update_pyramid(file_path, cache_dir, load_raw):
+        data = load_raw(None, None, None)
+        try:
+            build_pyramid(file_path, cache_dir, data)
+        except OSError as e:
+            print(f"Could not write the pyramid for {file_path}: {e}")
+            data = aggregate_ohlcv(filter_time_range(data, start, end), timestamp_granularity)
+            return select_columns(data, columns, precision)
+    data = read_pyramid_data(file_path, cache_dir, load_raw, timestamp_granularity, start=start, end=end, columns=columns)
+    return select_columns(data, columns, precision)
+
+def read_historical_data(symbol, data_folder, start=None, end=None, use_cache=True, cache_dir=None, columns=None, precision=None, timestamp_granularity=None):
+    # columns limits the frame to a list of standardized column names (e.g. ['close']) and
+    # precision ('float32' or 'float64') sets the dtype of the price and volume columns.
+    # timestamp_granularity returns OHLCV bars of that granularity instead of the raw rows
+    # (first open, max high, min low, last close, summed volumes), served from the
+    # pre-aggregated pyramid of the data cache.
     file_path = os.path.join(data_folder, f"{symbol}.csv")
     try:
-        # Read the CSV file, skipping the first line if it contains the URL
-        with open(file_path, 'r') as f:
-            first_line = f.readline()
-            if 'CryptoDataDownload' in first_line:
-                data = pd.read_csv(file_path, skiprows=1)
-            else:
-                data = pd.read_csv(file_path)
-        # Standardize column names to lowercase
-        data.columns = data.columns.str.lower()
-        # Map the columns to standard names
-        column_mapping = {
-            'unix': 'unix',
-            'date': 'date',
-            'symbol': 'symbol',
-            'open': 'open',
-            'high': 'high',
-            'low': 'low',
-            'close': 'close',
-            'volume': 'volume',
-            'volume btc': 'volume',
-            'volume usdt': 'volume_from',
-            'volume_from': 'volume_from',
-            'tradecount': 'tradecount'
-        }
-        data = data.rename(columns=column_mapping)
-        # Check if 'unix' column exists
-        if 'unix' not in data.columns:
-            raise KeyError("'unix' column is missing after renaming.")
-        # Convert 'unix' column to datetime
-        data['timestamp'] = pd.to_datetime(data['unix'], unit='ms')
-        # Set 'timestamp' as the index
-        data.set_index('timestamp', inplace=True)
-        # Sort the data by index
-        data = data.sort_index()
-        return data
+        check_precision(precision)
+        cache_dir = get_cache_dir(data_folder, cache_dir)
+        if timestamp_granularity is None:
+            return load_raw_data(file_path, cache_dir, start, end, use_cache, columns, precision)
+        return load_resampled_data(file_path, cache_dir, timestamp_granularity, start, end, use_cache, columns, precision)
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
         return None
+
+def read_many_historical_data(symbols, data_folder, workers=None, executor='thread', **kwargs):
+    # Read each distinct symbol exactly once, concurrently, and return {symbol: data}
+    # in input order; failed reads map to None like read_historical_data
+    symbols = list(dict.fromkeys(symbols))
+    load = partial(read_historical_data, data_folder=data_folder, **kwargs)
+    if workers == 1 or len(symbols) <= 1:
+        frames = [load(symbol) for symbol in symbols]
+    else:
+        if executor == 'thread':
+            pool_class = ThreadPoolExecutor
+        elif executor == 'process':
+            pool_class = ProcessPoolExecutor
+        else:
+            raise ValueError(f"Unknown executor '{executor}'. Use 'thread' or 'process'.")
+        with pool_class(max_workers=workers) as pool:
+            frames = list(pool.map(load, symbols))
+    return dict(zip(symbols, frames))
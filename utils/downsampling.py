@@ -0,0 +1,40 @@
+import numpy as np
+
+DEFAULT_PLOT_POINTS = 2000
+
+def lttb_indices(x, y, max_points):
+    # Positions of the points kept by Largest-Triangle-Three-Buckets: the first and last points
+    # plus, from each of max_points - 2 buckets, the point forming the largest triangle with
+    # the previously kept point and the average of the next bucket
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    kept = np.empty(max_points, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x = x[end:edges[bucket + 2]].mean()
+            next_y = y[end:edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+def downsample_series(series, max_points=DEFAULT_PLOT_POINTS):
+    # At most max_points points of a time series that keep its visual shape, for plotting.
+    # NaN values are dropped first.
+    series = series.dropna()
+    if len(series) <= max_points:
+        return series
+    x = series.index.to_numpy().view(np.int64).astype(np.float64)
+    kept = lttb_indices(x, series.to_numpy(dtype=np.float64), max_points)
+    return series.iloc[kept]
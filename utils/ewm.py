@@ -0,0 +1,249 @@
+import os
+import numpy as np
+import pandas as pd
+
+def span_to_alpha(span):
+    # Same smoothing factor as pandas' ewm(span=...)
+    return 2.0 / (np.asarray(span, dtype=np.float64) + 1.0)
+
+def init_ewm_state(shape):
+    return {
+        'mean': np.full(shape, np.nan),
+        'var': np.zeros(shape),
+        'sum_wt': np.ones(shape),
+        'sum_wt2': np.ones(shape),
+        'old_wt': np.ones(shape),
+        'nobs': np.zeros(shape, dtype=np.int64)
+    }
+
+def update_ewm_state(state, values, alpha):
+    # One step of pandas' ewmcov recurrence for adjust=False, ignore_na=False and
+    # bias=False, applied element-wise so many series advance together in O(1)
+    old_wt_factor = 1.0 - alpha
+    new_wt = alpha
+    observed = ~np.isnan(values)
+    started = ~np.isnan(state['mean'])
+    updated = started & observed
+
+    # Weights decay on every step once a series has started, including missing values
+    sum_wt = np.where(started, state['sum_wt'] * old_wt_factor, state['sum_wt'])
+    sum_wt2 = np.where(started, state['sum_wt2'] * (old_wt_factor * old_wt_factor), state['sum_wt2'])
+    old_wt = np.where(started, state['old_wt'] * old_wt_factor, state['old_wt'])
+
+    old_mean = state['mean']
+    with np.errstate(invalid='ignore'):
+        # Avoid numerical errors on constant series, as pandas does
+        mean = np.where(old_mean != values, (old_wt * old_mean + new_wt * values) / (old_wt + new_wt), old_mean)
+        var = (
+            (old_wt * (state['var'] + (old_mean - mean) * (old_mean - mean)))
+            + (new_wt * ((values - mean) * (values - mean)))
+        ) / (old_wt + new_wt)
+        # adjust=False renormalizes the weights after every observation
+        next_old_wt = old_wt + new_wt
+        next_sum_wt = (sum_wt + new_wt) / next_old_wt
+        next_sum_wt2 = (sum_wt2 + new_wt * new_wt) / (next_old_wt * next_old_wt)
+
+    state['mean'] = np.where(updated, mean, np.where(~started & observed, values, old_mean))
+    state['var'] = np.where(updated, var, state['var'])
+    state['sum_wt'] = np.where(updated, next_sum_wt, sum_wt)
+    state['sum_wt2'] = np.where(updated, next_sum_wt2, sum_wt2)
+    state['old_wt'] = np.where(updated, 1.0, old_wt)
+    state['nobs'] = state['nobs'] + observed
+    return ewm_state_volatility(state)
+
+def ewm_state_volatility(state):
+    # Bias-corrected standard deviation, NaN until the correction is defined
+    numerator = state['sum_wt'] * state['sum_wt']
+    denominator = numerator - state['sum_wt2']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = np.where(
+            (state['nobs'] >= 1) & (denominator > 0), (numerator / denominator) * state['var'], np.nan
+        )
+    return np.sqrt(np.maximum(variance, 0.0), where=~np.isnan(variance), out=np.full(variance.shape, np.nan))
+
+class EWMVolatilityEstimator:
+    # Streaming equivalent of returns.ewm(span=span, adjust=False).std() on log returns.
+    # Each update costs O(1) per symbol and all symbols are advanced together.
+    STATE_FIELDS = ('mean', 'var', 'sum_wt', 'sum_wt2', 'old_wt', 'nobs')
+
+    def __init__(self, symbols, span):
+        self.symbols = list(symbols)
+        self.span = span
+        self.alpha = span_to_alpha(span)
+        self.state = init_ewm_state(len(self.symbols))
+        self.last_price = np.full(len(self.symbols), np.nan)
+        self.volatility = np.full(len(self.symbols), np.nan)
+
+    def to_array(self, values):
+        # Accept either a sequence aligned with self.symbols or a {symbol: value} mapping
+        if isinstance(values, dict):
+            return np.array([values.get(symbol, np.nan) for symbol in self.symbols], dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != (len(self.symbols),):
+            raise ValueError(f"Expected {len(self.symbols)} values, got shape {values.shape}.")
+        return values
+
+    def update(self, prices):
+        # Push one close per symbol; a NaN close is treated as a missing bar
+        prices = self.to_array(prices)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.log(prices / self.last_price)
+        self.last_price = prices
+        return self.update_returns(returns)
+
+    def update_returns(self, returns):
+        self.volatility = update_ewm_state(self.state, self.to_array(returns), self.alpha)
+        return self.volatility
+
+    def get_volatility(self):
+        return dict(zip(self.symbols, self.volatility))
+
+    def save(self, path):
+        # Write to a temporary file first so an interrupted save never corrupts a snapshot
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                symbols=np.asarray(self.symbols, dtype=str),
+                span=np.asarray(self.span),
+                last_price=self.last_price,
+                volatility=self.volatility,
+                **self.state
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as snapshot:
+            estimator = cls(snapshot['symbols'].tolist(), snapshot['span'].item())
+            estimator.last_price = snapshot['last_price']
+            estimator.volatility = snapshot['volatility']
+            estimator.state = {field: snapshot[field] for field in cls.STATE_FIELDS}
+        return estimator
+
+def ewm_volatility_matrix(returns, spans):
+    # EWM volatility of every column of an aligned (time x assets) returns matrix for every
+    # span, as a (spans x time x assets) array. pandas' compiled recurrence runs over the
+    # whole matrix once per span instead of through a Series pipeline per symbol.
+    returns = np.asarray(returns, dtype=np.float64)
+    if returns.ndim == 1:
+        returns = returns[:, None]
+    frame = pd.DataFrame(returns, copy=False)
+    output = np.empty((len(spans),) + returns.shape)
+    for position, span in enumerate(spans):
+        output[position] = frame.ewm(span=span, adjust=False).std().to_numpy()
+    return output
+
+def average_ewm_volatility(returns, spans, valid=None):
+    # Time-averaged EWM volatility per (span, asset) without keeping the full 3-D output.
+    # Rows where valid is False still advance the recurrence but are left out of the average.
+    returns = np.asarray(returns, dtype=np.float64)
+    if returns.ndim == 1:
+        returns = returns[:, None]
+    frame = pd.DataFrame(returns, copy=False)
+    averages = np.empty((len(spans), returns.shape[1]))
+    for position, span in enumerate(spans):
+        volatility = frame.ewm(span=span, adjust=False).std().to_numpy()
+        included = ~np.isnan(volatility)
+        if valid is not None:
+            included &= valid
+        with np.errstate(invalid='ignore'):
+            averages[position] = np.where(included, volatility, 0.0).sum(axis=0) / included.sum(axis=0)
+    return averages
+
+def ewm_bias_corrections(n_rows, alpha):
+    # Factor 1 / (1 - sum of squared weights) that makes the adjust=False EWM variance unbiased,
+    # at every row of a series without missing values. The sum of squared weights follows
+    # s_t = (1 - alpha)^2 s_(t-1) + alpha^2 from s_0 = 1; the factor is infinite at the first row.
+    limit = alpha / (2.0 - alpha)
+    sum_wt2 = limit + (1.0 - limit) * (1.0 - alpha) ** (2.0 * np.arange(n_rows))
+    with np.errstate(divide='ignore'):
+        return 1.0 / (1.0 - sum_wt2)
+
+def iter_ewm_covariances(returns, span, chunk_rows):
+    # EWM covariance matrices C_t of an aligned (time x assets) returns matrix without missing
+    # values, with the same adjust=False bias-corrected semantics as the volatility, yielded as
+    # (rows x assets x assets) arrays of at most chunk_rows consecutive rows. The first row,
+    # where the covariance is not defined, is skipped. With d_t = x_t - m_(t-1) the deviation
+    # from the previous EWM mean, the recurrence is S_t = (1 - alpha) S_(t-1) + alpha (1 - alpha)
+    # d_t d_t' and C_t = c_t S_t. Within a chunk it is pandas' adjust=False EWM mean of the
+    # outer products, started from the S carried over from the previous chunk.
+    returns = np.asarray(returns, dtype=np.float64)
+    n_rows, n_assets = returns.shape
+    alpha = span_to_alpha(span)
+    means = pd.DataFrame(returns, copy=False).ewm(span=span, adjust=False).mean().to_numpy()
+    corrections = ewm_bias_corrections(n_rows, alpha)
+    state = np.zeros(n_assets * n_assets)
+    for first in range(1, n_rows, chunk_rows):
+        last = min(n_rows, first + chunk_rows)
+        deviations = returns[first:last] - means[first - 1:last - 1]
+        outer_products = np.empty((last - first + 1, n_assets * n_assets))
+        outer_products[0] = state
+        np.multiply(deviations[:, :, None], deviations[:, None, :], out=outer_products[1:].reshape(-1, n_assets, n_assets))
+        outer_products[1:] *= 1.0 - alpha
+        sums = pd.DataFrame(outer_products, copy=False).ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+        state = sums[-1]
+        yield (sums * corrections[first:last, None]).reshape(-1, n_assets, n_assets)
+
+def average_portfolio_volatility(returns, span, weights, max_chunk_elements=4000000):
+    # Time-averaged EWM volatility sqrt(w' C_t w) of many weight vectors at once for an aligned
+    # (time x assets) returns matrix without missing values; weights has shape (portfolios x
+    # assets). The covariance matrices are computed a chunk of rows at a time and every
+    # quadratic form of a chunk is one row of a single matrix product between its flattened
+    # covariances and the flattened outer products w w', so no more than about
+    # max_chunk_elements values are held at once.
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    n_portfolios, n_assets = weights.shape
+    outer_products = np.einsum('ka,kb->abk', weights, weights).reshape(n_assets * n_assets, n_portfolios)
+    chunk_rows = max(1, max_chunk_elements // max(n_assets * n_assets, n_portfolios))
+    total = np.zeros(n_portfolios)
+    count = 0
+    for covariances in iter_ewm_covariances(returns, span, chunk_rows):
+        variance = covariances.reshape(len(covariances), -1) @ outer_products
+        total += np.sqrt(np.maximum(variance, 0.0, out=variance), out=variance).sum(axis=0)
+        count += len(covariances)
+    with np.errstate(invalid='ignore'):
+        return total / count
+
+def average_ewm_covariance(returns, span, max_chunk_elements=4000000):
+    # Time average of the EWM covariance matrices over the rows where they are defined
+    n_assets = np.shape(returns)[1]
+    total = np.zeros((n_assets, n_assets))
+    count = 0
+    for covariances in iter_ewm_covariances(returns, span, max(1, max_chunk_elements // (n_assets * n_assets))):
+        total += covariances.sum(axis=0)
+        count += len(covariances)
+    with np.errstate(invalid='ignore'):
+        return total / count
+
+def ewm_warmup_length(span, tolerance=1e-17):
+    # Number of past observations after which their weight (1 - alpha)^n falls below tolerance
+    return int(np.ceil(np.log(tolerance) / np.log(1.0 - span_to_alpha(span))))
+
+class ChunkedEWMVolatility:
+    # EWM volatility of a returns series that arrives in consecutive chunks. Each chunk runs
+    # through pandas' compiled recurrence behind the last ewm_warmup_length(span) returns of
+    # the previous chunks, whose outputs are dropped, so memory stays bounded by the chunk
+    # size while the results match the whole-series computation to floating-point precision.
+    # The time average of the volatility is accumulated on the way.
+    def __init__(self, span):
+        self.span = span
+        self.warmup = ewm_warmup_length(span)
+        self.tail = np.empty(0)
+        self.total = 0.0
+        self.count = 0
+
+    def update(self, returns):
+        values = np.concatenate([self.tail, np.asarray(returns, dtype=np.float64)])
+        volatility = pd.Series(values, copy=False).ewm(span=self.span, adjust=False).std().to_numpy()
+        volatility = volatility[len(self.tail):]
+        self.tail = values[-self.warmup:]
+        observed = ~np.isnan(volatility)
+        self.total += volatility[observed].sum()
+        self.count += int(observed.sum())
+        return volatility
+
+    def average(self):
+        if self.count == 0:
+            return np.nan
+        return self.total / self.count
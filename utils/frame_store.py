@@ -0,0 +1,62 @@
+import os
+import re
+import threading
+from utils.data_cache import source_fingerprint
+from utils.data_reader import read_historical_data
+
+# Symbols name a CSV file directly inside the data folder: no path separators and no leading dot
+SYMBOL_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.-]*')
+
+def check_symbol(symbol):
+    # Symbols come from requests, so they must not reach files outside the data folder
+    if not SYMBOL_PATTERN.fullmatch(symbol):
+        raise ValueError(f"Invalid symbol '{symbol}'. Use letters, digits, '_', '-' and '.' only.")
+    return symbol
+
+class FrameStore:
+    # Keeps the frames returned by read_historical_data in memory, one per symbol, for a
+    # long-running process. A symbol is reloaded only when the size or modification time of
+    # its source file changes. Safe to use from several threads; concurrent requests for the
+    # same symbol load it once.
+    def __init__(self, data_folder, cache_dir=None, use_cache=True, columns=None, precision=None):
+        self.data_folder = data_folder
+        self.read_options = {'cache_dir': cache_dir, 'use_cache': use_cache, 'columns': columns, 'precision': precision}
+        self.entries = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.loads = 0
+
+    def get_symbol_lock(self, symbol):
+        with self.lock:
+            return self.locks.setdefault(symbol, threading.Lock())
+
+    def get(self, symbol):
+        # The resident frame of a symbol; callers must not modify it
+        check_symbol(symbol)
+        file_path = os.path.join(self.data_folder, f"{symbol}.csv")
+        with self.get_symbol_lock(symbol):
+            # Raises FileNotFoundError for unknown symbols
+            fingerprint = source_fingerprint(file_path)
+            entry = self.entries.get(symbol)
+            if entry is not None and entry['source'] == fingerprint:
+                return entry['data']
+            data = read_historical_data(symbol, self.data_folder, **self.read_options)
+            if data is None:
+                raise ValueError(f"Could not read data for {symbol}.")
+            with self.lock:
+                self.entries[symbol] = {'source': fingerprint, 'data': data}
+                self.loads += 1
+            return data
+
+    def describe(self):
+        # Resident symbols with their number of rows and time range
+        with self.lock:
+            entries = dict(self.entries)
+        return {
+            symbol: {
+                'rows': len(entry['data']),
+                'first_timestamp': str(entry['data'].index[0]) if len(entry['data']) else None,
+                'last_timestamp': str(entry['data'].index[-1]) if len(entry['data']) else None
+            }
+            for symbol, entry in entries.items()
+        }
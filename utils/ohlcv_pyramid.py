@@ -0,0 +1,132 @@
+import os
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from utils.data_cache import CACHE_VERSION, load_cached_frame, read_cache_build, read_cache_meta, get_entry_dir, is_cache_valid, replace_cached_tail, source_fingerprint, store_cached_frame
+
+# Pre-aggregated resolutions, finest first; every level is made of whole bins of the previous one
+PYRAMID_LEVELS = ('5min', '15min', '1h', '4h', '1D')
+PYRAMID_DIRNAME = 'pyramid'
+# How each column of a bin is aggregated from the bars it contains
+OHLCV_AGGREGATIONS = {
+    'open': 'first',
+    'high': 'max',
+    'low': 'min',
+    'close': 'last',
+    'volume': 'sum',
+    'volume_from': 'sum',
+    'tradecount': 'sum'
+}
+ONE_NANOSECOND = pd.Timedelta(1, unit='ns')
+
+def aggregate_ohlcv(data, timestamp_granularity):
+    # Resample OHLCV bars with first/max/min/last/sum; the sum of an empty bin is NaN like
+    # the other columns, so gaps stay visible
+    columns = [column for column in OHLCV_AGGREGATIONS if column in data.columns]
+    resampler = data[columns].resample(timestamp_granularity)
+    aggregated = {}
+    for column in columns:
+        if OHLCV_AGGREGATIONS[column] == 'sum':
+            aggregated[column] = resampler[column].sum(min_count=1)
+        else:
+            aggregated[column] = getattr(resampler[column], OHLCV_AGGREGATIONS[column])()
+    return pd.DataFrame(aggregated)
+
+def get_level_cache_dir(cache_dir, level):
+    return os.path.join(cache_dir, PYRAMID_DIRNAME, level)
+
+def get_fixed_duration(timestamp_granularity):
+    # Length of a fixed-size bin, or None for calendar periods such as weeks or months
+    offset = to_offset(timestamp_granularity)
+    if isinstance(offset, pd.offsets.Tick):
+        return pd.Timedelta(offset.nanos, unit='ns')
+    if isinstance(offset, pd.offsets.Day):
+        return pd.Timedelta(days=offset.n)
+    return None
+
+def choose_pyramid_level(timestamp_granularity):
+    # Coarsest level whose bins tile the requested bins exactly, or None to use the raw bars
+    duration = get_fixed_duration(timestamp_granularity)
+    if duration is None:
+        # Calendar periods start at midnight, so they are made of whole days
+        return PYRAMID_LEVELS[-1]
+    for level in reversed(PYRAMID_LEVELS):
+        level_duration = get_fixed_duration(level)
+        if duration >= level_duration and duration % level_duration == pd.Timedelta(0):
+            return level
+    return None
+
+def is_pyramid_valid(file_path, cache_dir):
+    fingerprint = source_fingerprint(file_path)
+    return all(
+        is_cache_valid(read_cache_meta(get_entry_dir(file_path, get_level_cache_dir(cache_dir, level))), fingerprint)
+        for level in PYRAMID_LEVELS
+    )
+
+def build_pyramid(file_path, cache_dir, data):
+    # Aggregate the raw bars into every level, each level from the previous one, and cache them.
+    # Each level records the build of the raw cache entry, so that it can later be updated
+    # from rows appended to that entry.
+    parent_build = read_cache_build(file_path, cache_dir)
+    level_data = data
+    for level in PYRAMID_LEVELS:
+        level_data = aggregate_ohlcv(level_data, level)
+        store_cached_frame(file_path, get_level_cache_dir(cache_dir, level), level_data, parent_build=parent_build)
+
+def update_pyramid(file_path, cache_dir, load_raw):
+    # Bring the pyramid up to date after rows were appended to its source file. Only the raw
+    # rows since the start of the last cached day are aggregated again: the last bin of every
+    # level, which may have been partial, is replaced and the newer bins are appended.
+    # load_raw(start, end, columns) reads raw rows and must return a frame. Returns False when
+    # the pyramid has to be rebuilt, such as when the raw cache entry was rebuilt.
+    metas = [read_cache_meta(get_entry_dir(file_path, get_level_cache_dir(cache_dir, level))) for level in PYRAMID_LEVELS]
+    if any(meta is None or meta.get('version') != CACHE_VERSION or meta.get('parent_build') is None or meta.get('last_timestamp') is None for meta in metas):
+        return False
+    try:
+        fingerprint = source_fingerprint(file_path)
+        # Days are whole bins of every level, so the aggregation restarts on bin edges
+        start = min(pd.Timestamp(meta['last_timestamp']) for meta in metas).floor(PYRAMID_LEVELS[-1])
+        level_data = load_raw(start, None, None)
+        parent_build = read_cache_build(file_path, cache_dir)
+        if any(meta['parent_build'] != parent_build for meta in metas):
+            return False
+        for level, meta in zip(PYRAMID_LEVELS, metas):
+            level_data = aggregate_ohlcv(level_data, level)
+            new_bins = level_data[level_data.index >= pd.Timestamp(meta['last_timestamp'])]
+            replace_cached_tail(file_path, get_level_cache_dir(cache_dir, level), new_bins, fingerprint)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Rebuilding the pyramid of {file_path}: {e}")
+        return False
+    return True
+
+def read_pyramid_data(file_path, cache_dir, load_raw, timestamp_granularity, start=None, end=None, columns=None):
+    # Bars of the requested granularity for start <= timestamp <= end, identical to
+    # aggregate_ohlcv(raw rows in the range, timestamp_granularity). Complete bins of the
+    # chosen level come from the pyramid; only the raw rows of the partial level bins at
+    # the two edges of the range are aggregated again. load_raw(start, end, columns) reads
+    # raw rows and must return a frame. The pyramid must be built beforehand.
+    level = choose_pyramid_level(timestamp_granularity)
+    if level is None:
+        return aggregate_ohlcv(load_raw(start, end, columns), timestamp_granularity)
+    level_cache_dir = get_level_cache_dir(cache_dir, level)
+    # Complete level bins cover the rows with lower <= timestamp < upper
+    lower = pd.Timestamp(start).ceil(level) if start is not None else None
+    upper = (pd.Timestamp(end) + ONE_NANOSECOND).floor(level) if end is not None else None
+    if lower is not None and upper is not None and lower >= upper:
+        # The range is shorter than a complete level bin
+        return aggregate_ohlcv(load_raw(start, end, columns), timestamp_granularity)
+    pieces = []
+    if lower is not None and pd.Timestamp(start) < lower:
+        pieces.append(aggregate_ohlcv(load_raw(start, lower - ONE_NANOSECOND, columns), level))
+    interior_end = upper - ONE_NANOSECOND if upper is not None else None
+    interior = load_cached_frame(file_path, level_cache_dir, start=lower, end=interior_end, columns=columns)
+    if interior is None:
+        raise ValueError(f"The {level} level of {file_path} is missing or stale.")
+    pieces.append(interior)
+    if upper is not None:
+        pieces.append(aggregate_ohlcv(load_raw(upper, end, columns), level))
+    pieces = [piece for piece in pieces if not piece.empty]
+    if len(pieces) == 1:
+        return aggregate_ohlcv(pieces[0], timestamp_granularity)
+    if not pieces:
+        return aggregate_ohlcv(interior, timestamp_granularity)
+    return aggregate_ohlcv(pd.concat(pieces), timestamp_granularity)
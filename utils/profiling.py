@@ -0,0 +1,151 @@
+import atexit
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; the peak RSS is then left out of the report
+    resource = None
+
+REPORT_VERSION = 1
+
+def get_max_rss_mb():
+    # Peak resident set size of the process so far, in MiB
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return max_rss / 2**20
+    return max_rss / 2**10
+
+class NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+NULL_STAGE = NullStage()
+
+class NullProfiler:
+    # Used when profiling is off: every stage is the same no-op context manager
+    enabled = False
+
+    def stage(self, name, symbol=None, **details):
+        return NULL_STAGE
+
+NULL_PROFILER = NullProfiler()
+
+class Stage:
+    def __init__(self, profiler, name, symbol, details):
+        self.profiler = profiler
+        self.record = dict({'stage': name, 'symbol': symbol}, **details)
+
+    def __enter__(self):
+        self.profiler.enter_stage(self)
+        self.wall_started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.record['wall_seconds'] = time.perf_counter() - self.wall_started
+        self.record['cpu_seconds'] = time.process_time() - self.cpu_started
+        if exc_type is not None:
+            self.record['error'] = exc_type.__name__
+        self.profiler.exit_stage(self)
+        return False
+
+class Profiler:
+    # Records wall time, CPU time and peak memory of named stages, optionally per symbol.
+    # Stages may be nested; they must be entered and exited from one thread. With
+    # trace_memory, the peak of the memory allocated through Python (including NumPy and
+    # pandas buffers) during each stage is tracked with tracemalloc, which slows the run down.
+    enabled = True
+
+    def __init__(self, trace_memory=False):
+        self.records = []
+        self.stack = []
+        # tracemalloc.reset_peak needs Python 3.9
+        self.trace_memory = trace_memory and hasattr(tracemalloc, 'reset_peak')
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.wall_started = time.perf_counter()
+        self.cpu_started = time.process_time()
+
+    def stage(self, name, symbol=None, **details):
+        return Stage(self, name, symbol, details)
+
+    def enter_stage(self, stage):
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # The enclosing stage keeps the peak reached before this stage resets it
+            if self.stack:
+                self.stack[-1].child_peak = max(self.stack[-1].child_peak, peak)
+            tracemalloc.reset_peak()
+            stage.traced_started = current
+            stage.child_peak = current
+        self.stack.append(stage)
+
+    def exit_stage(self, stage):
+        self.stack.pop()
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, stage.child_peak)
+            stage.record['peak_traced_mb'] = (peak - stage.traced_started) / 2**20
+            stage.record['retained_traced_mb'] = (current - stage.traced_started) / 2**20
+            if self.stack:
+                self.stack[-1].child_peak = max(self.stack[-1].child_peak, peak)
+        stage.record['max_rss_mb'] = get_max_rss_mb()
+        stage.record['depth'] = len(self.stack)
+        self.records.append(stage.record)
+
+    def summarize(self):
+        # Totals per stage name, summed over symbols and repeated calls
+        summary = {}
+        for record in self.records:
+            totals = summary.setdefault(record['stage'], {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+            totals['calls'] += 1
+            totals['wall_seconds'] += record['wall_seconds']
+            totals['cpu_seconds'] += record['cpu_seconds']
+            if 'peak_traced_mb' in record:
+                totals['peak_traced_mb'] = max(totals.get('peak_traced_mb', 0.0), record['peak_traced_mb'])
+        return summary
+
+    def get_report(self):
+        return {
+            'version': REPORT_VERSION,
+            'command': sys.argv,
+            'python': platform.python_version(),
+            'pid': os.getpid(),
+            'wall_seconds': time.perf_counter() - self.wall_started,
+            'cpu_seconds': time.process_time() - self.cpu_started,
+            'max_rss_mb': get_max_rss_mb(),
+            'trace_memory': self.trace_memory,
+            'summary': self.summarize(),
+            'stages': self.records
+        }
+
+    def write_report(self, output):
+        # '-' prints the JSON report to stdout
+        report = json.dumps(self.get_report(), indent=2)
+        if output == '-':
+            print(report)
+            return
+        with open(output, 'w') as f:
+            f.write(report)
+        print(f"Profile written to {output}")
+
+def create_profiler(output=None, trace_memory=False):
+    # A no-op profiler when output is None. Otherwise the report is written when the program
+    # exits, so early exits of the scripts are profiled too.
+    if output is None:
+        return NULL_PROFILER
+    profiler = Profiler(trace_memory=trace_memory)
+    atexit.register(profiler.write_report, output)
+    return profiler
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import pickle
+from utils.data_cache import source_fingerprint
+
+# Bump whenever the stored results change shape so old entries are never returned
+RESULT_CACHE_VERSION = 2
+RESULT_CACHE_DIRNAME = 'results'
+RESULT_SUFFIX = '.pkl'
+DEFAULT_RESULT_CACHE_MB = 256
+
+def get_result_cache_dir(cache_dir):
+    # Results live next to the data cache entries
+    return os.path.join(cache_dir, RESULT_CACHE_DIRNAME)
+
+def get_result_key(kind, params, file_paths):
+    # Content address of a result: the kind of computation, its parameters and the size and
+    # modification time of every input file, so any change to the data gives a new key.
+    # Raises OSError when an input file is missing.
+    description = {
+        'version': RESULT_CACHE_VERSION,
+        'kind': kind,
+        'params': params,
+        'sources': [source_fingerprint(file_path) for file_path in file_paths]
+    }
+    encoded = json.dumps(description, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+def get_result_path(result_dir, key):
+    return os.path.join(result_dir, key + RESULT_SUFFIX)
+
+def load_result(result_dir, key):
+    # The stored result, or None on a miss. A hit refreshes the entry's modification time,
+    # which is the recency used for eviction.
+    result_path = get_result_path(result_dir, key)
+    try:
+        with open(result_path, 'rb') as f:
+            result = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    try:
+        os.utime(result_path)
+    except OSError:
+        pass
+    return result
+
+def evict_results(result_dir, max_bytes):
+    # Delete the least recently used entries until the cache fits in max_bytes
+    entries = []
+    for name in os.listdir(result_dir):
+        if not name.endswith(RESULT_SUFFIX):
+            continue
+        try:
+            stat = os.stat(os.path.join(result_dir, name))
+        except OSError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, name))
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(result_dir, name))
+        except OSError:
+            continue
+        total_bytes -= size
+
+def store_result(result_dir, key, result, max_bytes):
+    # Write through a temporary file so readers never see a partial entry
+    os.makedirs(result_dir, exist_ok=True)
+    result_path = get_result_path(result_dir, key)
+    tmp_path = f"{result_path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, result_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    evict_results(result_dir, max_bytes)
+
+def memoize_result(result_dir, kind, params, file_paths, compute, max_bytes):
+    # Return (result, hit): the cached result of compute() for these parameters and input
+    # files, or compute() stored for next time. Results of None are not cached. Cache
+    # failures never prevent the computation.
+    try:
+        key = get_result_key(kind, params, file_paths)
+    except OSError:
+        return compute(), False
+    result = load_result(result_dir, key)
+    if result is not None:
+        return result, True
+    result = compute()
+    if result is not None:
+        try:
+            store_result(result_dir, key, result, max_bytes)
+        except OSError as e:
+            print(f"Could not write result cache: {e}")
+    return result, False
@@ -0,0 +1,43 @@
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+def get_shared_memory_dir():
+    # /dev/shm is memory-backed on Linux; fall back to the regular temp folder elsewhere
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return None
+
+def share_frame(frame):
+    # Write a numeric DataFrame once into memory-mapped files that worker processes
+    # can attach to by path, so the values are never pickled per task
+    folder = tempfile.mkdtemp(prefix='shared_frame-', dir=get_shared_memory_dir())
+    values = np.ascontiguousarray(frame.to_numpy())
+    values_map = np.lib.format.open_memmap(
+        os.path.join(folder, 'values.npy'), mode='w+', dtype=values.dtype, shape=values.shape
+    )
+    values_map[:] = values
+    values_map.flush()
+    np.save(os.path.join(folder, 'index.npy'), frame.index.asi8)
+    meta = {
+        'columns': [str(column) for column in frame.columns],
+        'index_name': frame.index.name,
+        'index_dtype': str(frame.index.dtype)
+    }
+    with open(os.path.join(folder, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return folder
+
+def attach_frame(handle):
+    with open(os.path.join(handle, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    values = np.load(os.path.join(handle, 'values.npy'), mmap_mode='r')
+    index_values = np.load(os.path.join(handle, 'index.npy'))
+    index = pd.Index(index_values.view(meta['index_dtype']), name=meta['index_name'])
+    return pd.DataFrame(values, index=index, columns=meta['columns'], copy=False)
+
+def release_frame(handle):
+    shutil.rmtree(handle, ignore_errors=True)
@@ -0,0 +1,75 @@
+import math
+import numpy as np
+import pandas as pd
+
+# Largest grid simplex_grid builds; each portfolio costs a quadratic form per row of returns
+MAX_GRID_PORTFOLIOS = 100000
+
+def read_weights_csv(file_path, symbols):
+    # One weight vector per row; columns are asset symbols and an optional 'name' column.
+    # Assets missing from the file get a weight of zero.
+    weights_df = pd.read_csv(file_path)
+    if 'name' in weights_df.columns:
+        names = weights_df['name'].astype(str).tolist()
+        weights_df = weights_df.drop(columns='name')
+    else:
+        names = [f"weights_{position}" for position in range(len(weights_df))]
+    unknown = [column for column in weights_df.columns if column not in symbols]
+    if unknown:
+        raise KeyError(f"Weights given for unknown assets: {', '.join(unknown)}")
+    weights = weights_df.reindex(columns=symbols, fill_value=0.0).to_numpy(dtype=np.float64)
+    return names, weights
+
+def simplex_grid(n_assets, step, max_portfolios=MAX_GRID_PORTFOLIOS):
+    # Every long-only weight vector whose weights are multiples of step and sum to 1, in
+    # lexicographic order of the weights
+    units = int(round(1.0 / step))
+    if units <= 0 or not np.isclose(units * step, 1.0):
+        raise ValueError(f"Grid step must divide 1 evenly: {step}")
+    # Stars and bars: units split among n_assets
+    n_portfolios = math.comb(units + n_assets - 1, n_assets - 1)
+    if n_portfolios > max_portfolios:
+        raise ValueError(
+            f"A grid step of {step} gives {n_portfolios} portfolios of {n_assets} assets, more than {max_portfolios}. "
+            "Use a coarser step, or search for the best weights with --min_variance (search_min_variance_weights)."
+        )
+    # The grid is built one asset at a time: every partial vector is followed by each number
+    # of units it leaves, and the last asset takes the rest
+    vectors = np.zeros((1, 0), dtype=np.int64)
+    remaining = np.array([units])
+    for _ in range(n_assets - 1):
+        counts = remaining + 1
+        rows = np.repeat(np.arange(len(vectors)), counts)
+        values = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        vectors = np.column_stack([vectors[rows], values])
+        remaining = remaining[rows] - values
+    return np.column_stack([vectors, remaining]).astype(np.float64) / units
+
+def search_min_variance_weights(evaluate, mean_covariance, candidates=2000, rounds=5, seed=0):
+    # Long-only search for the weights with the lowest average volatility. evaluate maps a
+    # (portfolios x assets) array to their average volatilities. Starts from the equal-weight,
+    # single-asset and clipped closed-form minimum-variance portfolios plus random candidates,
+    # then repeatedly samples around the best portfolio with a tightening concentration.
+    rng = np.random.default_rng(seed)
+    n_assets = len(mean_covariance)
+    starting_points = [np.full(n_assets, 1.0 / n_assets)] + list(np.eye(n_assets))
+    try:
+        closed_form = np.linalg.solve(mean_covariance, np.ones(n_assets))
+        closed_form = np.clip(closed_form / closed_form.sum(), 0.0, None)
+        if closed_form.sum() > 0:
+            starting_points.append(closed_form / closed_form.sum())
+    except np.linalg.LinAlgError:
+        pass
+    weights = np.vstack(starting_points + list(rng.dirichlet(np.ones(n_assets), candidates)))
+    volatilities = evaluate(weights)
+    best = int(np.nanargmin(volatilities))
+    best_weights, best_volatility = weights[best], volatilities[best]
+    concentration = 50.0
+    for _ in range(rounds):
+        weights = rng.dirichlet(best_weights * concentration + 1e-3, candidates)
+        volatilities = evaluate(weights)
+        best = int(np.nanargmin(volatilities))
+        if volatilities[best] < best_volatility:
+            best_weights, best_volatility = weights[best], volatilities[best]
+        concentration *= 4.0
+    return best_weights, best_volatility
@@ -1,10 +1,22 @@
 import pandas as pd
 import numpy as np
+import io
 import os
 import sys
 import argparse
+from contextlib import redirect_stdout
+from functools import partial
 from colorama import init, Fore, Style
-from utils.data_reader import read_historical_data
+from utils.alignment import align_series, write_gap_report
+from utils.bootstrap import DEFAULT_BOOTSTRAP_SEED, bootstrap_average_volatilities, get_confidence_intervals
+from utils.chunked_reader import iter_aligned_chunks, iter_historical_data, read_time_bounds
+from utils.data_cache import get_cache_dir
+from utils.data_reader import read_many_historical_data
+from utils.ohlcv_pyramid import choose_pyramid_level
+from utils.profiling import NULL_PROFILER, create_profiler
+from utils.result_cache import DEFAULT_RESULT_CACHE_MB, get_result_cache_dir, memoize_result
+from utils.ewm import ChunkedEWMVolatility, average_ewm_covariance, average_ewm_volatility, average_portfolio_volatility, ewm_volatility_matrix
+from utils.weights import read_weights_csv, search_min_variance_weights, simplex_grid
 
 # Initialize colorama
 init(autoreset=True)
@@ -17,17 +29,58 @@ def calculate_exponentially_weighted_volatility(returns, span):
     ewm_volatility = returns.ewm(span=span, adjust=False).std()
     return ewm_volatility
 
+def calculate_trailing_averages(values, timestamps, window, report_times):
+    # Average of the non-NaN values with report_time - window <= timestamp <= report_time for
+    # every report time, from cumulative sums so each window costs O(1) regardless of its length
+    values = np.asarray(values, dtype=np.float64).reshape(len(timestamps), -1)
+    observed = ~np.isnan(values)
+    zeros = np.zeros((1, values.shape[1]))
+    value_sums = np.vstack([zeros, np.cumsum(np.where(observed, values, 0.0), axis=0)])
+    value_counts = np.vstack([zeros, np.cumsum(observed, axis=0)])
+    window_starts = np.searchsorted(timestamps, report_times - window, side='left')
+    window_ends = np.searchsorted(timestamps, report_times, side='right')
+    with np.errstate(invalid='ignore'):
+        return (
+            (value_sums[window_ends] - value_sums[window_starts])
+            / (value_counts[window_ends] - value_counts[window_starts])
+        )
+
 def get_symbols_from_args(assets_arg):
     symbols = [asset.strip() for asset in assets_arg.split(',')]
     return symbols
 
+def get_spans_from_args(span_arg):
+    spans = [int(span.strip()) for span in str(span_arg).split(',')]
+    return spans
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Compute Exponentially Weighted Volatility of Assets')
     parser.add_argument('--data_folder', type=str, default='data', help='Folder containing CSV files')
     parser.add_argument('--assets', type=str, required=True, help='Comma-separated list of assets (e.g., BTCUSDT,ETHUSDT)')
     parser.add_argument('--observation_window_minutes', type=int, default=525600, help='Observation window in minutes (default: 525600 for 1 year)')
-    parser.add_argument('--span', type=int, default=20, help='Span parameter for EWM (default: 20)')
+    parser.add_argument('--span', type=str, default='20', help='Span parameter for EWM, or a comma-separated list of spans (e.g., 10,20,60) (default: 20)')
     parser.add_argument('--timestamp_granularity', type=str, default='1min', help='Timestamp granularity (default: 1min)')
+    parser.add_argument('--cache_dir', type=str, default=None, help='Folder for the parsed data cache (default: <data_folder>/.cache)')
+    parser.add_argument('--no_cache', action='store_true', help='Always parse the CSV files instead of using the data cache')
+    parser.add_argument('--no_result_cache', action='store_true', help='Always recompute the average volatilities instead of using the result cache')
+    parser.add_argument('--result_cache_mb', type=float, default=DEFAULT_RESULT_CACHE_MB, help=f'Size limit of the result cache in MB; least recently used results are evicted (default: {DEFAULT_RESULT_CACHE_MB})')
+    parser.add_argument('--workers', type=int, default=None, help='Number of parallel loaders (default: chosen by the executor; 1 loads sequentially)')
+    parser.add_argument('--executor', type=str, default='thread', choices=['thread', 'process'], help='Pool used to load the assets in parallel (default: thread)')
+    parser.add_argument('--rolling_report', type=str, default=None, help='Write the trailing observation-window average volatility at every report time to this CSV file')
+    parser.add_argument('--report_frequency', type=str, default='1D', help='Spacing of the rolling report snapshots (default: 1D)')
+    parser.add_argument('--weights_file', type=str, default=None, help='CSV of portfolio weight vectors to evaluate (one row per portfolio, one column per asset, optional name column)')
+    parser.add_argument('--weights_grid', type=float, default=None, help='Evaluate every long-only portfolio whose weights are multiples of this step (e.g., 0.1)')
+    parser.add_argument('--min_variance', action='store_true', help='Search for the long-only weights with the lowest average volatility')
+    parser.add_argument('--chunksize', type=int, default=None, help='Stream the CSV files in chunks of this many rows instead of loading them whole (bounded memory)')
+    parser.add_argument('--profile', type=str, nargs='?', const='-', default=None, help='Write a JSON report of the wall time, CPU time and peak memory of every stage to this file (stdout without a value)')
+    parser.add_argument('--profile_memory', action='store_true', help='With --profile, also trace the peak memory allocated within each stage (slower)')
+    parser.add_argument('--gap_report', type=str, default=None, help='Write the time ranges each asset has no returns for, which the portfolio average drops, to this CSV file')
+    parser.add_argument('--bootstrap', type=int, default=None, help='Also compute block-bootstrap confidence intervals of the average volatilities from this many resampled return paths (e.g., 10000)')
+    parser.add_argument('--bootstrap_block', type=int, default=None, help='Length in rows of the bootstrap blocks (default and minimum: the EWM warmup of the largest span)')
+    parser.add_argument('--bootstrap_seed', type=int, default=DEFAULT_BOOTSTRAP_SEED, help=f'Seed of the bootstrap resampling (default: {DEFAULT_BOOTSTRAP_SEED})')
+    parser.add_argument('--bootstrap_workers', type=int, default=None, help='Number of bootstrap processes (default: number of CPUs)')
+    parser.add_argument('--confidence', type=float, default=0.95, help='Confidence level of the bootstrap intervals (default: 0.95)')
+    parser.add_argument('--weights_output', type=str, default=None, help='Optional CSV file for the evaluated portfolios and their average volatility')
     args = parser.parse_args()
     return args
 
@@ -37,93 +90,402 @@ def main():
     symbols = get_symbols_from_args(args.assets)
     observation_window_minutes = args.observation_window_minutes
     observation_window = pd.Timedelta(minutes=observation_window_minutes)
-    span = args.span
+    spans = get_spans_from_args(args.span)
     timestamp_granularity = args.timestamp_granularity
+    profiler = create_profiler(args.profile, trace_memory=args.profile_memory)
 
-    all_returns = []
-    individual_volatilities = {}
-    latest_timestamp = None
+    if args.chunksize:
+        if args.rolling_report or args.weights_file or args.weights_grid or args.min_variance or args.gap_report or args.bootstrap:
+            print("--chunksize only computes the average volatilities; run without it for reports and weights.")
+            exit()
+        with profiler.stage('chunked_volatility'):
+            run_chunked_volatility(symbols, spans, observation_window, args)
+        return
 
-    # Determine the latest timestamp across all assets
-    for symbol in symbols:
+    if args.rolling_report or args.weights_file or args.weights_grid or args.min_variance or args.bootstrap:
+        run_returns_analyses(symbols, spans, observation_window, args, profiler)
+        return
+
+    if args.no_result_cache or args.gap_report:
+        result = calculate_average_volatilities(symbols, spans, observation_window, args, profiler)
+    else:
+        # Identical queries on unchanged files are answered from the result cache
+        result_dir = get_result_cache_dir(get_cache_dir(data_folder, args.cache_dir))
+        params = {
+            'symbols': symbols,
+            'observation_window_minutes': observation_window_minutes,
+            'spans': spans,
+            'timestamp_granularity': timestamp_granularity
+        }
+        file_paths = [os.path.join(data_folder, f"{symbol}.csv") for symbol in dict.fromkeys(symbols)]
+        compute = partial(calculate_average_volatilities_cached, symbols, spans, observation_window, args, profiler)
+        with profiler.stage('result_cache'):
+            cached, _ = memoize_result(result_dir, 'volatility', params, file_paths, compute, args.result_cache_mb * 2**20)
+        result = None
+        if cached is not None:
+            # The per-symbol messages of the run that computed the result, printed again on hits
+            result, printed = cached
+            print(printed, end='')
+    if result is None:
+        exit()
+    print_average_volatilities(*result)
+
+def read_latest_timestamps(symbols, data_folder):
+    # {symbol: latest timestamp} of each distinct symbol from the first and last rows of its
+    # file, None when the file has no rows or cannot be read
+    latest_timestamps = {}
+    for symbol in dict.fromkeys(symbols):
+        latest_timestamps[symbol] = None
+        file_path = os.path.join(data_folder, f"{symbol}.csv")
         try:
-            data = read_historical_data(symbol, data_folder)
-            if data is None or data.empty:
-                print(f"No data for {symbol}.")
-                continue
-            symbol_latest_timestamp = data.index.max()
-            if latest_timestamp is None or symbol_latest_timestamp < latest_timestamp:
-                latest_timestamp = symbol_latest_timestamp
+            _, latest_timestamps[symbol] = read_time_bounds(symbol, data_folder)
         except Exception as e:
-            print(f"Error processing data for {symbol}: {e}")
+            print(f"Error reading {file_path}: {e}")
+    return latest_timestamps
+
+def load_aligned_returns(symbols, observation_window, args, profiler=NULL_PROFILER):
+    # Log returns of every asset over the observation window (the whole history for the rolling
+    # report), aligned on the union of timestamps; None after printing why when there are none
+    data_folder = args.data_folder
+    timestamp_granularity = args.timestamp_granularity
+    all_returns = {}
+    latest_timestamp = None
+
+    # Only the first and last rows of each file are read here, so that only the rows of the
+    # observation period are loaded below
+    with profiler.stage('bounds', assets=len(symbols)):
+        latest_timestamps = read_latest_timestamps(symbols, data_folder)
+
+    # Determine the latest timestamp across all assets
+    for symbol, symbol_latest_timestamp in latest_timestamps.items():
+        if symbol_latest_timestamp is None:
+            print(f"No data for {symbol}.")
             continue
+        if latest_timestamp is None or symbol_latest_timestamp < latest_timestamp:
+            latest_timestamp = symbol_latest_timestamp
 
     if latest_timestamp is None:
         print("No data available.")
-        exit()
+        return None
 
     # Define observation period
     end_time = latest_timestamp
     start_time = end_time - observation_window
+    if args.rolling_report:
+        # The rolling report computes the EWM volatility once over the whole history
+        start_time = None
 
-    for symbol in symbols:
+    # Granularities made of whole pyramid bins are read resampled from the cached OHLCV pyramid
+    use_pyramid = not args.no_cache and choose_pyramid_level(timestamp_granularity) is not None
+    read_options = {'timestamp_granularity': timestamp_granularity} if use_pyramid else {}
+    available_symbols = [symbol for symbol, timestamp in latest_timestamps.items() if timestamp is not None]
+    # Load the close prices of the observation period of every asset exactly once, in parallel
+    with profiler.stage('load', assets=len(available_symbols), source='pyramid' if use_pyramid else 'raw'):
+        loaded_data = read_many_historical_data(
+            available_symbols, data_folder, workers=args.workers, executor=args.executor,
+            start=start_time, end=end_time, use_cache=not args.no_cache, cache_dir=args.cache_dir,
+            columns=['close'], **read_options
+        )
+    for symbol, data in loaded_data.items():
         try:
-            data = read_historical_data(symbol, data_folder)
-            if data is None or data.empty:
-                print(f"No data for {symbol}.")
+            if data is None:
                 continue
-            # Filter data within the observation period
-            data = data[(data.index >= start_time) & (data.index <= end_time)]
             if data.empty:
                 print(f"No data for {symbol} within the observation window.")
                 continue
-            # Resample data to the desired timestamp granularity
-            data = data.resample(timestamp_granularity).last()
+            if not use_pyramid:
+                # Resample data to the desired timestamp granularity
+                with profiler.stage('resample', symbol):
+                    data = data.resample(timestamp_granularity).last()
             # Compute returns
-            data = calculate_returns(data)
-            returns = data['returns']
-            # Compute exponentially weighted volatility
-            ewm_volatility = calculate_exponentially_weighted_volatility(returns, span)
-            # Compute average exponentially weighted volatility
-            avg_ewm_volatility = ewm_volatility.mean()
-            individual_volatilities[symbol] = avg_ewm_volatility
-            # Keep returns for portfolio calculation
-            all_returns.append(returns)
+            with profiler.stage('returns', symbol):
+                data = calculate_returns(data)
+            # Keep returns for the batched volatility computation
+            all_returns[symbol] = data['returns']
         except Exception as e:
             print(f"Error processing data for {symbol}: {e}")
             continue
 
     if not all_returns:
         print("No returns data available.")
-        exit()
+        return None
+
+    if args.gap_report:
+        with profiler.stage('gap_report'):
+            write_gap_report(all_returns, args.gap_report)
+
+    with profiler.stage('align'):
+        return align_returns(all_returns)
+
+def calculate_average_volatilities(symbols, spans, observation_window, args, profiler=NULL_PROFILER):
+    # Arguments of print_average_volatilities, or None after printing why they are missing
+    aligned = load_aligned_returns(symbols, observation_window, args, profiler)
+    if aligned is None:
+        return None
+    returns_df, within_range = aligned
+    returns_df, asset_volatilities, portfolio_volatilities = compute_average_volatilities(returns_df, within_range, spans, profiler)
+    # Ensure timestamps match
+    if returns_df.empty:
+        print("No overlapping timestamps across assets.")
+        return None
+    return list(returns_df.columns), spans, asset_volatilities, portfolio_volatilities
 
-    # Combine returns into a DataFrame
-    returns_df = pd.concat(all_returns, axis=1)
-    returns_df.columns = [symbol for symbol in individual_volatilities.keys()]
-    returns_df.dropna(inplace=True)
+def calculate_average_volatilities_cached(symbols, spans, observation_window, args, profiler=NULL_PROFILER):
+    # calculate_average_volatilities with what it printed, as the value stored in the result
+    # cache. Failures are not cached, so their messages are printed right away.
+    output = io.StringIO()
+    with redirect_stdout(output):
+        result = calculate_average_volatilities(symbols, spans, observation_window, args, profiler)
+    if result is None:
+        print(output.getvalue(), end='')
+        return None
+    return result, output.getvalue()
+
+def run_returns_analyses(symbols, spans, observation_window, args, profiler=NULL_PROFILER):
+    # The rolling report or the weighted portfolios, which need the returns themselves
+    aligned = load_aligned_returns(symbols, observation_window, args, profiler)
+    if aligned is None:
+        exit()
+    returns_df, within_range = aligned
+    if args.rolling_report:
+        with profiler.stage('rolling_report'):
+            write_rolling_report(returns_df, within_range, spans, observation_window, args.report_frequency, args.rolling_report)
+        return
+    returns_df, asset_volatilities, portfolio_volatilities = compute_average_volatilities(returns_df, within_range, spans, profiler)
 
     # Ensure timestamps match
     if returns_df.empty:
         print("No overlapping timestamps across assets.")
         exit()
 
+    print_average_volatilities(list(returns_df.columns), spans, asset_volatilities, portfolio_volatilities)
+
+    if args.bootstrap:
+        with profiler.stage('bootstrap', resamples=args.bootstrap):
+            print_bootstrap_intervals(returns_df, spans, args)
+
+    if args.weights_file or args.weights_grid or args.min_variance:
+        with profiler.stage('weighted_portfolios'):
+            evaluate_weighted_portfolios(returns_df, spans, args)
+
+def align_returns(all_returns):
+    # Combine returns ({symbol: Series}) into one (time x assets) matrix on the union of timestamps
+    returns_df = align_series(all_returns, how='outer')
+    # Rows outside an asset's own resampled range are not part of its average
+    within_range = np.column_stack([
+        (returns_df.index >= returns.index[0]) & (returns_df.index <= returns.index[-1])
+        for returns in all_returns.values()
+    ])
+    return returns_df, within_range
+
+def compute_average_volatilities(returns_df, within_range, spans, profiler=NULL_PROFILER):
+    # Average exponentially weighted volatility of every asset and of the equal-weight portfolio
+    # for every span. Also returns the rows where every asset has a return, which may be empty.
+    with profiler.stage('ewm_assets', spans=len(spans)):
+        asset_volatilities = average_ewm_volatility(returns_df.to_numpy(), spans, valid=within_range)
+    with profiler.stage('dropna'):
+        returns_df = returns_df.dropna()
+    if returns_df.empty:
+        return returns_df, asset_volatilities, None
     # Compute portfolio returns (equal weighting)
-    portfolio_returns = returns_df.mean(axis=1)
-    # Compute exponentially weighted volatility of portfolio returns
-    portfolio_ewm_volatility = calculate_exponentially_weighted_volatility(portfolio_returns, span)
-    # Compute average exponentially weighted volatility of the portfolio
-    portfolio_avg_volatility = portfolio_ewm_volatility.mean()
-    # Add portfolio volatility to the dictionary
-    individual_volatilities['Portfolio'] = portfolio_avg_volatility
-    # Sort volatilities from lowest to highest
-    sorted_volatilities = sorted(individual_volatilities.items(), key=lambda x: x[1])
-    # Display the sorted volatilities in percentage
-    for asset, vol in sorted_volatilities:
-        vol_percentage = vol * 100  # Convert to percentage
-        if asset == 'Portfolio':
-            print(Fore.GREEN + f'Average Exponentially Weighted Volatility of {asset}: {vol_percentage:.4f}%')
-        else:
-            print(f'Average Exponentially Weighted Volatility of {asset}: {vol_percentage:.4f}%')
+    with profiler.stage('portfolio_returns'):
+        portfolio_returns = returns_df.mean(axis=1)
+    # Compute average exponentially weighted volatility of portfolio returns
+    with profiler.stage('ewm_portfolio', spans=len(spans)):
+        portfolio_volatilities = average_ewm_volatility(portfolio_returns.to_numpy(), spans)[:, 0]
+    return returns_df, asset_volatilities, portfolio_volatilities
+
+def print_average_volatilities(symbols, spans, asset_volatilities, portfolio_volatilities):
+    for span_position, span in enumerate(spans):
+        individual_volatilities = dict(zip(symbols, asset_volatilities[span_position]))
+        # Add portfolio volatility to the dictionary
+        individual_volatilities['Portfolio'] = portfolio_volatilities[span_position]
+        # Sort volatilities from lowest to highest
+        sorted_volatilities = sorted(individual_volatilities.items(), key=lambda x: x[1])
+        if len(spans) > 1:
+            print(Fore.CYAN + f"\nSpan {span}:")
+        # Display the sorted volatilities in percentage
+        for asset, vol in sorted_volatilities:
+            vol_percentage = vol * 100  # Convert to percentage
+            if asset == 'Portfolio':
+                print(Fore.GREEN + f'Average Exponentially Weighted Volatility of {asset}: {vol_percentage:.4f}%')
+            else:
+                print(f'Average Exponentially Weighted Volatility of {asset}: {vol_percentage:.4f}%')
+
+def print_bootstrap_intervals(returns_df, spans, args):
+    # Block-bootstrap confidence intervals of the average volatility of every asset and of the
+    # equal-weight portfolio, resampled from the rows where every asset has a return
+    bootstrap_df = returns_df.assign(Portfolio=returns_df.mean(axis=1))
+    try:
+        averages, block_length = bootstrap_average_volatilities(
+            bootstrap_df, spans, args.bootstrap, block_length=args.bootstrap_block,
+            seed=args.bootstrap_seed, workers=args.bootstrap_workers
+        )
+    except ValueError as e:
+        print(Fore.RED + f"Could not bootstrap: {e}")
+        return
+    lower, upper = get_confidence_intervals(averages, args.confidence)
+    print(Fore.CYAN + f"\n{args.confidence:.0%} confidence intervals from {args.bootstrap} block-bootstrap resamples (blocks of {block_length} rows):")
+    for span_position, span in enumerate(spans):
+        if len(spans) > 1:
+            print(Fore.CYAN + f"\nSpan {span}:")
+        # Same order as the averages, from the lowest to the highest interval
+        for column_position in np.argsort(lower[span_position] + upper[span_position]):
+            asset = bootstrap_df.columns[column_position]
+            interval = f"{lower[span_position, column_position] * 100:.4f}% to {upper[span_position, column_position] * 100:.4f}%"
+            if asset == 'Portfolio':
+                print(Fore.GREEN + f"{asset}: {interval}")
+            else:
+                print(f"{asset}: {interval}")
+
+def iter_chunked_returns(symbol, data_folder, start_time, end_time, args, trackers):
+    # Log returns of one asset chunk by chunk; the last close of a chunk is carried over so
+    # the first return of the next chunk is computed exactly as on the whole series
+    previous_close = None
+    for data in iter_historical_data(
+        symbol, data_folder, chunksize=args.chunksize, start=start_time, end=end_time,
+        timestamp_granularity=args.timestamp_granularity
+    ):
+        close = data['close']
+        previous = close.shift(1)
+        if previous_close is not None:
+            previous.iloc[0] = previous_close
+        previous_close = close.iloc[-1]
+        returns = np.log(close / previous)
+        for tracker in trackers:
+            tracker.update(returns.to_numpy())
+        yield returns
+
+def run_chunked_volatility(symbols, spans, observation_window, args):
+    # Same averages as the in-memory path while holding only about one chunk per asset
+    latest_timestamp = None
+    available_symbols = []
+    for symbol in dict.fromkeys(symbols):
+        try:
+            _, symbol_latest_timestamp = read_time_bounds(symbol, args.data_folder)
+        except Exception as e:
+            print(f"Error reading data for {symbol}: {e}")
+            continue
+        if symbol_latest_timestamp is None:
+            print(f"No data for {symbol}.")
+            continue
+        available_symbols.append(symbol)
+        if latest_timestamp is None or symbol_latest_timestamp < latest_timestamp:
+            latest_timestamp = symbol_latest_timestamp
+
+    if latest_timestamp is None:
+        print("No data available.")
+        exit()
+
+    end_time = latest_timestamp
+    start_time = end_time - observation_window
+    asset_trackers = {symbol: [ChunkedEWMVolatility(span) for span in spans] for symbol in available_symbols}
+    portfolio_trackers = [ChunkedEWMVolatility(span) for span in spans]
+    streams = {
+        symbol: iter_chunked_returns(symbol, args.data_folder, start_time, end_time, args, asset_trackers[symbol])
+        for symbol in available_symbols
+    }
+    try:
+        # Portfolio returns (equal weighting) on the timestamps where every asset has a return
+        for returns_df in iter_aligned_chunks(streams, how='inner'):
+            if returns_df.empty:
+                continue
+            portfolio_returns = returns_df.mean(axis=1).to_numpy()
+            for tracker in portfolio_trackers:
+                tracker.update(portfolio_returns)
+    except Exception as e:
+        print(f"Error processing data: {e}")
+        exit()
+
+    if portfolio_trackers[0].count == 0:
+        print("No overlapping timestamps across assets.")
+        exit()
+
+    asset_volatilities = np.array([
+        [asset_trackers[symbol][span_position].average() for symbol in available_symbols]
+        for span_position in range(len(spans))
+    ])
+    portfolio_volatilities = [tracker.average() for tracker in portfolio_trackers]
+    print_average_volatilities(available_symbols, spans, asset_volatilities, portfolio_volatilities)
+
+def evaluate_weighted_portfolios(returns_df, spans, args):
+    symbols = list(returns_df.columns)
+    names = []
+    weights = np.empty((0, len(symbols)))
+    if args.weights_file:
+        file_names, file_weights = read_weights_csv(args.weights_file, symbols)
+        names += file_names
+        weights = np.vstack([weights, file_weights])
+    if args.weights_grid:
+        try:
+            grid_weights = simplex_grid(len(symbols), args.weights_grid)
+        except ValueError as e:
+            print(Fore.RED + f"Could not build the weights grid: {e}")
+            return
+        names += [f"grid_{position}" for position in range(len(grid_weights))]
+        weights = np.vstack([weights, grid_weights])
+
+    results = []
+    returns = returns_df.to_numpy()
+    for span in spans:
+        if len(weights):
+            volatilities = average_portfolio_volatility(returns, span, weights)
+            for name, weight_vector, vol in zip(names, weights, volatilities):
+                results.append(dict({'Portfolio': name, 'Span': span, 'Average Volatility': vol}, **dict(zip(symbols, weight_vector))))
+        if args.min_variance:
+            best_weights, best_volatility = search_min_variance_weights(
+                lambda candidates: average_portfolio_volatility(returns, span, candidates),
+                average_ewm_covariance(returns, span)
+            )
+            results.append(dict({'Portfolio': 'min_variance', 'Span': span, 'Average Volatility': best_volatility}, **dict(zip(symbols, best_weights))))
+            print(Fore.CYAN + f"\nMinimum-Variance Weights (span {span}): {best_volatility * 100:.4f}%")
+            for symbol, weight in zip(symbols, best_weights):
+                print(f"{symbol}: {weight * 100:.2f}%")
+
+    results_df = pd.DataFrame(results).sort_values(by=['Span', 'Average Volatility'])
+    if len(weights):
+        for span in spans:
+            span_results = results_df[results_df['Span'] == span]
+            print(Fore.CYAN + f"\nLowest Average Volatility Portfolios (span {span}):")
+            print(span_results.head(10).to_string(index=False))
+    if args.weights_output:
+        results_df.to_csv(args.weights_output, index=False)
+        print(Fore.GREEN + f"Evaluated portfolios written to {args.weights_output}")
+
+def write_rolling_report(returns_df, within_range, spans, observation_window, report_frequency, output_path):
+    # Compute the EWM volatility series of every asset and of the portfolio once
+    asset_volatility = ewm_volatility_matrix(returns_df.to_numpy(), spans)
+    asset_volatility[:, ~within_range] = np.nan
+    aligned_returns = returns_df.dropna()
+    if aligned_returns.empty:
+        print("No overlapping timestamps across assets.")
+        exit()
+    portfolio_volatility = ewm_volatility_matrix(aligned_returns.mean(axis=1).to_numpy(), spans)
+
+    # One snapshot per report period once a full observation window is available, plus the latest timestamp
+    first_time = aligned_returns.index[0] + observation_window
+    last_time = aligned_returns.index[-1]
+    if first_time > last_time:
+        print("Not enough history for a full observation window.")
+        exit()
+    report_times = pd.date_range(start=first_time.ceil(report_frequency), end=last_time, freq=report_frequency)
+    report_times = report_times.union(pd.DatetimeIndex([last_time]))
+    report_values = report_times.values.astype(returns_df.index.values.dtype)
+
+    report = {}
+    for span_position, span in enumerate(spans):
+        suffix = f" (span {span})" if len(spans) > 1 else ""
+        asset_averages = calculate_trailing_averages(
+            asset_volatility[span_position], returns_df.index.values, observation_window, report_values
+        )
+        for asset_position, asset in enumerate(returns_df.columns):
+            report[f"{asset}{suffix}"] = asset_averages[:, asset_position]
+        report[f"Portfolio{suffix}"] = calculate_trailing_averages(
+            portfolio_volatility[span_position], aligned_returns.index.values, observation_window, report_values
+        )[:, 0]
+    report_df = pd.DataFrame(report, index=pd.Index(report_times, name='timestamp'))
+    report_df.to_csv(output_path)
+    print(Fore.GREEN + f"Rolling volatility report with {len(report_df)} snapshots written to {output_path}")
 
 if __name__ == "__main__":
     main()